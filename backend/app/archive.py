@@ -0,0 +1,220 @@
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+
+from app.models import PredictionLog
+
+log = logging.getLogger("uvicorn.error")
+
+# холодный слой prediction_logs: Parquet (zstd), <root>/analysis_type=<a>/day=<YYYY-MM-DD>/part-<id от>-<id до>.parquet.
+# analysis_type и day — только в пути (hive-разбиение), в файле их нет
+_COLUMNS = ("id", "created_at", "user_id", "model_name", "risk", "risk_category", "schema_version", "features",
+            "rec_code", "model_version", "request_json", "response_json", "request_hash")
+_JSON_COLUMNS = ("request_json", "response_json")
+
+def _pa():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("для архива prediction_logs нужен pyarrow: pip install pyarrow")
+    return pa, ds, pq
+
+def _schema(pa):
+    return pa.schema([
+        ("id", pa.int64()), ("created_at", pa.timestamp("us")), ("user_id", pa.string()),
+        ("model_name", pa.string()), ("risk", pa.float64()), ("risk_category", pa.string()),
+        ("schema_version", pa.int16()), ("features", pa.list_(pa.float64())), ("rec_code", pa.int16()),
+        ("model_version", pa.string()), ("request_json", pa.string()), ("response_json", pa.string()),
+        ("request_hash", pa.string()),
+    ])
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _partition(root: Path, analysis: str, day: str) -> Path:
+    return root / f"analysis_type={analysis}" / f"day={day}"
+
+# строки одного (анализ, день) — в один файл; запись во временный и rename, чтобы читатель не увидел половину
+def write_partition(root: Path, analysis: str, day: str, rows: List[Dict[str, Any]], compression: str = "zstd") -> Path:
+    pa, _, pq = _pa()
+    cols = {c: [r.get(c) for r in rows] for c in _COLUMNS}
+    for c in _JSON_COLUMNS:
+        cols[c] = [json.dumps(v, ensure_ascii=False) if v is not None else None for v in cols[c]]
+    table = pa.table(cols, schema=_schema(pa))
+    part = _partition(root, analysis, day)
+    part.mkdir(parents=True, exist_ok=True)
+    # имя по диапазону id: повтор после сбоя между записью и удалением перезапишет тот же файл
+    path = part / f"part-{rows[0]['id']:012d}-{rows[-1]['id']:012d}.parquet"
+    tmp = path.with_suffix(".tmp")
+    pq.write_table(table, tmp, compression=compression)
+    os.replace(tmp, path)
+    return path
+
+# фоновый перенос строк старше retention в Parquet: пачка по id -> файлы по (анализ, день) -> удаление из БД.
+# risk_rollups не трогаем — /stats по архивным дням продолжает работать
+class Archiver:
+    def __init__(self, engine, root: str, retention_days: float, interval: float, batch_size: int = 50_000,
+                 compression: str = "zstd"):
+        self.engine = engine
+        self.root = Path(root)
+        self.retention = timedelta(days=retention_days)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.compression = compression
+        self._task: Optional[asyncio.Task] = None
+        self.runs = self.archived = self.files = self.failures = 0
+
+    async def start(self) -> None:
+        _pa()  # без pyarrow падаем при старте, а не через interval секунд
+        self._task = asyncio.create_task(self._run(), name="log-archiver")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                while await self.archive_once() >= self.batch_size:
+                    pass
+            except Exception as e:
+                self.failures += 1
+                log.warning("prediction log archival failed: %s", e)
+
+    # возвращает число перенесённых строк
+    async def archive_once(self) -> int:
+        cutoff = _utcnow() - self.retention
+        t = PredictionLog.__table__
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(
+                select(t.c.analysis_type, *(t.c[c] for c in _COLUMNS))
+                .where(t.c.created_at < cutoff).order_by(t.c.id).limit(self.batch_size)
+            )).mappings().all()
+        if not rows:
+            return 0
+        groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = defaultdict(list)
+        for r in rows:
+            groups[(r["analysis_type"], r["created_at"].date().isoformat())].append(dict(r))
+        # Parquet пишется в потоке, чтобы не держать event loop
+        paths = await asyncio.to_thread(
+            lambda: [write_partition(self.root, a, d, g, self.compression) for (a, d), g in groups.items()])
+        async with self.engine.begin() as conn:
+            await conn.execute(delete(t).where(t.c.id.in_([r["id"] for r in rows])))
+        self.runs += 1
+        self.archived += len(rows)
+        self.files += len(paths)
+        return len(rows)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"root": str(self.root), "retention_days": self.retention.days, "runs": self.runs,
+                "archived": self.archived, "files": self.files, "failures": self.failures}
+
+# дни архива от новых к старым (с учётом фильтра по анализу): [(день, [файлы всех анализов за день])]
+def _days(root: Path, analysis_type: Optional[str]) -> List[Tuple[str, List[Path]]]:
+    days: Dict[str, List[Path]] = defaultdict(list)
+    pattern = f"analysis_type={analysis_type}" if analysis_type else "analysis_type=*"
+    for part in root.glob(f"{pattern}/day=*"):
+        days[part.name[len("day="):]].extend(sorted(part.glob("*.parquet")))
+    return sorted(days.items(), reverse=True)
+
+def _filter(ds, pa, user_id, model_name, risk_category, since, until, before):
+    conds = []
+    ts = lambda v: pa.scalar(v, pa.timestamp("us"))
+    if user_id is not None:
+        conds.append(ds.field("user_id") == user_id)
+    if model_name:
+        conds.append(ds.field("model_name") == model_name)
+    if risk_category:
+        conds.append(ds.field("risk_category") == risk_category)
+    if since is not None:
+        conds.append(ds.field("created_at") >= ts(since))
+    if until is not None:
+        conds.append(ds.field("created_at") < ts(until))
+    if before is not None:
+        c_at, c_id = before
+        conds.append((ds.field("created_at") < ts(c_at)) |
+                     ((ds.field("created_at") == ts(c_at)) & (ds.field("id") < c_id)))
+    expr = None
+    for c in conds:
+        expr = c if expr is None else expr & c
+    return expr
+
+def _read_day(root: Path, files: List[Path], expr, columns: Optional[List[str]]):
+    pa, ds, _ = _pa()
+    part = ds.partitioning(pa.schema([("analysis_type", pa.string()), ("day", pa.string())]), flavor="hive")
+    dataset = ds.dataset([str(f) for f in files], format="parquet", partitioning=part, partition_base_dir=str(root))
+    return dataset.to_table(filter=expr, columns=columns)
+
+def _rows(table) -> List[Dict[str, Any]]:
+    rows = table.to_pylist()
+    for r in rows:
+        for c in _JSON_COLUMNS:
+            if r.get(c) is not None:
+                r[c] = json.loads(r[c])
+    return rows
+
+# страница истории из архива с теми же фильтрами и keyset-курсором, что у /logs: (created_at, id) по убыванию.
+# Дни читаются от новых к старым, пока не набрался limit, но не больше max_days (0 — без предела); columns — проекция.
+# Возвращает строки и точку продолжения, если остановились по max_days: курсор на начало последнего прочитанного дня
+def read_page(root: str, limit: int, *, user_id: Optional[str] = None, analysis_type: Optional[str] = None,
+              model_name: Optional[str] = None, risk_category: Optional[str] = None,
+              since: Optional[datetime] = None, until: Optional[datetime] = None,
+              before: Optional[Tuple[datetime, int]] = None, columns: Optional[List[str]] = None,
+              max_days: int = 0) -> Tuple[List[Dict[str, Any]], Optional[Tuple[datetime, int]]]:
+    root_p = Path(root)
+    if limit <= 0 or not root_p.exists():
+        return [], None
+    pa, ds, _ = _pa()
+    expr = _filter(ds, pa, user_id, model_name, risk_category, since, until, before)
+    lo = since.date().isoformat() if since is not None else None
+    # обе верхние границы строгие: курсор на полночь не открывает сам этот день
+    bounds = [d for d in (until, before[0] if before else None) if d is not None]
+    hi = (min(bounds) - timedelta(microseconds=1)).date().isoformat() if bounds else None
+    out: List[Dict[str, Any]] = []
+    scanned = 0
+    resume: Optional[Tuple[datetime, int]] = None
+    for day, files in _days(root_p, analysis_type):
+        if (hi is not None and day > hi) or not files:
+            continue
+        if lo is not None and day < lo:
+            break
+        if max_days and scanned >= max_days:
+            return out, resume
+        scanned += 1
+        t = _read_day(root_p, files, expr, columns)
+        if t.num_rows:
+            t = t.sort_by([("created_at", "descending"), ("id", "descending")]).slice(0, limit - len(out))
+            out.extend(_rows(t))
+        if len(out) >= limit:
+            break
+        resume = (datetime.fromisoformat(day), 0)
+    return out, None
+
+# все архивные строки по дням (для аналитики и пересчёта risk_rollups): пачки словарей, от старых дней к новым
+def iter_rows(root: str, columns: Optional[List[str]] = None, analysis_type: Optional[str] = None,
+              since: Optional[datetime] = None, until: Optional[datetime] = None) -> Iterator[List[Dict[str, Any]]]:
+    root_p = Path(root)
+    if not root_p.exists():
+        return
+    pa, ds, _ = _pa()
+    expr = _filter(ds, pa, None, None, None, since, until, None)
+    for day, files in reversed(_days(root_p, analysis_type)):
+        if files:
+            yield _rows(_read_day(root_p, files, expr, columns))
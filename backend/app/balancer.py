@@ -0,0 +1,170 @@
+from __future__ import annotations
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.ml_client import MLClient
+
+log = logging.getLogger("uvicorn.error")
+
+POLICIES = ("p2c", "least")
+
+# одна реплика ml_service: незавершённые запросы, EWMA задержки, состояние активной проверки /health
+class Replica:
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.outstanding = 0
+        self.ewma_ms = 0.0
+        self.healthy = True
+        self.fails = self.oks = 0          # подряд, по проверкам /health
+        self.requests = self.errors = self.ejections = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"url": self.base_url, "healthy": self.healthy, "outstanding": self.outstanding,
+                "ewma_ms": round(self.ewma_ms, 3), "requests": self.requests, "errors": self.errors,
+                "ejections": self.ejections}
+
+# балансировка по репликам ml_service поверх общего MLClient (пул, ретраи, предохранитель на хост):
+# p2c — из двух случайных реплик та, у которой меньше незавершённых запросов; least — минимум по всем.
+# Реплика выводится из ротации после eject_after неудачных проверок /health подряд (или пока открыт
+# её предохранитель) и возвращается после readmit_after удачных. Если выведены все — пробуем все.
+# hedge_after > 0: запрос, не ответивший за это время, дублируется на другую реплику; берём первый ответ.
+class Balancer:
+    def __init__(self, client: MLClient, replicas: Dict[str, List[str]], path: str, policy: str = "p2c",
+                 health_interval: float = 2.0, health_timeout: float = 1.0, eject_after: int = 3,
+                 readmit_after: int = 2, hedge_after: float = 0.0):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown balancing policy '{policy}', expected one of {POLICIES}")
+        self.client = client
+        # один адрес на несколько анализов — одна реплика: общий счёт запросов и общая проверка /health
+        self._by_url: Dict[str, Replica] = {}
+        self.replicas = {a: [self._replica(u) for u in urls] for a, urls in replicas.items()}
+        self.path = path
+        self.policy = policy
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.eject_after = eject_after
+        self.readmit_after = readmit_after
+        self.hedge_after = hedge_after
+        self._task: Optional[asyncio.Task] = None
+        self.hedged = self.hedge_wins = 0
+
+    def _replica(self, url: str) -> Replica:
+        r = self._by_url.get(url.rstrip("/"))
+        if r is None:
+            r = self._by_url[url.rstrip("/")] = Replica(url)
+        return r
+
+    def nodes(self) -> List[Replica]:
+        return list(self._by_url.values())
+
+    def supports(self, analysis: str) -> bool:
+        return analysis in self.replicas
+
+    async def start(self) -> None:
+        if self.health_interval > 0:
+            self._task = asyncio.create_task(self._health_loop(), name="ml-health-checks")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _available(self, r: Replica) -> bool:
+        return r.healthy and self.client.breaker(r.base_url).available()
+
+    def pick(self, analysis: str, exclude: Optional[Replica] = None) -> Optional[Replica]:
+        pool = [r for r in self.replicas[analysis] if r is not exclude]
+        live = [r for r in pool if self._available(r)] or pool
+        if not live:
+            return None
+        if len(live) == 1:
+            return live[0]
+        if self.policy == "least":
+            return min(live, key=lambda r: (r.outstanding, r.ewma_ms))
+        a, b = random.sample(live, 2)
+        return a if (a.outstanding, a.ewma_ms) <= (b.outstanding, b.ewma_ms) else b
+
+    async def _call(self, r: Replica, payload: Dict[str, Any], headers: Optional[Dict[str, str]],
+                    deadline: Optional[float]) -> Dict[str, Any]:
+        r.outstanding += 1
+        r.requests += 1
+        t = time.perf_counter()
+        try:
+            resp = await self.client.post_json(f"{r.base_url}{self.path}", payload, headers, deadline)
+        except Exception:
+            r.errors += 1
+            raise
+        finally:
+            r.outstanding -= 1
+        ms = (time.perf_counter() - t) * 1000.0
+        r.ewma_ms = ms if r.ewma_ms == 0.0 else 0.8 * r.ewma_ms + 0.2 * ms
+        return resp
+
+    async def post_json(self, analysis: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+                        deadline: Optional[float] = None) -> Dict[str, Any]:
+        first = self.pick(analysis)
+        if self.hedge_after <= 0 or len(self.replicas[analysis]) < 2:
+            return await self._call(first, payload, headers, deadline)
+        t1 = asyncio.ensure_future(self._call(first, payload, headers, deadline))
+        pending = {t1}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.hedge_after)
+            if done:
+                return t1.result()
+            second = self.pick(analysis, exclude=first)
+            if second is None:
+                return await t1
+            self.hedged += 1
+            t2 = asyncio.ensure_future(self._call(second, payload, headers, deadline))
+            pending = {t1, t2}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        if t is t2:
+                            self.hedge_wins += 1
+                        return t.result()
+                    error = t.exception()
+            raise error
+        finally:
+            for t in pending:
+                t.cancel()
+
+    async def _check(self, r: Replica) -> None:
+        try:
+            ok = (await self.client.client.get(f"{r.base_url}/health", timeout=self.health_timeout)).status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            r.fails, r.oks = 0, r.oks + 1
+            if not r.healthy and r.oks >= self.readmit_after:
+                r.healthy = True
+                log.info("ML replica %s is back in rotation", r.base_url)
+        else:
+            r.fails, r.oks = r.fails + 1, 0
+            if r.healthy and r.fails >= self.eject_after:
+                r.healthy = False
+                r.ejections += 1
+                log.warning("ML replica %s ejected after %d failed health checks", r.base_url, r.fails)
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.gather(*(self._check(r) for r in self.nodes()))
+            await asyncio.sleep(self.health_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"policy": self.policy, "hedge_after_ms": round(self.hedge_after * 1000.0, 3),
+                "hedged": self.hedged, "hedge_wins": self.hedge_wins,
+                "replicas": [r.snapshot() for r in self.nodes()],
+                "routes": {a: [r.base_url for r in rs] for a, rs in self.replicas.items()}}
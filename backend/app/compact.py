@@ -0,0 +1,87 @@
+from __future__ import annotations
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from app.log_writer import compact_request, compact_response
+
+FORMATS = ("compact", "json")
+
+# порядок признаков журнала по (analysis_type, версия схемы) — как FEATURES в ml_service/app/model_loader.py.
+# Схему не меняем на месте: новый порядок или набор — новая версия (старые строки читаются по своей), CURRENT — что пишем
+SCHEMAS: Dict[Tuple[str, int], Tuple[str, ...]] = {
+    ("heart", 1): ("age", "height", "weight", "ap_hi", "ap_lo", "cholesterol", "gluc", "smoke", "alco", "active"),
+    ("heart", 2): ("age", "height", "weight", "ap_hi", "ap_lo", "cholesterol", "gluc", "smoke", "alco", "active",
+                   "gender"),
+    ("diabetes", 1): ("Age", "Gender", "BMI", "Chol", "TG", "HDL", "LDL", "Cr", "BUN"),
+}
+CURRENT = {"heart": 2, "diabetes": 1}
+
+# рекомендации ml_service (RECOMMENDATIONS в ml_service/main.py): в журнале — код, текст восстанавливается при чтении.
+# Незнакомый текст (ML поменял формулировку) пишется как есть в response_json
+REC_TEXT = {
+    1: "Низкий риск. Поддерживайте ЗОЖ.",
+    2: "Умеренный риск. Рекомендуется контроль.",
+    3: "Высокий риск! Желательна очная консультация.",
+}
+_REC_CODE = {text: code for code, text in REC_TEXT.items()}
+
+# колонки тела строки журнала; у каждой строки пачки набор ключей один (executemany)
+BODY_COLUMNS = ("schema_version", "features", "rec_code", "model_version", "request_json", "response_json")
+
+def empty() -> Dict[str, Any]:
+    return dict.fromkeys(BODY_COLUMNS)
+
+# тело строки журнала: compact — массив признаков по схеме + код рекомендации, прочее (лишние или
+# нечисловые признаки, незнакомый текст) — в request_json/response_json; json — прежний формат целиком
+def encode(fmt: str, analysis: str, features: Mapping[str, Any], model: Optional[str],
+           ml_resp: Mapping[str, Any]) -> Dict[str, Any]:
+    out = empty()
+    version = CURRENT.get(analysis)
+    if fmt == "json" or version is None:
+        out["request_json"] = compact_request({"features": dict(features), "model": model})
+        out["response_json"] = compact_response(dict(ml_resp))
+        return out
+
+    names = SCHEMAS[(analysis, version)]
+    values = []
+    extra: Dict[str, Any] = {}
+    for name in names:
+        v = features.get(name)
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            values.append(float(v))
+        else:
+            values.append(None)
+            if v is not None:
+                extra[name] = v
+    extra.update((k, v) for k, v in features.items() if k not in names)
+    req: Dict[str, Any] = {}
+    if extra:
+        req["features"] = extra
+    # запрошенная модель хранится, только если ML ответил другой (иначе это model_name)
+    if model is not None and model != ml_resp.get("model"):
+        req["model"] = model
+
+    resp = {k: v for k, v in compact_response(dict(ml_resp)).items() if k not in ("model_version", "recommendation")}
+    text = ml_resp.get("recommendation")
+    code = _REC_CODE.get(text)
+    if code is None and text is not None:
+        resp["recommendation"] = text
+
+    out.update(schema_version=version, features=values, rec_code=code, model_version=ml_resp.get("model_version"),
+               request_json=req or None, response_json=resp or None)
+    return out
+
+# обратно к прежнему виду {features, model} / {model_version, recommendation, ...} — для любого формата строки
+def decode(row: Mapping[str, Any], analysis: str) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    version = row.get("schema_version")
+    if version is None:
+        return row.get("request_json"), row.get("response_json")
+    req = dict(row.get("request_json") or {})
+    feats = {n: v for n, v in zip(SCHEMAS[(analysis, version)], row.get("features") or ()) if v is not None}
+    feats.update(req.get("features") or {})
+    req["features"] = feats
+    resp = dict(row.get("response_json") or {})
+    if row.get("model_version") is not None:
+        resp.setdefault("model_version", row["model_version"])
+    if row.get("rec_code") in REC_TEXT:
+        resp.setdefault("recommendation", REC_TEXT[row["rec_code"]])
+    return req, resp
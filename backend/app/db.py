@@ -1,10 +1,13 @@
 from __future__ import annotations
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from config import settings
 
-connect_args = {"check_same_thread": False} if str(settings.DATABASE_URL).startswith("sqlite") else {}
+is_sqlite = str(settings.DATABASE_URL).startswith("sqlite")
+connect_args = {"check_same_thread": False} if is_sqlite else {}
 
+# синхронный движок остаётся для create_all и служебных задач
 engine = create_engine(
     settings.DATABASE_URL,
     future=True,
@@ -15,9 +18,54 @@ engine = create_engine(
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 Base = declarative_base()
 
+# async-движок для обработчиков: не блокирует event loop на запросах к БД
+# SQLite пишет одним писателем — одно соединение вместо драки за файловую блокировку
+pool_args = {"pool_size": 1, "max_overflow": 0} if is_sqlite else {
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+    "pool_timeout": settings.DB_POOL_TIMEOUT_SEC,
+}
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    echo=False,
+    **pool_args,
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+# SQLite: WAL — читатели не ждут писателя; busy_timeout — синхронный и async-движки (и фоновые задачи)
+# ждут блокировку файла, а не падают сразу с "database is locked"
+def _sqlite_pragmas(dbapi_conn, _record) -> None:
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute(f"PRAGMA busy_timeout={int(settings.DB_SQLITE_BUSY_TIMEOUT_MS)}")
+    cur.close()
+
+if is_sqlite:
+    event.listen(engine, "connect", _sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# create_all не добавляет колонки в существующие таблицы — догоняем схему сами (миграций в проекте нет)
+def ensure_schema() -> None:
+    Base.metadata.create_all(bind=engine)
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            have = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name not in have:
+                    ddl = col.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {col.name} {ddl}'))
+            for idx in table.indexes:
+                idx.create(bind=conn, checkfirst=True)
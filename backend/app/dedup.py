@@ -0,0 +1,68 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# канонический ключ запроса к ML: порядок признаков и пробелы не важны, user_id не входит
+def request_key(analysis: str, model: Optional[str], features: Dict[str, Any]) -> str:
+    raw = json.dumps({"a": analysis, "m": model, "f": features}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+# single-flight для вызовов ML: одинаковые запросы, пришедшие одновременно, ждут один вызов;
+# удачный ответ ещё window секунд отдаётся повторам (двойное нажатие, ретрай бота) из маленького LRU.
+# Всё в одном event loop — без блокировок.
+class SingleFlight:
+    def __init__(self, window: float, maxsize: int):
+        self.window = window
+        self.maxsize = maxsize
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._recent: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.leaders = self.joined = self.cached = 0
+
+    # -> (результат, None | "joined" | "cached"); None — этот вызов и ходил в ML
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, Optional[str]]:
+        hit = self._get(key)
+        if hit is not None:
+            self.cached += 1
+            return hit, "cached"
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.joined += 1
+            return await asyncio.shield(fut), "joined"
+        fut = self._inflight[key] = asyncio.ensure_future(fn())
+        fut.add_done_callback(lambda f: self._done(key, f))
+        self.leaders += 1
+        # shield: отмена ведущего запроса (клиент ушёл) не обрывает вызов для присоединившихся
+        return await asyncio.shield(fut), None
+
+    def _done(self, key: str, fut: asyncio.Future) -> None:
+        if self._inflight.get(key) is fut:
+            del self._inflight[key]
+        if fut.cancelled() or fut.exception() is not None:
+            return  # ошибки не кэшируем: следующий повтор пойдёт в ML заново
+        if self.window > 0 and self.maxsize > 0:
+            self._recent[key] = (time.monotonic() + self.window, fut.result())
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.maxsize:
+                self._recent.popitem(last=False)
+
+    def _get(self, key: str) -> Any:
+        item = self._recent.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires <= time.monotonic():
+            del self._recent[key]
+            return None
+        return value
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"window_sec": self.window, "in_flight": len(self._inflight), "recent": len(self._recent),
+                "leaders": self.leaders, "joined": self.joined, "cached": self.cached}
@@ -0,0 +1,191 @@
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from app.models import PredictionLog
+from app.rollups import write_deltas
+
+log = logging.getLogger("uvicorn.error")
+
+POLICIES = ("block", "drop", "spill")
+
+# ключи, которые уже лежат в колонках prediction_logs — в JSON их не дублируем
+_REQUEST_COLUMNS = ("analysis_type", "user_id")
+_RESPONSE_COLUMNS = ("analysis_type", "model", "risk", "risk_category")
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def compact_request(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in payload.items() if k not in _REQUEST_COLUMNS and v is not None}
+
+def compact_response(resp: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in resp.items() if k not in _RESPONSE_COLUMNS}
+
+# write-behind для журнала предсказаний: обработчик кладёт строку в очередь,
+# фоновая задача пишет пачками одним multi-row INSERT (по размеру или по времени);
+# в той же транзакции дописываются дельты risk_rollups для /stats
+class LogWriter:
+    def __init__(self, engine, max_queue: int, batch_size: int, flush_interval: float,
+                 policy: str = "block", spill_path: Optional[str] = None, drain_timeout: float = 10.0,
+                 metrics=None):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown overflow policy '{policy}', expected one of {POLICIES}")
+        if policy == "spill" and not spill_path:
+            raise ValueError("spill policy requires spill_path")
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.spill_path = Path(spill_path) if spill_path else None
+        self.drain_timeout = drain_timeout
+        self.metrics = metrics
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._flush_ms: deque = deque(maxlen=512)
+        self.written = self.batches = self.dropped = self.spilled = self.failed = self.replayed = 0
+
+    async def start(self) -> None:
+        await self.replay_spill()
+        self._task = asyncio.create_task(self._run(), name="prediction-log-writer")
+
+    async def submit(self, row: Dict[str, Any]) -> None:
+        await self.submit_many([row])
+
+    # элемент очереди — группа строк: группа целиком попадает в одну пачку, т.е. в одну транзакцию.
+    # block — ждём место в очереди; drop — считаем и выбрасываем; spill — дописываем в jsonl.
+    # created_at ставим здесь: строка и её rollup-корзина — по времени запроса, а не сброса пачки
+    async def submit_many(self, rows: List[Dict[str, Any]]) -> None:
+        now = _utcnow()
+        for r in rows:
+            r.setdefault("created_at", now)
+        if self.policy == "block":
+            await self.queue.put(rows)
+            return
+        try:
+            self.queue.put_nowait(rows)
+        except asyncio.QueueFull:
+            if self.policy == "drop":
+                self.dropped += len(rows)
+            else:
+                self._spill(rows)
+
+    async def _run(self) -> None:
+        while True:
+            groups: List[List[Dict[str, Any]]] = [await self.queue.get()]
+            n = len(groups[0])
+            deadline = time.monotonic() + self.flush_interval
+            while n < self.batch_size:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    groups.append(await asyncio.wait_for(self.queue.get(), left))
+                except asyncio.TimeoutError:
+                    break
+                n += len(groups[-1])
+            await self._flush(groups)
+
+    async def _flush(self, groups: List[List[Dict[str, Any]]]) -> None:
+        batch = [row for g in groups for row in g]
+        t = time.perf_counter()
+        try:
+            async with self.engine.begin() as conn:
+                await conn.execute(insert(PredictionLog.__table__), batch)
+                await write_deltas(conn, batch)
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            log.warning("prediction log flush failed (%d rows): %s", len(batch), e)
+            if self.spill_path is not None:
+                self._spill(batch)
+            else:
+                self.failed += len(batch)
+        finally:
+            dt = time.perf_counter() - t
+            self._flush_ms.append(dt * 1000.0)
+            if self.metrics is not None:
+                self.metrics.observe("db_flush_seconds", dt)
+            for _ in groups:
+                self.queue.task_done()
+
+    def _spill(self, rows: List[Dict[str, Any]]) -> None:
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            for r in rows:
+                f.write(json.dumps(r, ensure_ascii=False, default=str) + "\n")
+        self.spilled += len(rows)
+
+    # строки, не попавшие в БД в прошлый раз, дописываем при старте
+    async def replay_spill(self) -> None:
+        if self.spill_path is None or not self.spill_path.exists():
+            return
+        src = self.spill_path.with_suffix(self.spill_path.suffix + ".replay")
+        os.replace(self.spill_path, src)
+        with open(src, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        # строки из разных версий могут отличаться набором ключей — executemany нужен общий
+        keys = set().union(*rows, ("created_at",)) if rows else set()
+        rows = [{k: r.get(k) for k in keys} for r in rows]
+        # created_at в jsonl — строкой; у строк из файлов до его появления — время replay
+        now = _utcnow()
+        for r in rows:
+            r["created_at"] = datetime.fromisoformat(r["created_at"]) if r["created_at"] else now
+        try:
+            for s in range(0, len(rows), self.batch_size):
+                async with self.engine.begin() as conn:
+                    await conn.execute(insert(PredictionLog.__table__), rows[s:s + self.batch_size])
+                    await write_deltas(conn, rows[s:s + self.batch_size])
+                self.replayed += len(rows[s:s + self.batch_size])
+        except Exception as e:
+            log.warning("spill replay failed, keeping %s: %s", src, e)
+            return
+        src.unlink()
+        log.info("replayed %d spilled prediction logs", len(rows))
+
+    # дожидаемся записи всего, что уже в очереди, затем гасим задачу
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            log.warning("prediction log drain timed out, %d rows left", self.queue.qsize())
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        left: List[Dict[str, Any]] = []
+        while not self.queue.empty():
+            left.extend(self.queue.get_nowait())
+        if left:
+            if self.spill_path is not None:
+                self._spill(left)
+            else:
+                self.failed += len(left)
+
+    def stats(self) -> Dict[str, Any]:
+        ms = sorted(self._flush_ms)
+        pick = lambda q: round(ms[min(len(ms) - 1, int(q * len(ms)))], 3) if ms else None
+        return {
+            "policy": self.policy,
+            "queue_depth": self.queue.qsize(),
+            "queue_max": self.queue.maxsize,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "failed": self.failed,
+            "flush_ms": {"p50": pick(0.50), "p99": pick(0.99), "max": round(ms[-1], 3) if ms else None},
+        }
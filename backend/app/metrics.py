@@ -0,0 +1,159 @@
+# модуль общий для backend/app и ml_service/app: у сервисов свои образы и свой пакет app, поэтому копия.
+# Правим обе сразу — совпадение проверяет backend/tests/test_vendored.py
+from __future__ import annotations
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+# простая гистограмма с фиксированными границами (семантика le, как у Prometheus)
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    # под тем же локом, что и snapshot: иначе снимок ловит count, не сходящийся с корзинами (+Inf меньше le),
+    # а инкременты из тредпула теряются. Лок без конкуренции — доли микросекунды, на фоне стадии незаметно
+    def observe(self, v: float) -> None:
+        i = bisect_left(self.buckets, v)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += v
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts, total, s = list(self.counts), self.count, self.sum
+        acc, cum = 0, {}
+        for le, c in zip(self.buckets, counts):
+            acc += c; cum[str(le)] = acc
+        cum["+Inf"] = total
+        return {"count": total, "sum": s, "buckets": cum}
+
+# границы для длительностей стадий, секунды: от 25 мкс до 2.5 с
+STAGE_BUCKETS = (0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# время начала HTTP-запроса (ставит MetricsMiddleware, сдвигает на момент допуска AdmissionMiddleware):
+# обработчик считает от него стадию разбора/валидации
+REQUEST_T0: ContextVar[float] = ContextVar("request_t0", default=0.0)
+
+def _fmt_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+# гистограммы, счётчики и gauge с метками; отдаются в текстовом формате Prometheus
+class Metrics:
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._hist: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._help: Dict[str, str] = {}
+        self._stages: Dict[Tuple[str, str, str], Histogram] = {}
+        # внешние источники (кэш, пул, батчеры): fn() -> [(name, type, labels, value)]
+        self.collectors: List[Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]]] = []
+        # ContextVar со словарём стадий текущего запроса; ставит SlowLog, пока журнал медленных запросов включён
+        self.spans = None
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, text: str) -> None:
+        self._help[name] = text
+
+    def histogram(self, name: str, labels: Labels = (), buckets: Sequence[float] = STAGE_BUCKETS) -> Histogram:
+        key = (name, labels)
+        h = self._hist.get(key)
+        if h is None:
+            with self._lock:
+                h = self._hist.setdefault(key, Histogram(buckets))
+        return h
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        self.histogram(name, labels).observe(value)
+
+    # горячий путь для stage_seconds: плоский ключ вместо сборки кортежа меток на каждый вызов
+    def stage(self, stage: str, analysis: str, model: str, sec: float) -> None:
+        h = self._stages.get((stage, analysis, model))
+        if h is None:
+            h = self._stages[(stage, analysis, model)] = self.histogram(
+                "stage_seconds", (("stage", stage), ("analysis_type", analysis), ("model", model)))
+        h.observe(sec)
+        if self.spans is not None:
+            spans = self.spans.get()
+            if spans is not None:
+                spans[stage] = spans.get(stage, 0.0) + sec
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1.0) -> None:
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def gauge_add(self, name: str, delta: float, labels: Labels = ()) -> None:
+        key = (name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0.0) + delta
+
+    def render(self) -> str:
+        with self._lock:
+            hists, counters, gauges = list(self._hist.items()), dict(self._counters), dict(self._gauges)
+        # значения коллекторов вливаем в общие серии, чтобы строки одной метрики шли подряд
+        for fn in self.collectors:
+            for name, typ, labels, value in fn():
+                (counters if typ == "counter" else gauges)[(name, tuple(labels.items()))] = value
+        lines: List[str] = []
+        seen = set()
+        def head(name: str, typ: str) -> None:
+            if name in seen: return
+            seen.add(name)
+            full = self.prefix + name
+            if name in self._help: lines.append(f"# HELP {full} {self._help[name]}")
+            lines.append(f"# TYPE {full} {typ}")
+        for (name, labels), h in sorted(hists, key=lambda kv: kv[0]):
+            head(name, "histogram")
+            snap = h.snapshot()
+            full = self.prefix + name
+            for le, c in snap["buckets"].items():
+                le_label = f'le="{le}"'
+                lines.append(f"{full}_bucket{_fmt_labels(labels, le_label)} {c}")
+            lines.append(f"{full}_sum{_fmt_labels(labels)} {snap['sum']}")
+            lines.append(f"{full}_count{_fmt_labels(labels)} {snap['count']}")
+        for typ, series in (("counter", counters), ("gauge", gauges)):
+            for (name, labels), v in sorted(series.items()):
+                head(name, typ)
+                lines.append(f"{self.prefix}{name}{_fmt_labels(labels)} {v}")
+        return "\n".join(lines) + "\n"
+
+# чистый ASGI-слой (без BaseHTTPMiddleware): длительность и статус запроса по маршруту, in-flight
+class MetricsMiddleware:
+    def __init__(self, app, metrics: Metrics, paths: Sequence[str]):
+        self.app = app
+        self.metrics = metrics
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        path = scope["path"] if scope["path"] in self.paths else "other"
+        t0 = time.perf_counter()
+        REQUEST_T0.set(t0)
+        status = 500
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        m = self.metrics
+        m.gauge_add("in_flight", 1, (("path", path),))
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            m.gauge_add("in_flight", -1, (("path", path),))
+            m.observe("request_seconds", time.perf_counter() - t0, (("path", path),))
+            m.inc("requests_total", (("path", path), ("status", str(status))))
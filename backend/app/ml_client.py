@@ -0,0 +1,157 @@
+from __future__ import annotations
+import asyncio
+import random
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.admission import DEADLINE_HEADER, DeadlineExceeded
+
+# ответы, которые имеет смысл повторить: ML перезапускается или перегружен
+RETRY_STATUSES = (502, 503, 504)
+
+class CircuitOpenError(Exception):
+    pass
+
+# closed -> open после N ошибок подряд; через reset_sec — half-open, пропускаем одну пробу
+class CircuitBreaker:
+    def __init__(self, failures: int, reset_sec: float):
+        self.threshold = failures
+        self.reset_sec = reset_sec
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probe = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_sec:
+            self.state = "half_open"
+            self._probe = False
+        if self.state == "half_open" and not self._probe:
+            self._probe = True
+            return True
+        return False
+
+    # без смены состояния: пропустит ли allow() запрос прямо сейчас (для выбора реплики)
+    def available(self) -> bool:
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.reset_sec
+        return self.state == "closed" or not self._probe
+
+    # проба ушла без исхода (отмена, дедлайн, сброс нагрузки) — следующий запрос снова может стать пробой
+    def abandon(self) -> None:
+        if self.state == "half_open":
+            self._probe = False
+
+    def success(self) -> None:
+        self.state, self.failures, self._probe = "closed", 0, False
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.threshold:
+            if self.state != "open":
+                self.trips += 1
+            self.state, self.opened_at, self._probe = "open", time.monotonic(), False
+
+    def snapshot(self) -> Dict[str, Any]:
+        left = max(0.0, self.reset_sec - (time.monotonic() - self.opened_at)) if self.state == "open" else 0.0
+        return {"state": self.state, "failures": self.failures, "trips": self.trips, "retry_in_sec": round(left, 3)}
+
+# один долгоживущий httpx-клиент на приложение: пул соединений, keep-alive, ретраи, предохранитель на каждый ML
+class MLClient:
+    def __init__(self, timeout: float, max_connections: int, max_keepalive: int, keepalive_expiry: float,
+                 retries: int, backoff_sec: float, breaker_failures: int, breaker_reset_sec: float):
+        self.limits = httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_keepalive, keepalive_expiry=keepalive_expiry,
+        )
+        self.client = httpx.AsyncClient(timeout=timeout, limits=self.limits)
+        self.retries = retries
+        self.backoff_sec = backoff_sec
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_sec = breaker_reset_sec
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.in_flight = 0
+        self.requests = self.retried = self.rejected = 0
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        p = urlsplit(url)
+        key = f"{p.scheme}://{p.netloc}"
+        b = self.breakers.get(key)
+        if b is None:
+            b = self.breakers[key] = CircuitBreaker(self.breaker_failures, self.breaker_reset_sec)
+        return b
+
+    # POST с ретраями (экспоненциальная пауза + jitter) для сетевых ошибок и 502/503/504;
+    # deadline (time.monotonic()) — остаток уходит в ML заголовком X-Deadline-Ms и ограничивает таймаут попытки,
+    # после него не повторяем. 503 с Retry-After — ML сбрасывает нагрузку: не повторяем и не считаем отказом.
+    # Проба half-open, ушедшая без исхода (отмена проигравшего hedge, дедлайн, сброс), освобождается в finally
+    async def post_json(self, url: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+                        deadline: Optional[float] = None) -> Dict[str, Any]:
+        if deadline is not None and time.monotonic() >= deadline:
+            raise DeadlineExceeded("request deadline exceeded before ML call")
+        b = self.breaker(url)
+        if not b.allow():
+            self.rejected += 1
+            raise CircuitOpenError(f"ML endpoint {url} is unavailable (circuit open)")
+        probe = b.state == "half_open"
+        self.requests += 1
+        self.in_flight += 1
+        try:
+            for attempt in range(self.retries + 1):
+                timeout = httpx.USE_CLIENT_DEFAULT
+                if deadline is not None:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        raise DeadlineExceeded("request deadline exceeded before ML call")
+                    headers = {**(headers or {}), DEADLINE_HEADER: str(int(left * 1000))}
+                    timeout = min(left, self.client.timeout.read or left)
+                try:
+                    r = await self.client.post(url, json=payload, headers=headers, timeout=timeout)
+                    shed = r.status_code == 503 and "retry-after" in r.headers
+                    if r.status_code in RETRY_STATUSES and attempt < self.retries and not shed:
+                        raise httpx.HTTPStatusError(f"retryable status {r.status_code}", request=r.request, response=r)
+                    if r.status_code >= 500 and not shed:
+                        b.failure()
+                    elif not shed:
+                        b.success()
+                    r.raise_for_status()
+                    return r.json()
+                except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                    retryable = isinstance(e, httpx.TransportError) or e.response.status_code in RETRY_STATUSES
+                    if not retryable or attempt >= self.retries or (isinstance(e, httpx.HTTPStatusError) and shed):
+                        if isinstance(e, httpx.TransportError):
+                            b.failure()
+                        raise
+                    self.retried += 1
+                    await asyncio.sleep(self.backoff_sec * (2 ** attempt) * random.uniform(0.5, 1.5))
+            raise RuntimeError("unreachable")
+        finally:
+            self.in_flight -= 1
+            if probe and b.state == "half_open":
+                b.abandon()
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        # httpx не отдаёт состояние пула публично — берём что есть
+        pool = getattr(getattr(self.client, "_transport", None), "_pool", None)
+        conns = getattr(pool, "connections", None)
+        return {
+            "pool": {
+                "max_connections": self.limits.max_connections,
+                "max_keepalive": self.limits.max_keepalive_connections,
+                "keepalive_expiry_sec": self.limits.keepalive_expiry,
+                "open_connections": len(conns) if conns is not None else None,
+                "in_flight": self.in_flight,
+            },
+            "requests": self.requests,
+            "retried": self.retried,
+            "rejected_by_breaker": self.rejected,
+            "breakers": {k: b.snapshot() for k, b in self.breakers.items()},
+        }
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from sqlalchemy import Column, Integer, String, Float, DateTime, text
+from sqlalchemy import Column, Index, Integer, SmallInteger, String, Float, DateTime, text
 from sqlalchemy.types import JSON
 from app.db import Base
 
@@ -8,6 +8,8 @@ class PredictionLog(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     created_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"))
+    # кто спрашивал (chat id бота); история фильтруется по нему
+    user_id       = Column(String(64), nullable=True)
 
     analysis_type = Column(String(32), nullable=False)
     model_name    = Column(String(64), nullable=True)
@@ -15,5 +17,49 @@ class PredictionLog(Base):
     risk          = Column(Float, nullable=False)
     risk_category = Column(String(16), nullable=False)
 
+    # компактное тело (app/compact.py): признаки массивом по схеме анализа, рекомендация кодом;
+    # request_json/response_json — только то, что в схему не легло (у строк старого формата — всё тело)
+    schema_version = Column(SmallInteger, nullable=True)
+    features       = Column(JSON, nullable=True)
+    rec_code       = Column(SmallInteger, nullable=True)
+    model_version  = Column(String(64), nullable=True)
+
     request_json  = Column(JSON, nullable=True)
     response_json = Column(JSON, nullable=True)
+    # канонический хэш (analysis_type, model, features); у ref-повтора тело пустое — оригинал в прежней строке с телом
+    request_hash  = Column(String(40), nullable=True)
+
+    # под keyset-пагинацию истории: (фильтр, created_at, id) — страница читается по индексу без OFFSET
+    __table_args__ = (
+        Index("ix_prediction_logs_user_created", "user_id", "created_at", "id"),
+        Index("ix_prediction_logs_analysis_created", "analysis_type", "created_at", "id"),
+        Index("ix_prediction_logs_created", "created_at", "id"),
+        Index("ix_prediction_logs_request_hash", "request_hash", "id"),
+    )
+
+# предагрегаты по журналу: одна строка — дельта за пачку записи (или уже слитая компактором)
+# по ключу (гранулярность, начало корзины, анализ, модель); статистика читается только отсюда
+class RiskRollup(Base):
+    __tablename__ = "risk_rollups"
+
+    id = Column(Integer, primary_key=True)
+    granularity   = Column(String(8), nullable=False)     # hour | day
+    bucket_start  = Column(DateTime, nullable=False)
+    analysis_type = Column(String(32), nullable=False)
+    model_name    = Column(String(64), nullable=False)   # "" если модель не указана
+
+    n        = Column(Integer, nullable=False)
+    n_low    = Column(Integer, nullable=False)
+    n_medium = Column(Integer, nullable=False)
+    n_high   = Column(Integer, nullable=False)
+    n_other  = Column(Integer, nullable=False)
+
+    risk_sum = Column(Float, nullable=False)
+    risk_min = Column(Float, nullable=False)
+    risk_max = Column(Float, nullable=False)
+    # гистограмма risk по фиксированным корзинам {номер: count} — сливается сложением
+    sketch   = Column(JSON, nullable=False)
+
+    __table_args__ = (
+        Index("ix_risk_rollups_key", "granularity", "bucket_start", "analysis_type", "model_name"),
+    )
@@ -0,0 +1,133 @@
+# модуль общий для backend/app и ml_service/app: у сервисов свои образы и свой пакет app, поэтому копия.
+# Правим обе сразу — совпадение проверяет backend/tests/test_vendored.py
+from __future__ import annotations
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+# длительности стадий текущего запроса; заполняется Metrics.stage, только пока включён SlowLog
+SPANS: ContextVar[Optional[Dict[str, float]]] = ContextVar("spans", default=None)
+
+_profile_lock = threading.Lock()
+
+class ProfilerBusy(Exception):
+    pass
+
+# сэмплирующий профайлер: раз в interval снимаем стеки всех потоков (sys._current_frames),
+# результат — collapsed stacks «поток;внешняя;...;внутренняя N» для flamegraph.pl / speedscope
+def sample(seconds: float, interval: float) -> str:
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("profiler is already running")
+    try:
+        me = threading.get_ident()
+        counts: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(tid, str(tid)))
+                counts[";".join(reversed(stack))] += 1
+            time.sleep(interval)
+        return "".join(f"{k} {v}\n" for k, v in counts.most_common())
+    finally:
+        _profile_lock.release()
+
+# копия тела для журнала медленных запросов: без user_id и без значений признаков (только имена и типы)
+def sanitize(body: bytes, limit: int = 4096) -> Any:
+    try:
+        data = json.loads(body[:limit * 4] or b"null")
+    except ValueError:
+        return {"raw_bytes": len(body)}
+    def clean(v: Any, key: str = "") -> Any:
+        if key == "user_id":
+            return "<redacted>"
+        if isinstance(v, dict):
+            return {k: clean(x, k) for k, x in list(v.items())[:100]}
+        if isinstance(v, list):
+            return [clean(x) for x in v[:20]] + ([f"... {len(v) - 20} more"] if len(v) > 20 else [])
+        if key in ("analysis_type", "model"):
+            return v
+        return type(v).__name__
+    return clean(data)
+
+# кольцевой буфер медленных запросов; threshold_ms <= 0 — выключен, и middleware пропускает запрос как есть
+class SlowLog:
+    def __init__(self, threshold_ms: float, capacity: int, metrics=None):
+        self.metrics = metrics
+        self.entries: deque = deque(maxlen=capacity)
+        self.captured = 0
+        self.threshold_ms = 0.0
+        self.set_threshold(threshold_ms)
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def set_threshold(self, threshold_ms: float) -> None:
+        self.threshold_ms = max(0.0, threshold_ms)
+        # стадии пишутся в SPANS только при включённом журнале — иначе Metrics.stage их не трогает
+        if self.metrics is not None:
+            self.metrics.spans = SPANS if self.enabled else None
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        self.entries.append(entry)
+        self.captured += 1
+
+    def query(self, limit: int, path: Optional[str] = None) -> List[Dict[str, Any]]:
+        items = [e for e in reversed(self.entries) if path is None or e["path"] == path]
+        return items[:limit]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"threshold_ms": self.threshold_ms, "buffered": len(self.entries),
+                "capacity": self.entries.maxlen, "captured": self.captured}
+
+class SlowRequestMiddleware:
+    def __init__(self, app, slowlog: SlowLog, body_limit: int = 4096):
+        self.app = app
+        self.slowlog = slowlog
+        self.body_limit = body_limit
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.slowlog.enabled:
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        spans: Dict[str, float] = {}
+        SPANS.set(spans)
+        body = bytearray()
+        status = 500
+        async def receive_copy():
+            message = await receive()
+            if message["type"] == "http.request" and len(body) < self.body_limit:
+                body.extend(message.get("body", b"")[:self.body_limit - len(body)])
+            return message
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        try:
+            await self.app(scope, receive_copy, send_status)
+        finally:
+            total_ms = (time.perf_counter() - t0) * 1000.0
+            if total_ms >= self.slowlog.threshold_ms:
+                self.slowlog.record({
+                    "at": time.time(),
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    "total_ms": round(total_ms, 3),
+                    "stages_ms": {k: round(v * 1000.0, 3) for k, v in spans.items()},
+                    "payload": sanitize(bytes(body), self.body_limit),
+                })
@@ -0,0 +1,224 @@
+from __future__ import annotations
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, select, tuple_
+
+from app.models import PredictionLog, RiskRollup
+
+log = logging.getLogger("uvicorn.error")
+
+GRANULARITIES = ("hour", "day")
+# гистограмма risk ∈ [0, 1] с шагом 0.001 — квантиль с точностью до корзины;
+# менять только вместе с очисткой risk_rollups, иначе старые и новые корзины не сольются
+SKETCH_BINS = 1000
+_CATEGORIES = ("low", "medium", "high")
+_COUNTERS = ("n", "n_low", "n_medium", "n_high", "n_other")
+
+# (granularity, bucket_start, analysis_type, model_name)
+Key = Tuple[str, datetime, str, str]
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"unknown granularity '{granularity}', expected one of {GRANULARITIES}")
+
+def empty() -> Dict[str, Any]:
+    return {"n": 0, "n_low": 0, "n_medium": 0, "n_high": 0, "n_other": 0,
+            "risk_sum": 0.0, "risk_min": float("inf"), "risk_max": float("-inf"), "sketch": {}}
+
+# слияние двух агрегатов (строки rollup или дельты) — всё аддитивно, кроме min/max
+def merge(acc: Dict[str, Any], other: Any) -> Dict[str, Any]:
+    get = other.__getitem__ if hasattr(other, "__getitem__") else lambda f: getattr(other, f)
+    for f in _COUNTERS:
+        acc[f] += get(f)
+    acc["risk_sum"] += get("risk_sum")
+    acc["risk_min"] = min(acc["risk_min"], get("risk_min"))
+    acc["risk_max"] = max(acc["risk_max"], get("risk_max"))
+    sk = acc["sketch"]
+    for b, c in get("sketch").items():
+        sk[b] = sk.get(b, 0) + c
+    return acc
+
+# строки журнала -> дельты по всем гранулярностям; корзина — по created_at строки (LogWriter ставит его при постановке
+# в очередь), без него строка легла бы в корзину момента сброса
+def aggregate(rows: Iterable[Dict[str, Any]]) -> Dict[Key, Dict[str, Any]]:
+    out: Dict[Key, Dict[str, Any]] = {}
+    for r in rows:
+        ts = r.get("created_at")
+        if ts is None:
+            raise ValueError("prediction log row without created_at, cannot pick a rollup bucket")
+        risk = float(r["risk"])
+        cat = r.get("risk_category") or ""
+        col = f"n_{cat}" if cat in _CATEGORIES else "n_other"
+        b = str(min(SKETCH_BINS - 1, max(0, int(risk * SKETCH_BINS))))
+        for g in GRANULARITIES:
+            key = (g, bucket_start(ts, g), r["analysis_type"], r.get("model_name") or "")
+            a = out.get(key)
+            if a is None:
+                a = out[key] = empty()
+            a["n"] += 1
+            a[col] += 1
+            a["risk_sum"] += risk
+            a["risk_min"] = min(a["risk_min"], risk)
+            a["risk_max"] = max(a["risk_max"], risk)
+            a["sketch"][b] = a["sketch"].get(b, 0) + 1
+    return out
+
+def _to_rows(aggs: Dict[Key, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {"granularity": g, "bucket_start": bs, "analysis_type": at, "model_name": mn, **a}
+        for (g, bs, at, mn), a in aggs.items()
+    ]
+
+# дельты пишутся в той же транзакции, что и сами логи: журнал и rollup не расходятся
+async def write_deltas(conn, rows: Sequence[Dict[str, Any]]) -> None:
+    deltas = _to_rows(aggregate(rows))
+    if deltas:
+        await conn.execute(insert(RiskRollup.__table__), deltas)
+
+def quantile(agg: Dict[str, Any], q: float) -> Optional[float]:
+    n = agg["n"]
+    if n == 0:
+        return None
+    target = q * n
+    seen = 0
+    for b in sorted(agg["sketch"], key=int):
+        seen += agg["sketch"][b]
+        if seen >= target:
+            mid = (int(b) + 0.5) / SKETCH_BINS
+            return round(min(agg["risk_max"], max(agg["risk_min"], mid)), 4)
+    return agg["risk_max"]
+
+def summarize(agg: Dict[str, Any], quantiles: Sequence[float]) -> Dict[str, Any]:
+    n = agg["n"]
+    return {
+        "n": n,
+        "by_category": {c: agg[f"n_{c}"] for c in _CATEGORIES + ("other",)},
+        "mean": round(agg["risk_sum"] / n, 6) if n else None,
+        "min": agg["risk_min"] if n else None,
+        "max": agg["risk_max"] if n else None,
+        "quantiles": {str(q): quantile(agg, q) for q in quantiles},
+    }
+
+# чтение статистики: только risk_rollups, несжатые дельты доливаются на лету
+async def load(db, granularity: str, since: datetime, until: datetime,
+               analysis_type: Optional[str] = None, model_name: Optional[str] = None) -> Dict[Key, Dict[str, Any]]:
+    q = (
+        select(RiskRollup)
+        .where(RiskRollup.granularity == granularity)
+        .where(RiskRollup.bucket_start >= bucket_start(since, granularity))
+        .where(RiskRollup.bucket_start < until)
+    )
+    if analysis_type:
+        q = q.where(RiskRollup.analysis_type == analysis_type)
+    if model_name is not None:
+        q = q.where(RiskRollup.model_name == model_name)
+    res = await db.execute(q.order_by(RiskRollup.bucket_start))
+    out: Dict[Key, Dict[str, Any]] = {}
+    for r in res.scalars():
+        key = (r.granularity, r.bucket_start, r.analysis_type, r.model_name)
+        merge(out.setdefault(key, empty()), r)
+    return out
+
+# периодически схлопывает дельты одного ключа в одну строку, чтобы чтение оставалось коротким
+class RollupCompactor:
+    def __init__(self, engine, interval: float, max_keys: int = 500):
+        self.engine = engine
+        self.interval = interval
+        self.max_keys = max_keys
+        self._task: Optional[asyncio.Task] = None
+        self.runs = self.merged_rows = self.conflicts = 0
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="rollup-compactor")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                while await self.compact_once() >= self.max_keys:
+                    pass
+            except Exception as e:
+                log.warning("rollup compaction failed: %s", e)
+
+    # возвращает число обработанных ключей
+    async def compact_once(self) -> int:
+        cols = (RiskRollup.granularity, RiskRollup.bucket_start, RiskRollup.analysis_type, RiskRollup.model_name)
+        async with self.engine.begin() as conn:
+            keys = (await conn.execute(
+                select(*cols).group_by(*cols).having(func.count() > 1).limit(self.max_keys)
+            )).all()
+            if not keys:
+                return 0
+            res = await conn.execute(select(RiskRollup.__table__).where(tuple_(*cols).in_([tuple(k) for k in keys])))
+            merged: Dict[Key, Dict[str, Any]] = {}
+            ids: List[int] = []
+            for r in res.mappings():
+                ids.append(r["id"])
+                merge(merged.setdefault((r["granularity"], r["bucket_start"], r["analysis_type"], r["model_name"]),
+                                        empty()), r)
+            # параллельный компактор (другой экземпляр backend) уже забрал часть строк — откатываемся
+            deleted = await conn.execute(delete(RiskRollup.__table__).where(RiskRollup.id.in_(ids)))
+            if deleted.rowcount != len(ids):
+                self.conflicts += 1
+                raise RuntimeError("rollup rows changed concurrently, retry later")
+            await conn.execute(insert(RiskRollup.__table__), _to_rows(merged))
+        self.runs += 1
+        self.merged_rows += len(ids)
+        return len(keys)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"runs": self.runs, "merged_rows": self.merged_rows, "conflicts": self.conflicts}
+
+# разовое наполнение risk_rollups по уже накопленному журналу (при первом включении rollup'ов);
+# archive_root — ещё и по строкам, уже перенесённым в архив (app/archive.py)
+async def backfill(engine, batch_size: int = 10_000, archive_root: Optional[str] = None) -> int:
+    async with engine.connect() as conn:
+        if (await conn.execute(select(func.count()).select_from(RiskRollup.__table__))).scalar():
+            raise RuntimeError("risk_rollups is not empty, backfill would double-count")
+    cols = (PredictionLog.id, PredictionLog.created_at, PredictionLog.analysis_type,
+            PredictionLog.model_name, PredictionLog.risk, PredictionLog.risk_category)
+    last_id, total = 0, 0
+    if archive_root:
+        from app import archive
+        for rows in archive.iter_rows(archive_root, columns=[c.key for c in cols]):
+            if rows:
+                async with engine.begin() as conn:
+                    await write_deltas(conn, rows)
+                total += len(rows)
+    while True:
+        async with engine.begin() as conn:
+            rows = (await conn.execute(
+                select(*cols).where(PredictionLog.id > last_id).order_by(PredictionLog.id).limit(batch_size)
+            )).mappings().all()
+            if not rows:
+                return total
+            await write_deltas(conn, [dict(r) for r in rows])
+        last_id = rows[-1]["id"]
+        total += len(rows)
+
+if __name__ == "__main__":
+    import sys
+    from app.db import async_engine, ensure_schema
+
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("usage: python -m app.rollups backfill")
+    from config import settings
+    ensure_schema()
+    archive_root = settings.LOG_ARCHIVE_DIR if settings.LOG_RETENTION_DAYS > 0 else None
+    print("backfilled", asyncio.run(backfill(async_engine, archive_root=archive_root)), "prediction logs")
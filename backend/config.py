@@ -9,19 +9,97 @@ class Settings(BaseSettings):
     ML_BASE_URL: str = f"http://{ML_HOST}:8001"
     ML_HEART_URL: str = ML_BASE_URL
     ML_DIAB_URL: str = ML_BASE_URL
+    # реплики ml_service через запятую (пусто — одна, ML_HEART_URL / ML_DIAB_URL)
+    ML_HEART_URLS: str = ""
+    ML_DIAB_URLS: str = ""
     ML_PREDICT_PATH: str = "/predict"
     ML_TIMEOUT_SECONDS: int = 5
+    # пул соединений к ML, ретраи и предохранитель
+    ML_MAX_CONNECTIONS: int = 100
+    ML_MAX_KEEPALIVE: int = 20
+    ML_KEEPALIVE_EXPIRY_SEC: float = 30.0
+    ML_RETRIES: int = 2
+    ML_RETRY_BACKOFF_SEC: float = 0.05
+    ML_BREAKER_FAILURES: int = 5
+    ML_BREAKER_RESET_SEC: float = 10.0
+    # выбор реплики: p2c | least; активная проверка /health, вывод из ротации и возврат
+    ML_LB_POLICY: str = "p2c"
+    ML_HEALTH_INTERVAL_SEC: float = 2.0
+    ML_HEALTH_TIMEOUT_SEC: float = 1.0
+    ML_EJECT_AFTER: int = 3
+    ML_READMIT_AFTER: int = 2
+    # дублировать на другую реплику запрос, не ответивший за столько мс (0 — выключено)
+    ML_HEDGE_AFTER_MS: float = 0.0
 
     DB_HOST: str = "db"
     DB_PORT: int = 5432
     DB_NAME: str = "healthrisk"
     DB_USER: str = "postgres"
     DB_PASS: str = "1234"
+    # полный URL базы вместо сборки из DB_* (например sqlite:///./healthrisk.db для локальных прогонов)
+    DB_URL: str | None = None
+    # пул async-движка
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT_SEC: float = 10.0
+    # SQLite: сколько ждать блокировку файла, прежде чем "database is locked"
+    DB_SQLITE_BUSY_TIMEOUT_MS: int = 30_000
+    # фоновая запись prediction_logs: очередь, пачка, интервал сброса; переполнение — block | drop | spill
+    LOG_QUEUE_MAX: int = 10_000
+    LOG_BATCH_SIZE: int = 500
+    LOG_FLUSH_INTERVAL_SEC: float = 0.2
+    LOG_OVERFLOW_POLICY: str = "block"
+    LOG_SPILL_PATH: str = "prediction_logs.spill.jsonl"
+    LOG_DRAIN_TIMEOUT_SEC: float = 10.0
+    # тело строки журнала: compact (признаки массивом по схеме, рекомендация кодом) | json (прежний формат)
+    LOG_ROW_FORMAT: str = "compact"
+    # архив: строки старше LOG_RETENTION_DAYS уходят в Parquet под LOG_ARCHIVE_DIR (0 — не архивировать)
+    LOG_RETENTION_DAYS: float = 0.0
+    LOG_ARCHIVE_DIR: str = "archive/prediction_logs"
+    LOG_ARCHIVE_INTERVAL_SEC: float = 3600.0
+    LOG_ARCHIVE_BATCH: int = 50_000
+    # /logs?archived=true: сколько дней архива читается за один запрос (дальше — по курсору)
+    LOG_ARCHIVE_SCAN_DAYS: int = 31
+    # сжатие дельт risk_rollups: период и сколько ключей сливать за один проход
+    ROLLUP_COMPACT_INTERVAL_SEC: float = 60.0
+    ROLLUP_COMPACT_MAX_KEYS: int = 500
+    # /stats: максимальный период запроса, в днях
+    STATS_MAX_RANGE_DAYS: int = 400
+    # склейка одинаковых запросов к ML (analysis_type, model, features): общий вызов для одновременных
+    # и короткий кэш ответа для повторов; журнал повторов — full (как обычно) | ref (ссылка по request_hash) | skip
+    DEDUP_ENABLED: bool = True
+    DEDUP_WINDOW_SEC: float = 2.0
+    DEDUP_CACHE_SIZE: int = 10_000
+    DEDUP_LOG_MODE: str = "full"
+    # допуск запросов: «путь=одновременно:ждущих» через запятую (пусто — без лимитов), ожидание слота,
+    # Retry-After в ответе 503; дедлайн клиента приходит в X-Deadline-Ms (без заголовка — REQUEST_DEADLINE_MS,
+    # 0 — без дедлайна), остаток передаётся в ML тем же заголовком
+    ADMISSION_LIMITS: str = "/api/v1/predict=256:1024,/api/v1/predict/panel=128:512"
+    ADMISSION_QUEUE_TIMEOUT_MS: float = 1000.0
+    ADMISSION_RETRY_AFTER_SEC: float = 1.0
+    REQUEST_DEADLINE_MS: float = 10_000.0
+    # журнал медленных запросов: порог в мс (0 — выключен, без накладных расходов) и размер кольцевого буфера
+    SLOW_REQUEST_MS: float = 0.0
+    SLOW_REQUEST_BUFFER: int = 200
+    # POST /admin/profile: потолок длительности сэмплирования
+    PROFILE_MAX_SEC: float = 60.0
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
     @property
     def DATABASE_URL(self) -> str:
+        if self.DB_URL:
+            return self.DB_URL
         return f"postgresql+psycopg2://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    # тот же адрес с async-драйвером: psycopg2 -> asyncpg, sqlite -> aiosqlite
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        url = self.DATABASE_URL
+        for sync, aio in (("postgresql+psycopg2://", "postgresql+asyncpg://"), ("postgresql://", "postgresql+asyncpg://"),
+                          ("sqlite://", "sqlite+aiosqlite://")):
+            if url.startswith(sync):
+                return aio + url[len(sync):]
+        return url
+
 settings = Settings()
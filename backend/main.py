@@ -1,19 +1,32 @@
 from __future__ import annotations
 
+import asyncio
+import base64
 import logging
+import time
 from contextlib import asynccontextmanager
-from typing import Any, Dict, Optional, List
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, List, Tuple
 
 import httpx
 import uvicorn
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from sqlalchemy import text as sql_text
-from sqlalchemy.orm import Session
+from sqlalchemy import select, text as sql_text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import settings
-from app.db import Base, engine, get_db
+from app.db import async_engine, ensure_schema, get_async_db
+from app.dedup import SingleFlight, request_key
+from app.log_writer import LogWriter
+from app.metrics import REQUEST_T0, Metrics, MetricsMiddleware
+from app.admission import DEADLINE, Admission, AdmissionMiddleware, DeadlineExceeded, parse_limits
+from app.balancer import Balancer
+from app.ml_client import CircuitOpenError, MLClient
 from app.models import PredictionLog
+from app.profiling import ProfilerBusy, SlowLog, SlowRequestMiddleware, sample
+from app import archive, compact, rollups
 
 
 router = APIRouter(prefix="/api/v1")
@@ -22,24 +35,130 @@ log = logging.getLogger("uvicorn.error")
 ML_HEART_URL = getattr(settings, "ML_HEART_URL")
 ML_DIAB_URL  = getattr(settings, "ML_DIAB_URL")
 ML_PREDICT_PATH = getattr(settings, "ML_PREDICT_PATH", "/predict")
+# реплики по анализам: список ML_*_URLS, иначе единственный ML_*_URL
+ML_REPLICAS = {
+    "heart": [u.strip() for u in settings.ML_HEART_URLS.split(",") if u.strip()] or [ML_HEART_URL],
+    "diabetes": [u.strip() for u in settings.ML_DIAB_URLS.split(",") if u.strip()] or [ML_DIAB_URL],
+}
 ML_TIMEOUT_SECONDS = int(getattr(settings, "ML_TIMEOUT_SECONDS", 5))
 
 RISK_RU = {"low": "низкий", "medium": "умеренный", "high": "высокий"}
 
+ml_client: MLClient | None = None
+balancer: Balancer | None = None
+log_writer: LogWriter | None = None
+compactor: rollups.RollupCompactor | None = None
+archiver: archive.Archiver | None = None
+single_flight: SingleFlight | None = None
+
+metrics = Metrics("backend_")
+metrics.describe("stage_seconds", "Stage latency: parse_validate, ml_call, log_enqueue")
+metrics.describe("request_seconds", "HTTP request latency by path")
+metrics.describe("requests_total", "HTTP requests by path and status")
+metrics.describe("errors_total", "Failed predictions by type")
+metrics.describe("in_flight", "Requests in progress by path")
+metrics.describe("db_flush_seconds", "prediction_logs batch write latency")
+metrics.describe("ml_dedup_total", "Predictions served without own ML call: joined in-flight or cached")
+
+def _collect():
+    rows = []
+    if log_writer is not None:
+        st = log_writer.stats()
+        rows += [
+            ("log_queue_depth", "gauge", {}, st["queue_depth"]),
+            ("log_rows_written_total", "counter", {}, st["written"]),
+            # запись в БД не удалась: строки потеряны (failed/dropped) или отложены в spill-файл
+            ("errors_total", "counter", {"type": "db_write_failed"}, st["failed"]),
+            ("errors_total", "counter", {"type": "db_write_dropped"}, st["dropped"]),
+            ("errors_total", "counter", {"type": "db_write_spilled"}, st["spilled"]),
+        ]
+    if ml_client is not None:
+        rows += [
+            ("ml_in_flight", "gauge", {}, ml_client.in_flight),
+            ("ml_retries_total", "counter", {}, ml_client.retried),
+        ]
+    if balancer is not None:
+        rows += [("ml_hedged_total", "counter", {}, balancer.hedged)]
+        for r in balancer.nodes():
+            rows += [
+                ("ml_replica_outstanding", "gauge", {"replica": r.base_url}, r.outstanding),
+                ("ml_replica_healthy", "gauge", {"replica": r.base_url}, int(r.healthy)),
+            ]
+    if single_flight is not None:
+        rows += [
+            ("ml_dedup_total", "counter", {"kind": "joined"}, single_flight.joined),
+            ("ml_dedup_total", "counter", {"kind": "cached"}, single_flight.cached),
+            ("ml_dedup_in_flight", "gauge", {}, single_flight.in_flight),
+        ]
+    return rows
+
+metrics.collectors.append(_collect)
+
+admission = Admission(
+    parse_limits(settings.ADMISSION_LIMITS),
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_MS / 1000.0,
+    retry_after=settings.ADMISSION_RETRY_AFTER_SEC,
+    default_deadline=settings.REQUEST_DEADLINE_MS / 1000.0,
+    metrics=metrics,
+)
+RETRY_AFTER = str(max(1, round(settings.ADMISSION_RETRY_AFTER_SEC)))
+
+slowlog = SlowLog(settings.SLOW_REQUEST_MS, settings.SLOW_REQUEST_BUFFER, metrics)
+
+def _stages(analysis: str, model: Optional[str], **stages: float) -> None:
+    for stage, sec in stages.items():
+        metrics.stage(stage, analysis, model or "", sec)
+
+def _error(kind: str) -> None:
+    metrics.inc("errors_total", (("type", kind),))
+
 #  схемы ввода/вывода
 class PredictRequest(BaseModel):
     analysis_type: str
     features: Dict[str, Any]
     model: Optional[str] = None
+    user_id: Optional[str] = None   # chat id бота; в ML не уходит
+
+class PanelRequest(BaseModel):
+    features: Dict[str, Dict[str, Any]]   # {"heart": {...}, "diabetes": {...}}
+    models: Dict[str, str] = {}           # модель по анализу; по умолчанию — модель ML по умолчанию
+    user_id: Optional[str] = None
 
 class PredictResponse(BaseModel):
     analysis_type: str
     model: Optional[str]
+    model_version: Optional[str] = None
     risk: float
     risk_category: str
     risk_category_ru: str
     recommendation: Optional[str] = None
 
+class PanelError(BaseModel):
+    status: int
+    detail: Any
+
+class PanelResponse(BaseModel):
+    results: Dict[str, PredictResponse]
+    errors: Dict[str, PanelError]
+
+class StatsBucket(BaseModel):
+    bucket_start: Optional[str]        # None — итог за весь период
+    analysis_type: str
+    model_name: Optional[str]
+    n: int
+    by_category: Dict[str, int]
+    mean: Optional[float]
+    min: Optional[float]
+    max: Optional[float]
+    quantiles: Dict[str, Optional[float]]
+
+class StatsResponse(BaseModel):
+    granularity: str
+    since: str
+    until: str
+    buckets: List[StatsBucket]
+    totals: List[StatsBucket]
+
 class PredictionLogOut(BaseModel):
     id: int
     created_at: Optional[str]
@@ -49,117 +168,416 @@ class PredictionLogOut(BaseModel):
     risk_category: str
     risk_category_ru: str
 
-#  утилита для нормального выбора мльки
-def _ml_endpoint(analysis_type: str) -> str:
-    at = analysis_type.lower().strip()
-    if at == "heart":
-        return f"{ML_HEART_URL}{ML_PREDICT_PATH}"
-    if at == "diabetes":
-        return f"{ML_DIAB_URL}{ML_PREDICT_PATH}"
-    raise HTTPException(status_code=400, detail="unsupported analysis_type")
+#  утилита для нормального выбора мльки: анализ должен иметь реплики, конкретную выбирает balancer
+def _check_analysis(analysis: str) -> None:
+    if not balancer.supports(analysis):
+        _error("unsupported_analysis")
+        raise HTTPException(status_code=400, detail="unsupported analysis_type")
 
 # создает таблицу в чтоб история была
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    Base.metadata.create_all(bind=engine)
-    log.info("DB schema ensured. ML: heart=%s, diabetes=%s", ML_HEART_URL, ML_DIAB_URL)
+    global ml_client, balancer, log_writer, compactor, archiver, single_flight
+    ensure_schema()
+    log.info("DB schema ensured. ML replicas: %s", ML_REPLICAS)
+    ml_client = MLClient(
+        timeout=ML_TIMEOUT_SECONDS,
+        max_connections=settings.ML_MAX_CONNECTIONS,
+        max_keepalive=settings.ML_MAX_KEEPALIVE,
+        keepalive_expiry=settings.ML_KEEPALIVE_EXPIRY_SEC,
+        retries=settings.ML_RETRIES,
+        backoff_sec=settings.ML_RETRY_BACKOFF_SEC,
+        breaker_failures=settings.ML_BREAKER_FAILURES,
+        breaker_reset_sec=settings.ML_BREAKER_RESET_SEC,
+    )
+    balancer = Balancer(
+        ml_client, ML_REPLICAS, ML_PREDICT_PATH,
+        policy=settings.ML_LB_POLICY,
+        health_interval=settings.ML_HEALTH_INTERVAL_SEC,
+        health_timeout=settings.ML_HEALTH_TIMEOUT_SEC,
+        eject_after=settings.ML_EJECT_AFTER,
+        readmit_after=settings.ML_READMIT_AFTER,
+        hedge_after=settings.ML_HEDGE_AFTER_MS / 1000.0,
+    )
+    await balancer.start()
+    log_writer = LogWriter(
+        async_engine,
+        max_queue=settings.LOG_QUEUE_MAX,
+        batch_size=settings.LOG_BATCH_SIZE,
+        flush_interval=settings.LOG_FLUSH_INTERVAL_SEC,
+        policy=settings.LOG_OVERFLOW_POLICY,
+        spill_path=settings.LOG_SPILL_PATH or None,
+        drain_timeout=settings.LOG_DRAIN_TIMEOUT_SEC,
+        metrics=metrics,
+    )
+    await log_writer.start()
+    if settings.LOG_ROW_FORMAT not in compact.FORMATS:
+        raise ValueError(f"unknown LOG_ROW_FORMAT '{settings.LOG_ROW_FORMAT}', expected one of {compact.FORMATS}")
+    if settings.DEDUP_LOG_MODE not in ("full", "ref", "skip"):
+        raise ValueError(f"unknown DEDUP_LOG_MODE '{settings.DEDUP_LOG_MODE}', expected full | ref | skip")
+    if settings.DEDUP_ENABLED:
+        single_flight = SingleFlight(settings.DEDUP_WINDOW_SEC, settings.DEDUP_CACHE_SIZE)
+    compactor = rollups.RollupCompactor(
+        async_engine,
+        interval=settings.ROLLUP_COMPACT_INTERVAL_SEC,
+        max_keys=settings.ROLLUP_COMPACT_MAX_KEYS,
+    )
+    await compactor.start()
+    if settings.LOG_RETENTION_DAYS > 0:
+        archiver = archive.Archiver(
+            async_engine,
+            root=settings.LOG_ARCHIVE_DIR,
+            retention_days=settings.LOG_RETENTION_DAYS,
+            interval=settings.LOG_ARCHIVE_INTERVAL_SEC,
+            batch_size=settings.LOG_ARCHIVE_BATCH,
+        )
+        await archiver.start()
     print("Приложение запускается...")
     yield
+    if archiver is not None:
+        await archiver.stop()
+    await compactor.stop()
+    await log_writer.stop()
+    await balancer.stop()
+    await ml_client.aclose()
+    await async_engine.dispose()
     print("Приложение останавливается...")
 
 app = FastAPI(title=getattr(settings, "APP_NAME", "Health Risk Backend"), lifespan=lifespan)
+app.add_middleware(AdmissionMiddleware, admission=admission)
+app.add_middleware(MetricsMiddleware, metrics=metrics,
+                   paths=("/api/v1/predict", "/api/v1/predict/panel", "/api/v1/logs", "/api/v1/stats", "/health", "/metrics"))
+app.add_middleware(SlowRequestMiddleware, slowlog=slowlog)
 
 # проверяет что все живое запустилось и не упало, доступно ли бд, подлкючен ли мл
 @app.get("/health")
-async def health(db: Session = Depends(get_db)) -> Dict[str, Any]:
+async def health(db: AsyncSession = Depends(get_async_db)) -> Dict[str, Any]:
     try:
-        db.execute(sql_text("SELECT 1"))
+        await db.execute(sql_text("SELECT 1"))
         db_ok = True
     except Exception:
         db_ok = False
+    pool = async_engine.pool
     return {
         "status": "ok",
         "db": "ok" if db_ok else "error",
+        "db_pool": pool.status() if hasattr(pool, "status") else None,
         "ml": {
-            "heart": f"{ML_HEART_URL}{ML_PREDICT_PATH}",
-            "diabetes": f"{ML_DIAB_URL}{ML_PREDICT_PATH}",
+            "path": ML_PREDICT_PATH,
             "timeout_sec": ML_TIMEOUT_SECONDS,
+            "client": ml_client.stats() if ml_client is not None else None,
+            "balancer": balancer.stats() if balancer is not None else None,
         },
+        "log_writer": log_writer.stats() if log_writer is not None else None,
+        "rollup_compactor": compactor.stats() if compactor is not None else None,
+        "archiver": archiver.stats() if archiver is not None else None,
+        "dedup": single_flight.stats() if single_flight is not None else None,
+        "admission": admission.stats(),
+        "slow_requests": slowlog.stats(),
     }
 
-# предсказание с логированием
-@router.post("/predict", response_model=PredictResponse)
-async def predict(payload: PredictRequest, db: Session = Depends(get_db)) -> Any:
-    ml_url = _ml_endpoint(payload.analysis_type)
-
-    # вызов ML
+# один анализ: вызов ML (одинаковые запросы склеиваются), нормализация ответа и строка журнала
+# (None — склеенный повтор при DEDUP_LOG_MODE=skip); ошибки — HTTPException, как их отдаёт /predict
+async def _score(analysis: str, model: Optional[str], features: Dict[str, Any],
+                 user_id: Optional[str]) -> Tuple[PredictResponse, Optional[Dict[str, Any]], float]:
+    _check_analysis(analysis)
+    body = {"analysis_type": analysis, "features": features, "model": model}
+    key = request_key(analysis, model, features)
+    # остаток дедлайна клиента уходит в ML: там не начнут работу, которую здесь уже не ждут
+    deadline = DEADLINE.get()
+    shared: Optional[str] = None
+    t = time.perf_counter()
     try:
-        async with httpx.AsyncClient(timeout=ML_TIMEOUT_SECONDS) as client:
-            r = await client.post(ml_url, json=payload.model_dump())
-        r.raise_for_status()
-        ml_resp: Dict[str, Any] = r.json()
+        if single_flight is not None:
+            ml_resp, shared = await single_flight.do(key, lambda: balancer.post_json(analysis, body, deadline=deadline))
+        else:
+            ml_resp = await balancer.post_json(analysis, body, deadline=deadline)
+    except CircuitOpenError as e:
+        _error("ml_circuit_open")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": RETRY_AFTER})
+    except DeadlineExceeded as e:
+        _error("deadline")
+        raise HTTPException(status_code=504, detail=str(e))
+    except httpx.TimeoutException as e:
+        if deadline is not None and time.monotonic() >= deadline:
+            _error("deadline")
+            raise HTTPException(status_code=504, detail="request deadline exceeded")
+        _error("ml_failure")
+        raise HTTPException(status_code=502, detail=f"ML call failed: {e}")
+    except httpx.HTTPStatusError as e:
+        # ML сбрасывает нагрузку или не успел к дедлайну — передаём тот же сигнал клиенту
+        if e.response.status_code == 503 and "retry-after" in e.response.headers:
+            _error("ml_overloaded")
+            raise HTTPException(status_code=503, detail="ML service overloaded, retry later",
+                                headers={"Retry-After": e.response.headers["retry-after"]})
+        if e.response.status_code == 504:
+            _error("deadline")
+            raise HTTPException(status_code=504, detail="request deadline exceeded")
+        # 4xx от ML — ошибка запроса (нет признаков, неизвестная модель): отдаём клиенту как есть
+        if e.response.status_code < 500:
+            _error("missing_features" if e.response.status_code == 400 else "ml_rejected")
+            try:
+                detail = e.response.json().get("detail", e.response.text)
+            except ValueError:
+                detail = e.response.text
+            raise HTTPException(status_code=e.response.status_code, detail=detail)
+        _error("ml_failure")
+        raise HTTPException(status_code=502, detail=f"ML call failed: {e}")
     except httpx.HTTPError as e:
+        _error("ml_failure")
         raise HTTPException(status_code=502, detail=f"ML call failed: {e}")
+    t_ml = time.perf_counter() - t
 
     # нормализация ответа
     risk = float(ml_resp.get("risk", 0.0))
     cat_en = str(ml_resp.get("risk_category", "")).lower()
-    cat_ru = RISK_RU.get(cat_en, cat_en or "")
-    recommendation = ml_resp.get("recommendation")
-    model_used = ml_resp.get("model") or payload.model
-
-    # запись в БД
-    try:
-        row = PredictionLog(
-            analysis_type=payload.analysis_type.lower().strip(),
-            model_name=model_used,
-            risk=risk,
-            risk_category=cat_en,
-            request_json=payload.model_dump(),
-            response_json=ml_resp,
-        )
-        db.add(row)
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        log.warning("DB log write failed: %s", e)
-
-    return PredictResponse(
-        analysis_type=payload.analysis_type.lower().strip(),
+    model_used = ml_resp.get("model") or model
+    resp = PredictResponse(
+        analysis_type=analysis,
         model=model_used,
+        model_version=ml_resp.get("model_version"),
         risk=risk,
         risk_category=cat_en,
-        risk_category_ru=cat_ru,
-        recommendation=recommendation,
+        risk_category_ru=RISK_RU.get(cat_en, cat_en or ""),
+        recommendation=ml_resp.get("recommendation"),
     )
 
-#  история (для бота)
+    # склеенный повтор пишется по DEDUP_LOG_MODE: full — как обычно, ref — без JSON (ссылка по request_hash)
+    mode = settings.DEDUP_LOG_MODE if shared else "full"
+    if mode == "skip":
+        return resp, None, t_ml
+    return resp, {
+        "user_id": user_id,
+        "analysis_type": analysis,
+        "model_name": model_used,
+        "risk": risk,
+        "risk_category": cat_en,
+        "request_hash": key,
+        **(compact.encode(settings.LOG_ROW_FORMAT, analysis, features, model, ml_resp) if mode == "full"
+           else compact.empty()),
+    }, t_ml
+
+# предсказание с логированием
+@router.post("/predict", response_model=PredictResponse)
+async def predict(payload: PredictRequest) -> Any:
+    t_handler = time.perf_counter()
+    t0 = REQUEST_T0.get() or t_handler
+    analysis = payload.analysis_type.lower().strip()
+    resp, row, t_ml = await _score(analysis, payload.model, payload.features, payload.user_id)
+
+    # запись в БД — через фоновый writer, не на пути ответа
+    t_log = time.perf_counter()
+    if row is not None:
+        await log_writer.submit(row)
+    _stages(analysis, resp.model, parse_validate=t_handler - t0, ml_call=t_ml,
+            log_enqueue=time.perf_counter() - t_log)
+    return resp
+
+# панель: несколько анализов одного пациента за один запрос — вызовы ML идут параллельно
+# (задержка — самый медленный, а не сумма), частичный результат допустим; строки журнала — одной транзакцией
+@router.post("/predict/panel", response_model=PanelResponse)
+async def predict_panel(payload: PanelRequest) -> Any:
+    t_handler = time.perf_counter()
+    t0 = REQUEST_T0.get() or t_handler
+    analyses = {k.lower().strip(): v for k, v in payload.features.items()}
+    if not analyses:
+        raise HTTPException(status_code=400, detail="features: expected at least one analysis_type")
+    models = {k.lower().strip(): v for k, v in payload.models.items()}
+    done = await asyncio.gather(
+        *(_score(a, models.get(a), f, payload.user_id) for a, f in analyses.items()), return_exceptions=True)
+
+    results: Dict[str, PredictResponse] = {}
+    errors: Dict[str, PanelError] = {}
+    rows: List[Dict[str, Any]] = []
+    for analysis, r in zip(analyses, done):
+        if isinstance(r, HTTPException):
+            errors[analysis] = PanelError(status=r.status_code, detail=r.detail)
+            continue
+        if isinstance(r, BaseException):
+            raise r
+        resp, row, t_ml = r
+        results[analysis] = resp
+        if row is not None:
+            rows.append(row)
+        _stages(analysis, resp.model, parse_validate=t_handler - t0, ml_call=t_ml)
+    if not results:
+        # ничего не посчитано: общий код ошибки, если он один на всех, иначе 502
+        codes = {e.status for e in errors.values()}
+        code = codes.pop() if len(codes) == 1 else 502
+        raise HTTPException(status_code=code, detail={a: e.detail for a, e in errors.items()},
+                            headers={"Retry-After": RETRY_AFTER} if code == 503 else None)
+
+    if rows:
+        await log_writer.submit_many(rows)
+    return PanelResponse(results=results, errors=errors)
+
+# Prometheus: стадии по analysis_type/model, запросы, ошибки по типам, in-flight, очередь журнала
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint() -> PlainTextResponse:
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# сэмплирующий профайлер на seconds секунд: collapsed stacks всех потоков (event loop и пул потоков)
+# — на вход flamegraph.pl или speedscope
+@app.post("/admin/profile", response_class=PlainTextResponse)
+async def admin_profile(seconds: float = Query(10.0, gt=0), interval_ms: float = Query(5.0, ge=1.0)) -> PlainTextResponse:
+    try:
+        text = await asyncio.to_thread(sample, min(seconds, settings.PROFILE_MAX_SEC), interval_ms / 1000.0)
+    except ProfilerBusy as e:
+        raise HTTPException(409, str(e))
+    return PlainTextResponse(text)
+
+# медленные запросы: стадии и очищенная копия тела (без user_id и значений признаков), новые первыми
+@app.get("/admin/slow")
+async def admin_slow(limit: int = Query(50, ge=1, le=1000), path: Optional[str] = None) -> Dict[str, Any]:
+    return {**slowlog.stats(), "entries": slowlog.query(limit, path)}
+
+# порог журнала на лету; 0 — выключить
+@app.post("/admin/slow")
+async def admin_slow_threshold(threshold_ms: float = Query(..., ge=0)) -> Dict[str, Any]:
+    slowlog.set_threshold(threshold_ms)
+    return slowlog.stats()
+
+# курсор истории — непрозрачная строка (created_at, id) последней записи страницы
+def _encode_cursor(created_at: datetime, id_: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{id_}".encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, id_ = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(id_)
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+# created_at хранится без зоны (UTC) — приводим границы периода к тому же виду
+def _naive_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is None or dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+# колонки страницы /logs — одни и те же для БД и архива
+_LOG_PAGE_COLUMNS = ("id", "created_at", "analysis_type", "model_name", "risk", "risk_category")
+
+#  история (для бота): keyset по (created_at, id) от новых к старым, курсор следующей страницы — в X-Next-Cursor
 @router.get("/logs", response_model=List[PredictionLogOut])
 async def list_logs(
+    response: Response,
     limit: int = Query(20, ge=1, le=200),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None),
+    user_id: Optional[str] = Query(None),
+    analysis_type: Optional[str] = Query(None),
+    model_name: Optional[str] = Query(None),
+    risk_category: Optional[str] = Query(None),
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None),
+    archived: bool = Query(False),
+    db: AsyncSession = Depends(get_async_db),
 ) -> Any:
-    rows = (
-        db.query(PredictionLog)
-        .order_by(PredictionLog.id.desc())
+    at = analysis_type.lower().strip() if analysis_type else None
+    rc = risk_category.lower().strip() if risk_category else None
+    since_n = _naive_utc(since) if since is not None else None
+    until_n = _naive_utc(until) if until is not None else None
+    before = _decode_cursor(cursor) if cursor else None
+    q = select(*(getattr(PredictionLog, c) for c in _LOG_PAGE_COLUMNS))
+    if user_id is not None:
+        q = q.where(PredictionLog.user_id == user_id)
+    if at:
+        q = q.where(PredictionLog.analysis_type == at)
+    if model_name:
+        q = q.where(PredictionLog.model_name == model_name)
+    if rc:
+        q = q.where(PredictionLog.risk_category == rc)
+    if since_n is not None:
+        q = q.where(PredictionLog.created_at >= since_n)
+    if until_n is not None:
+        q = q.where(PredictionLog.created_at < until_n)
+    if before is not None:
+        q = q.where(tuple_(PredictionLog.created_at, PredictionLog.id) < tuple_(*before))
+    res = await db.execute(
+        q.order_by(PredictionLog.created_at.desc(), PredictionLog.id.desc())
         .limit(limit)
-        .all()
     )
+    rows = [dict(r) for r in res.mappings().all()]
+    # горячая часть кончилась раньше страницы, а клиент просит старое (archived=true) — дочитываем из архива
+    # (там всё старше) с того же места, не больше LOG_ARCHIVE_SCAN_DAYS дней за запрос
+    resume = None
+    if len(rows) < limit and archived and settings.LOG_RETENTION_DAYS > 0:
+        last = (rows[-1]["created_at"], rows[-1]["id"]) if rows else before
+        more, resume = await asyncio.to_thread(
+            archive.read_page, settings.LOG_ARCHIVE_DIR, limit - len(rows), user_id=user_id, analysis_type=at,
+            model_name=model_name, risk_category=rc, since=since_n, until=until_n, before=last,
+            columns=list(_LOG_PAGE_COLUMNS), max_days=settings.LOG_ARCHIVE_SCAN_DAYS,
+        )
+        rows += more
+    if resume is not None:
+        response.headers["X-Next-Cursor"] = _encode_cursor(*resume)
+    elif len(rows) == limit and rows[-1]["created_at"] is not None:
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
     out: List[PredictionLogOut] = []
     for r in rows:
         out.append(
             PredictionLogOut(
-                id=r.id,
-                created_at=str(r.created_at) if r.created_at else None,
-                analysis_type=r.analysis_type,
-                model_name=r.model_name,
-                risk=float(r.risk),
-                risk_category=r.risk_category,
-                risk_category_ru=RISK_RU.get(r.risk_category, r.risk_category),
+                id=r["id"],
+                created_at=str(r["created_at"]) if r["created_at"] else None,
+                analysis_type=r["analysis_type"],
+                model_name=r["model_name"],
+                risk=float(r["risk"]),
+                risk_category=r["risk_category"],
+                risk_category_ru=RISK_RU.get(r["risk_category"], r["risk_category"]),
             )
         )
     return out
 
+def _stats_bucket(key, agg, quantiles: List[float], with_bucket: bool = True) -> StatsBucket:
+    _, bs, at, mn = key
+    return StatsBucket(
+        bucket_start=bs.isoformat() if with_bucket else None,
+        analysis_type=at,
+        model_name=mn or None,
+        **rollups.summarize(agg, quantiles),
+    )
+
+#  распределения риска по часам/дням — читаются из risk_rollups, сырой журнал не трогаем
+@router.get("/stats", response_model=StatsResponse)
+async def stats(
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None),
+    analysis_type: Optional[str] = Query(None),
+    model_name: Optional[str] = Query(None),
+    quantiles: str = Query("0.5,0.9,0.99"),
+    db: AsyncSession = Depends(get_async_db),
+) -> Any:
+    try:
+        qs = [float(q) for q in quantiles.split(",") if q.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="quantiles must be comma-separated floats")
+    if any(not 0.0 <= q <= 1.0 for q in qs):
+        raise HTTPException(status_code=400, detail="quantiles must be within [0, 1]")
+    until_ = _naive_utc(until) or datetime.now(timezone.utc).replace(tzinfo=None)
+    since_ = _naive_utc(since) or until_ - timedelta(days=7)
+    if since_ >= until_:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    if until_ - since_ > timedelta(days=settings.STATS_MAX_RANGE_DAYS):
+        raise HTTPException(status_code=400, detail=f"range is limited to {settings.STATS_MAX_RANGE_DAYS} days")
+
+    aggs = await rollups.load(
+        db, granularity, since_, until_,
+        analysis_type=analysis_type.lower().strip() if analysis_type else None,
+        model_name=model_name,
+    )
+    totals: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for (_, _, at, mn), agg in aggs.items():
+        rollups.merge(totals.setdefault((at, mn), rollups.empty()), agg)
+    return StatsResponse(
+        granularity=granularity,
+        since=since_.isoformat(),
+        until=until_.isoformat(),
+        buckets=[_stats_bucket(k, a, qs) for k, a in aggs.items()],
+        totals=[_stats_bucket((granularity, since_, at, mn), a, qs, with_bucket=False)
+                for (at, mn), a in sorted(totals.items())],
+    )
+
 app.include_router(router)
 
 
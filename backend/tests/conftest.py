@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# тесты запускаются как сервис: из каталога backend (import app..., config)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+# app.db создаёт движки при импорте (соединений не открывает) — без DB_URL это Postgres;
+# тесты, которым нужна БД, поднимают свою SQLite
+os.environ.setdefault("DB_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'health-risk-tests.db')}")
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.admission import DeadlineExceeded
+from app.ml_client import CircuitOpenError, MLClient
+
+URL = "http://ml-heart:8001/predict"
+
+def _client(handler, retries: int = 0) -> MLClient:
+    mc = MLClient(timeout=5.0, max_connections=10, max_keepalive=5, keepalive_expiry=5.0,
+                  retries=retries, backoff_sec=0.01, breaker_failures=1, breaker_reset_sec=0.0)
+    mc.client = httpx.AsyncClient(transport=httpx.MockTransport(handler), timeout=5.0)
+    return mc
+
+def _half_open(mc: MLClient):
+    b = mc.breaker(URL)
+    b.failure()
+    assert b.state == "open"
+    return b
+
+async def _hang(request):
+    await asyncio.sleep(60)
+
+def test_cancelled_probe_is_released():
+    async def go():
+        mc = _client(_hang)
+        b = _half_open(mc)
+        task = asyncio.create_task(mc.post_json(URL, {}))
+        await asyncio.sleep(0.05)
+        assert b.state == "half_open" and not b.available()
+        # так балансировщик снимает проигравшую hedge-копию
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert b.available()
+        assert b.allow()
+        await mc.aclose()
+    asyncio.run(go())
+
+def test_probe_released_when_deadline_expires_between_retries():
+    async def handler(request):
+        return httpx.Response(502)
+
+    async def go():
+        mc = _client(handler, retries=3)
+        mc.backoff_sec = 0.2
+        b = _half_open(mc)
+        with pytest.raises(DeadlineExceeded):
+            await mc.post_json(URL, {}, deadline=time.monotonic() + 0.05)
+        assert b.state == "half_open" and b.available()
+        await mc.aclose()
+    asyncio.run(go())
+
+def test_expired_deadline_does_not_take_probe():
+    async def go():
+        mc = _client(_hang)
+        b = _half_open(mc)
+        with pytest.raises(DeadlineExceeded):
+            await mc.post_json(URL, {}, deadline=time.monotonic() - 1.0)
+        assert b.allow()
+        with pytest.raises(CircuitOpenError):
+            await mc.post_json(URL, {})
+        await mc.aclose()
+    asyncio.run(go())
@@ -0,0 +1,125 @@
+import asyncio
+import math
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import rollups
+from app.db import Base
+from app.log_writer import LogWriter
+from app.models import PredictionLog, RiskRollup
+
+T0 = datetime(2026, 3, 1, 21, 0, 0)
+QUANTILES = (0.0, 0.1, 0.5, 0.9, 0.99, 1.0)
+_FMT = {"hour": "%Y-%m-%d %H:00:00", "day": "%Y-%m-%d 00:00:00"}
+
+def _logs(rng: random.Random, n: int):
+    rows = []
+    for _ in range(n):
+        risk = rng.choice([rng.random(), 0.0, 1.0, 0.3333, 0.6601])
+        rows.append({
+            "created_at": T0 + timedelta(seconds=rng.randrange(3 * 86400)),
+            "analysis_type": rng.choice(["heart", "diabetes"]),
+            "model_name": rng.choice(["heart", "rf", None]),
+            "risk": risk,
+            "risk_category": rng.choice(["low", "medium", "high", "weird"]),
+        })
+    return rows
+
+# как LogWriter._flush: журнал и дельты одной транзакцией
+async def _write(engine, rows) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(insert(PredictionLog.__table__), rows)
+        await rollups.write_deltas(conn, rows)
+
+# эталон — агрегация прямо по prediction_logs
+async def _direct(engine, granularity: str):
+    t = PredictionLog.__table__
+    bucket = func.strftime(_FMT[granularity], t.c.created_at)
+    model = func.coalesce(t.c.model_name, "")
+    cat = lambda c: func.sum(case((t.c.risk_category == c, 1), else_=0))
+    async with engine.connect() as conn:
+        res = await conn.execute(
+            select(bucket, t.c.analysis_type, model, func.count(), func.avg(t.c.risk), func.min(t.c.risk),
+                   func.max(t.c.risk), cat("low"), cat("medium"), cat("high"))
+            .group_by(bucket, t.c.analysis_type, model))
+        out = {}
+        for bs, at, mn, n, mean, lo, hi, n_low, n_med, n_high in res.all():
+            risks = (await conn.execute(
+                select(t.c.risk).where(bucket == bs, t.c.analysis_type == at, model == mn).order_by(t.c.risk)
+            )).scalars().all()
+            out[(granularity, datetime.fromisoformat(bs), at, mn)] = {
+                "n": n, "mean": mean, "min": lo, "max": hi, "risks": risks,
+                "by_category": {"low": n_low, "medium": n_med, "high": n_high,
+                                "other": n - n_low - n_med - n_high},
+            }
+    return out
+
+def _exact_quantile(risks, q: float) -> float:
+    return risks[max(0, math.ceil(q * len(risks)) - 1)]
+
+def test_rollups_match_direct_aggregation(tmp_path):
+    async def go():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'logs.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        rng = random.Random(13)
+        compactor = rollups.RollupCompactor(engine, interval=60.0, max_keys=7)
+        for _ in range(6):
+            await _write(engine, _logs(rng, 250))
+        while await compactor.compact_once():
+            pass
+        # после сжатия — ещё дельты: чтение сливает сжатые строки с несжатыми
+        for _ in range(3):
+            await _write(engine, _logs(rng, 250))
+        async with engine.connect() as conn:
+            assert (await conn.execute(select(func.count()).select_from(RiskRollup.__table__))).scalar() > 0
+
+        session = async_sessionmaker(engine, expire_on_commit=False)
+        for g in rollups.GRANULARITIES:
+            want = await _direct(engine, g)
+            async with session() as db:
+                got = await rollups.load(db, g, T0 - timedelta(days=1), T0 + timedelta(days=5))
+            assert set(got) == set(want)
+            for key, w in want.items():
+                s = rollups.summarize(got[key], QUANTILES)
+                assert s["n"] == w["n"], key
+                assert s["by_category"] == w["by_category"], key
+                assert s["mean"] == pytest.approx(w["mean"], abs=1e-6), key
+                assert (s["min"], s["max"]) == (w["min"], w["max"]), key
+                # скетч точен до корзины (1 / SKETCH_BINS)
+                for q in QUANTILES:
+                    assert s["quantiles"][str(q)] == pytest.approx(
+                        _exact_quantile(w["risks"], q), abs=1.0 / rollups.SKETCH_BINS), (key, q)
+        assert compactor.runs > 0 and compactor.conflicts == 0
+        await engine.dispose()
+    asyncio.run(go())
+
+# время строки — момент постановки в очередь; переживает spill/replay, без него rollup строку не примет
+def test_log_writer_stamps_created_at(tmp_path):
+    async def go():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'logs.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        spill = tmp_path / "spill.jsonl"
+        rows = [{"analysis_type": "heart", "model_name": "heart", "risk": 0.4, "risk_category": "medium"}
+                for _ in range(3)]
+        w = LogWriter(engine, max_queue=1, batch_size=10, flush_interval=0.01, policy="spill", spill_path=str(spill))
+        await w.submit(rows[0])
+        await w.submit_many(rows[1:])  # очередь полна — в spill
+        stamped = [r["created_at"] for r in rows]
+        assert all(isinstance(t, datetime) for t in stamped) and w.spilled == 2
+
+        await LogWriter(engine, 10, 10, 0.01, policy="spill", spill_path=str(spill)).replay_spill()
+        async with engine.connect() as conn:
+            got = (await conn.execute(select(PredictionLog.created_at).order_by(PredictionLog.id))).scalars().all()
+            keys = (await conn.execute(select(RiskRollup.bucket_start).where(RiskRollup.granularity == "hour"))).scalars().all()
+        assert got == stamped[1:]
+        assert keys == [rollups.bucket_start(stamped[1], "hour")]
+        await engine.dispose()
+    asyncio.run(go())
+    with pytest.raises(ValueError):
+        rollups.aggregate([{"analysis_type": "heart", "model_name": "heart", "risk": 0.4, "risk_category": "medium"}])
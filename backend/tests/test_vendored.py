@@ -0,0 +1,10 @@
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[2]
+
+# общие модули лежат копиями в обоих сервисах — расхождение ловим здесь
+@pytest.mark.parametrize("name", ["metrics.py", "admission.py", "profiling.py"])
+def test_vendored_copies_match(name):
+    assert (ROOT / "backend" / "app" / name).read_bytes() == (ROOT / "ml_service" / "app" / name).read_bytes()
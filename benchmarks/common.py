@@ -0,0 +1,88 @@
+# общее для бенчмарков: перцентили, образцы запросов, сохранение результата и сверка с базовой линией
+import json
+import random
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+
+SAMPLES: Dict[str, Dict[str, Any]] = {
+    "heart": {"age": 54.0, "height": 170.0, "weight": 82.0, "ap_hi": 135.0, "ap_lo": 85.0,
+              "cholesterol": 2, "gluc": 1, "smoke": 0, "alco": 0, "active": 1, "gender": 1},
+    "diabetes": {"Age": 50, "Gender": 1, "BMI": 27.5, "Chol": 5.2, "TG": 1.8,
+                 "HDL": 1.1, "LDL": 3.2, "Cr": 80, "BUN": 5.0},
+}
+# необязательные признаки (OPTIONAL в ml_service/app/model_loader.py): без них запрос не отклоняется
+OPTIONAL = {"heart": ("gender",)}
+
+def percentiles(xs: List[float]) -> Dict[str, float]:
+    xs = sorted(xs)
+    if not xs:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    pick = lambda q: xs[min(len(xs) - 1, int(q * len(xs)))] * 1000.0
+    return {"p50_ms": round(pick(0.50), 3), "p95_ms": round(pick(0.95), 3), "p99_ms": round(pick(0.99), 3)}
+
+# "heart=0.7,diabetes=0.3" -> [("heart", 0.7), ("diabetes", 0.3)]
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        name, _, w = part.partition("=")
+        mix.append((name.strip(), float(w or 1)))
+    return mix
+
+# запрос из смеси: случайный анализ по весам, с долей missing — без одного признака (ожидаем 400).
+# Непрерывные признаки (float в SAMPLES) шевелятся на ±10%, чтобы запросы не склеивались в кэше и dedup
+def make_request(rng: random.Random, mix: List[Tuple[str, float]], missing: float) -> Tuple[Dict[str, Any], bool]:
+    analysis = rng.choices([a for a, _ in mix], weights=[w for _, w in mix])[0]
+    features = {k: v * rng.uniform(0.9, 1.1) if isinstance(v, float) else v for k, v in SAMPLES[analysis].items()}
+    bad = rng.random() < missing
+    if bad:
+        features.pop(rng.choice([k for k in features if k not in OPTIONAL.get(analysis, ())]))
+    return {"analysis_type": analysis, "features": features}, bad
+
+# чем больше, тем лучше: пропускная способность; остальное (мс, нс) — чем меньше, тем лучше
+def _higher_is_better(metric: str) -> bool:
+    return metric.endswith(("rps", "per_sec"))
+
+def _flatten(d: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for k, v in d.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            out.update(_flatten(v, key + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[key] = float(v)
+    return out
+
+# метрики, ухудшившиеся больше чем на tolerance относительно базовой линии
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+            metrics: Tuple[str, ...] = ("rps", "per_sec", "p50_ms", "p95_ms", "p99_ms", "ns_per_op")) -> List[Dict[str, Any]]:
+    cur, base = _flatten(result), _flatten(baseline)
+    regressions = []
+    for key, b in base.items():
+        if not key.endswith(metrics) or key not in cur or not b:
+            continue
+        c = cur[key]
+        change = (c - b) / b
+        worse = -change if _higher_is_better(key) else change
+        if worse > tolerance:
+            regressions.append({"metric": key, "baseline": b, "current": c, "worse_by": round(worse, 3)})
+    return regressions
+
+# печать JSON, сохранение (--save) и сверка (--baseline); код выхода 1 при регрессии
+def report(result: Dict[str, Any], save: str = None, baseline: str = None, tolerance: float = 0.1) -> int:
+    code = 0
+    if baseline:
+        regressions = compare(result, json.loads(Path(baseline).read_text(encoding="utf-8")), tolerance)
+        result = {**result, "baseline": baseline, "tolerance": tolerance, "regressions": regressions}
+        code = 1 if regressions else 0
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    print(text)
+    if save:
+        Path(save).write_text(text, encoding="utf-8")
+    return code
+
+def add_report_args(parser) -> None:
+    parser.add_argument("--save", default=None, help="записать результат в JSON (новая базовая линия)")
+    parser.add_argument("--baseline", default=None, help="JSON прошлого прогона для сверки")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="допустимое ухудшение, доля")
@@ -0,0 +1,84 @@
+# p50/p95/p99 /api/v1/predict под конкурентной нагрузкой: синхронная сессия (как было) против async-движка.
+# ML подменён заглушкой с задержкой, БД — любая по --db-url (по умолчанию временный SQLite).
+# Признаки у каждого запроса свои, а склейка одинаковых запросов (DEDUP_ENABLED) выключена: мерим запись, не кэш.
+#   python benchmarks/db_latency.py --concurrency 64 --requests 2000 --db-url postgresql+psycopg2://...
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import ROOT, make_request, percentiles
+
+async def run(app, path: str, n: int, concurrency: int, seed: int = 0) -> dict:
+    import httpx
+    rng = random.Random(seed)
+    bodies = [make_request(rng, [("heart", 1.0)], 0.0)[0] for _ in range(n)]
+    lat = []
+    sem = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as c:
+        async def one(body: dict):
+            async with sem:
+                t = time.perf_counter()
+                r = await c.post(path, json=body)
+                lat.append(time.perf_counter() - t)
+                r.raise_for_status()
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(b) for b in bodies))
+        wall = time.perf_counter() - t0
+    return {"requests": n, "concurrency": concurrency, "rps": round(n / wall, 1), **percentiles(lat)}
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db-url", default=None)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--ml-delay-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    os.environ["DB_URL"] = args.db_url or f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench.db'}"
+    os.environ["DEDUP_ENABLED"] = "0"
+    sys.path.insert(0, str(ROOT / "backend"))
+    import main as backend
+    from app.db import SessionLocal
+    from app.models import PredictionLog
+
+    async def fake_ml(url, payload, headers=None, deadline=None):
+        await asyncio.sleep(args.ml_delay_ms / 1000.0)
+        return {"analysis_type": "heart", "model": "heart", "risk": 0.5, "risk_category": "medium"}
+
+    # «до»: синхронная сессия прямо в async-обработчике, как было раньше
+    @backend.app.post("/bench/predict_sync")
+    async def predict_sync(payload: backend.PredictRequest):
+        ml_resp = await backend.ml_client.post_json("", payload.model_dump())
+        db = SessionLocal()
+        try:
+            db.add(PredictionLog(analysis_type="heart", model_name="heart", risk=0.5, risk_category="medium",
+                                 request_json=payload.model_dump(), response_json=ml_resp))
+            db.commit()
+        finally:
+            db.close()
+        return ml_resp
+
+    async def go():
+        async with backend.lifespan(backend.app):
+            backend.ml_client.post_json = fake_ml
+            await run(backend.app, "/api/v1/predict", 50, 8, seed=1)  # прогрев
+            # хвост прогрева дописываем до синхронного прогона: его блокирующий commit ждёт лок SQLite,
+            # а держащая лок транзакция aiosqlite не может закончиться, пока стоит цикл событий
+            await backend.log_writer.queue.join()
+            return {
+                "db_url": os.environ["DB_URL"].split("@")[-1],
+                "ml_delay_ms": args.ml_delay_ms,
+                "sync_session": await run(backend.app, "/bench/predict_sync", args.requests, args.concurrency),
+                "async_session": await run(backend.app, "/api/v1/predict", args.requests, args.concurrency),
+            }
+
+    print(json.dumps(asyncio.run(go()), indent=2))
+
+if __name__ == "__main__":
+    main()
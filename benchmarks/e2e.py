@@ -0,0 +1,172 @@
+# сквозной нагрузочный прогон: ml_service и backend поднимаются локально (uvicorn, SQLite вместо Postgres),
+# нагрузка — HTTP в backend (/api/v1/predict) или напрямую в ml_service (/predict); по желанию ещё и бот
+# (bot/loadtest.py против живого backend). Смесь запросов и доля запросов с пропущенным признаком настраиваются.
+#   python benchmarks/e2e.py --requests 5000 --concurrency 64 --mix heart=0.7,diabetes=0.3 --missing 0.05
+#   python benchmarks/e2e.py --target ml --ml-env MICROBATCH_ENABLED=1 --baseline benchmarks/e2e.baseline.json
+#   python benchmarks/e2e.py --bot-users 500
+#   python benchmarks/e2e.py --ml-stubs 3 --dead-stubs 1 --stub-env STUB_TAIL_MS=200 --stub-env STUB_TAIL_PROB=0.02 \
+#       --backend-env ML_HEDGE_AFTER_MS=50   # backend против нескольких заглушек ML (ml_stub.py): балансировка
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from common import ROOT, add_report_args, make_request, parse_mix, percentiles, report
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _kv(items: List[str]) -> Dict[str, str]:
+    return dict(i.split("=", 1) for i in items)
+
+@contextmanager
+def service(name: str, port: int, env: Dict[str, str], timeout: float = 60.0, app: str = "main:app",
+            healthy: bool = True) -> Iterator[str]:
+    url = f"http://127.0.0.1:{port}"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT / name, env={**os.environ, **env},
+    )
+    try:
+        import httpx
+        deadline = time.monotonic() + timeout
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{name} exited with code {proc.returncode}")
+            try:
+                # «мёртвая» заглушка отвечает на /health 503 — достаточно, что процесс слушает порт
+                if httpx.get(f"{url}/health", timeout=1.0).status_code == 200 or not healthy:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{name} did not become healthy in {timeout}s")
+            time.sleep(0.2)
+        yield url
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+async def load(url: str, n: int, concurrency: int, mix: List[Tuple[str, float]], missing: float, seed: int) -> dict:
+    import httpx
+    rng = random.Random(seed)
+    reqs = [make_request(rng, mix, missing) for _ in range(n)]
+    lat_ok: List[float] = []
+    lat_bad: List[float] = []
+    status: Counter = Counter()
+    unexpected = 0
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as c:
+        async def one(body: dict, bad: bool) -> None:
+            nonlocal unexpected
+            async with sem:
+                t = time.perf_counter()
+                try:
+                    r = await c.post(url, json=body)
+                    code = str(r.status_code)
+                except httpx.HTTPError as e:
+                    code = type(e).__name__
+                dt = time.perf_counter() - t
+            status[code] += 1
+            # запрос без признака должен получить 400, полный — 200; всё прочее — ошибка
+            if code == ("400" if bad else "200"):
+                (lat_bad if bad else lat_ok).append(dt)
+            else:
+                unexpected += 1
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(b, bad) for b, bad in reqs))
+        wall = time.perf_counter() - t0
+    return {
+        "requests": n,
+        "concurrency": concurrency,
+        "rps": round(n / wall, 1),
+        **percentiles(lat_ok),
+        "rejected_missing": {"count": len(lat_bad), **percentiles(lat_bad)},
+        "unexpected": unexpected,
+        "status": dict(status),
+    }
+
+def bot_load(backend_url: str, users: int, concurrency: int) -> dict:
+    out = subprocess.run(
+        [sys.executable, "loadtest.py", "--users", str(users), "--concurrency", str(concurrency), "--real-backend"],
+        cwd=ROOT / "bot", env={**os.environ, "BACKEND_URL": backend_url}, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", choices=("backend", "ml"), default="backend")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", default="heart=0.5,diabetes=0.5")
+    parser.add_argument("--missing", type=float, default=0.0, help="доля запросов без одного признака")
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db-url", default=None, help="по умолчанию временный SQLite")
+    parser.add_argument("--ml-env", action="append", default=[], help="KEY=VALUE для ml_service (A/B настроек)")
+    parser.add_argument("--backend-env", action="append", default=[], help="KEY=VALUE для backend")
+    parser.add_argument("--bot-users", type=int, default=0, help="ещё и бот: пользователей на прогон (0 — без бота)")
+    parser.add_argument("--ml-stubs", type=int, default=0, help="вместо ml_service — N реплик-заглушек (ml_stub.py)")
+    parser.add_argument("--dead-stubs", type=int, default=0, help="из них неисправных (/health 503, /predict 503)")
+    parser.add_argument("--stub-env", action="append", default=[], help="KEY=VALUE для заглушек")
+    add_report_args(parser)
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    db_url = args.db_url or f"sqlite:///{Path(tempfile.mkdtemp()) / 'e2e.db'}"
+    result: Dict[str, object] = {"target": args.target, "mix": args.mix, "missing": args.missing,
+                                 "ml_env": args.ml_env, "backend_env": args.backend_env}
+
+    if args.ml_stubs:
+        result["ml_stubs"] = {"replicas": args.ml_stubs, "dead": args.dead_stubs, "env": args.stub_env}
+        with ExitStack() as stack:
+            urls = []
+            for i in range(args.ml_stubs):
+                dead = i >= args.ml_stubs - args.dead_stubs
+                env = {**_kv(args.stub_env), "STUB_NAME": f"stub-{i}",
+                       **({"STUB_FAIL_PROB": "1", "STUB_UNHEALTHY": "1"} if dead else {})}
+                urls.append(stack.enter_context(service("benchmarks", free_port(), env, app="ml_stub:app", healthy=not dead)))
+            env = {"DB_URL": db_url, "ML_HEART_URLS": ",".join(urls), "ML_DIAB_URLS": ",".join(urls),
+                   **_kv(args.backend_env)}
+            with service("backend", free_port(), env) as backend_url:
+                url = f"{backend_url}/api/v1/predict"
+                asyncio.run(load(url, args.warmup, 8, mix, 0.0, args.seed + 1))
+                result["load"] = asyncio.run(load(url, args.requests, args.concurrency, mix, 0.0, args.seed))
+                import httpx
+                result["balancer"] = httpx.get(f"{backend_url}/health", timeout=5.0).json()["ml"]["balancer"]
+        sys.exit(report(result, args.save, args.baseline, args.tolerance))
+
+    with service("ml_service", free_port(), _kv(args.ml_env)) as ml_url:
+        if args.target == "ml":
+            url = f"{ml_url}/predict"
+            asyncio.run(load(url, args.warmup, 8, mix, 0.0, args.seed + 1))
+            result["load"] = asyncio.run(load(url, args.requests, args.concurrency, mix, args.missing, args.seed))
+        else:
+            env = {"DB_URL": db_url, "ML_HEART_URL": ml_url, "ML_DIAB_URL": ml_url, **_kv(args.backend_env)}
+            with service("backend", free_port(), env) as backend_url:
+                url = f"{backend_url}/api/v1/predict"
+                asyncio.run(load(url, args.warmup, 8, mix, 0.0, args.seed + 1))
+                result["db_url"] = db_url.split("@")[-1]
+                result["load"] = asyncio.run(load(url, args.requests, args.concurrency, mix, args.missing, args.seed))
+                if args.bot_users:
+                    result["bot"] = bot_load(backend_url, args.bot_users, args.concurrency)
+    sys.exit(report(result, args.save, args.baseline, args.tolerance))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# микробенчмарки горячего пути ml_service: vectorize / FeatureSchema, WrappedModel.proba_pos, bucket, Registry.predict,
+# накладные расходы метрик на стадию.
+# Результат — нс на операцию (лучший из --repeat прогонов), сверка с базовой линией через --baseline.
+# Упавший замер попадает в отчёт как {"error": ...} и в список errors, код выхода 2.
+#   python benchmarks/micro.py --save benchmarks/micro.baseline.json
+#   python benchmarks/micro.py --baseline benchmarks/micro.baseline.json
+import argparse
+import sys
+import time
+from typing import Callable, Dict
+
+from common import ROOT, SAMPLES, add_report_args, report
+
+def bench(fn: Callable[[], object], number: int, repeat: int) -> Dict[str, float]:
+    fn()  # прогрев (ленивая загрузка модели, буферы)
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter_ns()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter_ns() - t) / number)
+    return {"ns_per_op": round(best, 1)}
+
+# замер, упавший с ошибкой (модель не принимает колонки схемы и т. п.), не роняет прогон: ошибка — в отчёт
+def safe(out: Dict[str, object], key: str, fn: Callable[[], object], number: int, repeat: int) -> None:
+    try:
+        out[key] = bench(fn, number, repeat)
+    except Exception as e:
+        out[key] = {"error": f"{type(e).__name__}: {e}"}
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=2000, help="вызовов в одном прогоне")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=1000, help="строк для пакетных замеров")
+    add_report_args(parser)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(ROOT / "ml_service"))
+    from app.model_loader import FEATURES, FeatureSchema, Registry, WrappedModel, bucket, model_columns, vectorize
+
+    n, r = args.number, args.repeat
+    out: Dict[str, object] = {"number": n, "repeat": r, "batch": args.batch}
+    reg = Registry()
+    for analysis in FEATURES:
+        feats = SAMPLES[analysis]
+        schema = FeatureSchema(analysis)
+        rows = [feats] * args.batch
+        out[f"vectorize_legacy.{analysis}"] = bench(lambda: vectorize(analysis, feats), n, r)
+        out[f"schema_row.{analysis}"] = bench(lambda: schema.row(feats), n, r)
+        per_batch = bench(lambda: schema.batch(rows), max(1, n // args.batch * 10), r)
+        out[f"schema_batch_per_row.{analysis}"] = {"ns_per_op": round(per_batch["ns_per_op"] / args.batch, 1)}
+
+        X_df, _ = vectorize(analysis, feats)
+        X_np, _ = schema.row(feats)
+        X_np = X_np.copy()
+        for name in reg.available()[analysis]:
+            path = reg.items[analysis][name].path
+            for backend in ("sklearn", "native"):
+                key = f"proba_pos.{analysis}.{name}.{backend}"
+                h = WrappedModel(path, backend, columns=model_columns(analysis))
+                try:
+                    if backend == "native" and h.get().native is None:
+                        continue
+                except Exception as e:
+                    out[key] = {"error": f"{type(e).__name__}: {e}"}
+                    continue
+                safe(out, f"{key}.dataframe", lambda: h.proba_pos(X_df), n, r)
+                safe(out, f"{key}.ndarray", lambda: h.proba_pos(X_np), n, r)
+        safe(out, f"registry_predict.{analysis}", lambda: reg.predict(analysis, None, feats), n, r)
+
+    out["bucket"] = bench(lambda: bucket(0.5), n * 10, r)
+
+    # цена инструментирования одной стадии: два perf_counter + запись в гистограмму
+    from app.metrics import Metrics
+    m = Metrics("bench_")
+    def timed_stage():
+        t = time.perf_counter()
+        m.stage("infer", "heart", "heart", time.perf_counter() - t)
+    out["metrics_stage"] = bench(timed_stage, n * 10, r)
+    errors = sorted(k for k, v in out.items() if isinstance(v, dict) and "error" in v)
+    if errors:
+        out["errors"] = errors
+    sys.exit(report(out, args.save, args.baseline, args.tolerance) or (2 if errors else 0))
+
+if __name__ == "__main__":
+    main()
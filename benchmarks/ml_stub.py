@@ -0,0 +1,49 @@
+# заглушка ml_service для проверки балансировки backend: /predict и /health без моделей,
+# задержка, «хвост» и доля отказов задаются окружением (несколько реплик — несколько процессов):
+#   STUB_DELAY_MS=5 STUB_TAIL_MS=200 STUB_TAIL_PROB=0.01 python -m uvicorn ml_stub:app --port 9101
+#   STUB_FAIL_PROB=1 STUB_UNHEALTHY=1 python -m uvicorn ml_stub:app --port 9102   # «мёртвая» реплика
+import asyncio
+import json
+import os
+import random
+
+DELAY = float(os.environ.get("STUB_DELAY_MS", "2")) / 1000.0
+TAIL = float(os.environ.get("STUB_TAIL_MS", "0")) / 1000.0
+TAIL_PROB = float(os.environ.get("STUB_TAIL_PROB", "0"))
+FAIL_PROB = float(os.environ.get("STUB_FAIL_PROB", "0"))
+UNHEALTHY = os.environ.get("STUB_UNHEALTHY", "0") == "1"
+NAME = os.environ.get("STUB_NAME", f"stub-{os.getpid()}")
+
+served = 0
+
+async def _send(send, status: int, body: dict) -> None:
+    raw = json.dumps(body).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"x-stub", NAME.encode())]})
+    await send({"type": "http.response.body", "body": raw})
+
+async def app(scope, receive, send):
+    global served
+    if scope["type"] != "http":
+        return
+    if scope["path"] == "/health":
+        return await _send(send, 503 if UNHEALTHY else 200, {"status": "down" if UNHEALTHY else "ok", "stub": NAME,
+                                                              "served": served})
+    if scope["path"] != "/predict":
+        return await _send(send, 404, {"detail": "not found"})
+    body = b""
+    more = True
+    while more:
+        message = await receive()
+        body += message.get("body", b"")
+        more = message.get("more_body", False)
+    req = json.loads(body or b"{}")
+    await asyncio.sleep(DELAY + (TAIL if random.random() < TAIL_PROB else 0.0))
+    if random.random() < FAIL_PROB:
+        return await _send(send, 503, {"detail": "stub failure"})
+    served += 1
+    risk = round(random.random(), 4)
+    cat = "low" if risk < 0.33 else "medium" if risk < 0.66 else "high"
+    await _send(send, 200, {"analysis_type": req.get("analysis_type"), "model": req.get("model") or "stub",
+                            "model_version": NAME, "risk": risk, "risk_category": cat,
+                            "recommendation": "stub"})
@@ -1,7 +1,6 @@
 import logging
 from typing import Any, Dict, List, Tuple
 
-import aiohttp
 from aiogram import Router
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
@@ -9,11 +8,29 @@ from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import Message, KeyboardButton, Update
 from aiogram.utils.keyboard import ReplyKeyboardBuilder
 
+import config
+from backend_client import BackendBusy, BackendClient
 from config import BACKEND_URL
 
 router = Router()
 log = logging.getLogger("bot")
 
+# сессия открывается/закрывается в хуках startup/shutdown диспетчера (main.py)
+backend = BackendClient(
+    BACKEND_URL,
+    max_connections=config.BACKEND_MAX_CONNECTIONS,
+    keepalive_sec=config.BACKEND_KEEPALIVE_SEC,
+    dns_ttl_sec=config.BACKEND_DNS_TTL_SEC,
+    concurrency=config.BACKEND_CONCURRENCY,
+    queue_max=config.BACKEND_QUEUE_MAX,
+    queue_timeout_sec=config.BACKEND_QUEUE_TIMEOUT_SEC,
+    timeout_sec=config.BACKEND_TIMEOUT_SEC,
+    retries=config.BACKEND_RETRIES,
+    retry_budget=config.BACKEND_RETRY_BUDGET,
+)
+
+BUSY_TEXT = "⏳ Сервис сейчас занят, повторите через минуту."
+
 RISK_RU = {"low": "низкий", "medium": "умеренный", "high": "высокий"}
 
 DIAB_FIELDS: List[Tuple[str, str]] = [
@@ -29,6 +46,7 @@ DIAB_FIELDS: List[Tuple[str, str]] = [
 ]
 HEART_FIELDS: List[Tuple[str, str]] = [
     ("age", "Возраст (лет)"),
+    ("gender", "Пол (м/ж)"),
     ("height", "Рост (см)"),
     ("weight", "Масса (кг)"),
     ("ap_hi", "Систолическое АД (ap_hi)"),
@@ -40,6 +58,9 @@ HEART_FIELDS: List[Tuple[str, str]] = [
     ("active", "Физ. активность (0/1)"),
 ]
 
+# список полей в состояние не кладём — он восстанавливается по analysis
+FIELDS: Dict[str, List[Tuple[str, str]]] = {"diabetes": DIAB_FIELDS, "heart": HEART_FIELDS}
+
 def kb_main():
     rkb = ReplyKeyboardBuilder()
     rkb.add(
@@ -90,13 +111,13 @@ class HeartForm(StatesGroup):
 #  FSM логика
 async def _start_collect(message: Message, state: FSMContext, *, analysis: str, fields: List[Tuple[str, str]]):
     await message.answer(_preview(fields), reply_markup=kb_cancel())
-    await state.update_data(analysis=analysis, fields=fields, answers={}, index=0)
+    await state.update_data(analysis=analysis, answers={}, index=0)
     await _ask_next(message, state)
 
 
 async def _ask_next(message: Message, state: FSMContext):
     data = await state.get_data()
-    fields: List[Tuple[str, str]] = data["fields"]
+    fields = FIELDS[data["analysis"]]
     index: int = data["index"]
     if index >= len(fields):
         await _submit(message, state);
@@ -136,20 +157,19 @@ async def _submit(message: Message, state: FSMContext):
             "smoke": _to_int01(answers.get("smoke", '0')),
             "alco": _to_int01(answers.get("alco", '0')),
             "active": _to_int01(answers.get("active", '0')),
+            "gender": _to_gender01(answers.get("gender", '0')),
         }
         model = "heart";
         title = "Сердце"
 
-    payload = {"analysis_type": analysis, "model": model, "features": features}
-    url = f"{BACKEND_URL}/api/v1/predict"
-
+    payload = {"analysis_type": analysis, "model": model, "features": features, "user_id": str(message.chat.id)}
     try:
-        async with aiohttp.ClientSession() as s:
-            async with s.post(url, json=payload, timeout=15) as resp:
-                if resp.status >= 400:
-                    text = await resp.text()
-                    raise RuntimeError(f"backend {resp.status}: {text}")
-                data = await resp.json()
+        data = await backend.post_json("/api/v1/predict", payload)
+    except BackendBusy:
+        # ответы сохраняем — пользователь может просто отправить последнее значение ещё раз
+        await state.update_data(index=len(data["answers"]) - 1)
+        await message.answer(f"{BUSY_TEXT} Отправьте последнее значение ещё раз.", reply_markup=kb_cancel())
+        return
     except Exception as e:
         await message.answer(f"❗ Ошибка запроса: {e}", reply_markup=kb_main())
         await state.clear()
@@ -200,14 +220,12 @@ async def cmd_heart(message: Message, state: FSMContext):
 
 @router.message(lambda m: m.text and m.text.lower().strip() == "история")
 async def cmd_history(message: Message):
-    url = f"{BACKEND_URL}/api/v1/logs?limit=10"
+    params = {"limit": 10, "user_id": str(message.chat.id)}
     try:
-        async with aiohttp.ClientSession() as s:
-            async with s.get(url, timeout=10) as resp:
-                if resp.status >= 400:
-                    text = await resp.text()
-                    raise RuntimeError(f"backend {resp.status}: {text}")
-                data = await resp.json()
+        data = await backend.get_json("/api/v1/logs", params=params)
+    except BackendBusy:
+        await message.answer(BUSY_TEXT, reply_markup=kb_main())
+        return
     except Exception as e:
         await message.answer(f"❗ История недоступна: {e}", reply_markup=kb_main());
         return
@@ -229,7 +247,7 @@ async def cmd_history(message: Message):
 @router.message(HeartForm.collecting)
 async def process_input(message: Message, state: FSMContext):
     data = await state.get_data()
-    fields: List[Tuple[str, str]] = data["fields"]
+    fields = FIELDS[data["analysis"]]
     index: int = data["index"]
     answers: Dict[str, Any] = data["answers"]
 
@@ -246,7 +264,7 @@ async def process_input(message: Message, state: FSMContext):
                 return
         elif key in ("smoke", "alco", "active"):
             _ = _to_int01(value)
-        elif key == "Gender":
+        elif key in ("Gender", "gender"):
             _ = _to_gender01(value)
     except Exception:
         await message.answer("Нужно число (запятая/точка допустимы). Повторите ввод:");
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import random
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+log = logging.getLogger("bot")
+
+# ответы backend, которые имеет смысл повторить
+RETRY_STATUSES = (502, 503, 504)
+# остаток нашего таймаута в мс — backend не начнёт работу, ответ на которую мы уже не дождёмся
+DEADLINE_HEADER = "X-Deadline-Ms"
+# дольше этого не слушаемся Retry-After, сколько бы backend ни попросил
+MAX_COOLDOWN_SEC = 30.0
+
+
+class BackendBusy(Exception):
+    """Очередь к backend переполнена или слот не освободился вовремя — пользователю «занято, повторите»."""
+
+
+class BackendError(Exception):
+    pass
+
+
+# одна aiohttp-сессия на процесс бота: пул соединений с keep-alive и кэшем DNS,
+# не больше concurrency запросов в полёте, не больше queue_max ждущих — остальным сразу BackendBusy.
+# 503 с Retry-After — backend сбрасывает нагрузку: на это время все запросы сразу получают BackendBusy
+class BackendClient:
+    def __init__(self, base_url: str, *, max_connections: int, keepalive_sec: float, dns_ttl_sec: int,
+                 concurrency: int, queue_max: int, queue_timeout_sec: float, timeout_sec: float,
+                 retries: int, retry_budget: float, backoff_sec: float = 0.1):
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.keepalive_sec = keepalive_sec
+        self.dns_ttl_sec = dns_ttl_sec
+        self.queue_max = queue_max
+        self.queue_timeout_sec = queue_timeout_sec
+        self.timeout = aiohttp.ClientTimeout(total=timeout_sec)
+        self.retries = retries
+        # бюджет ретраев: повторов не больше retry_budget от числа запросов, чтобы при сбое backend не удваивать нагрузку
+        self.retry_budget = retry_budget
+        self.backoff_sec = backoff_sec
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._slots = asyncio.Semaphore(concurrency)
+        self.waiting = self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.requests = self.retried = self.busy = self.shed = self.failed = 0
+
+    async def start(self) -> None:
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            keepalive_timeout=self.keepalive_sec,
+            ttl_dns_cache=self.dns_ttl_sec,
+            use_dns_cache=True,
+        )
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _may_retry(self) -> bool:
+        return self.retried < self.retry_budget * max(self.requests, 1)
+
+    async def _acquire(self) -> None:
+        if asyncio.get_running_loop().time() < self.cooldown_until:
+            self.busy += 1
+            raise BackendBusy("backend asked to back off")
+        if self.waiting >= self.queue_max:
+            self.busy += 1
+            raise BackendBusy("backend queue is full")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout_sec)
+        except asyncio.TimeoutError:
+            self.busy += 1
+            raise BackendBusy("backend queue timeout")
+        finally:
+            self.waiting -= 1
+
+    async def request(self, method: str, path: str, *, json: Any = None,
+                      params: Optional[Dict[str, Any]] = None) -> Any:
+        if self.session is None:
+            raise BackendError("backend client is not started")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout.total
+        await self._acquire()
+        self.requests += 1
+        self.in_flight += 1
+        try:
+            for attempt in range(self.retries + 1):
+                left = deadline - loop.time()
+                if left <= 0:
+                    self.failed += 1
+                    raise BackendError("backend request deadline exceeded")
+                headers = {DEADLINE_HEADER: str(int(left * 1000))}
+                try:
+                    async with self.session.request(method, f"{self.base_url}{path}", json=json, params=params,
+                                                    headers=headers) as resp:
+                        if resp.status == 503 and "Retry-After" in resp.headers:
+                            self._cooldown(resp.headers["Retry-After"])
+                            raise BackendBusy("backend is shedding load")
+                        if resp.status in RETRY_STATUSES and attempt < self.retries and self._may_retry():
+                            raise aiohttp.ClientResponseError(resp.request_info, resp.history, status=resp.status)
+                        if resp.status >= 400:
+                            text = await resp.text()
+                            raise BackendError(f"backend {resp.status}: {text}")
+                        return await resp.json()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt >= self.retries or not self._may_retry():
+                        self.failed += 1
+                        raise BackendError(f"backend unavailable: {e or type(e).__name__}")
+                    self.retried += 1
+                    await asyncio.sleep(self.backoff_sec * (2 ** attempt) * random.uniform(0.5, 1.5))
+            raise RuntimeError("unreachable")
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    def _cooldown(self, retry_after: str) -> None:
+        try:
+            sec = float(retry_after)
+        except ValueError:
+            sec = 1.0
+        self.shed += 1
+        self.cooldown_until = max(self.cooldown_until,
+                                  asyncio.get_running_loop().time() + min(max(sec, 0.0), MAX_COOLDOWN_SEC))
+
+    async def post_json(self, path: str, payload: Dict[str, Any]) -> Any:
+        return await self.request("POST", path, json=payload)
+
+    async def get_json(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        return await self.request("GET", path, params=params)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "requests": self.requests,
+            "retried": self.retried,
+            "busy": self.busy,
+            "shed_by_backend": self.shed,
+            "failed": self.failed,
+        }
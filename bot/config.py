@@ -10,4 +10,34 @@ if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN не задан")
 
 BACKEND_HOST = os.getenv("BACKEND_HOST", "127.0.0.1")
-BACKEND_URL = os.getenv("BACKEND_URL", f"http://{BACKEND_HOST}:8000").rstrip("/")
\ No newline at end of file
+BACKEND_URL = os.getenv("BACKEND_URL", f"http://{BACKEND_HOST}:8000").rstrip("/")
+
+# исходящие запросы к backend: пул соединений, ограничение параллельности и очереди, таймауты, ретраи
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "100"))
+BACKEND_KEEPALIVE_SEC = float(os.getenv("BACKEND_KEEPALIVE_SEC", "30"))
+BACKEND_DNS_TTL_SEC = int(os.getenv("BACKEND_DNS_TTL_SEC", "300"))
+BACKEND_CONCURRENCY = int(os.getenv("BACKEND_CONCURRENCY", "32"))
+BACKEND_QUEUE_MAX = int(os.getenv("BACKEND_QUEUE_MAX", "256"))
+BACKEND_QUEUE_TIMEOUT_SEC = float(os.getenv("BACKEND_QUEUE_TIMEOUT_SEC", "3"))
+BACKEND_TIMEOUT_SEC = float(os.getenv("BACKEND_TIMEOUT_SEC", "15"))
+BACKEND_RETRIES = int(os.getenv("BACKEND_RETRIES", "1"))
+BACKEND_RETRY_BUDGET = float(os.getenv("BACKEND_RETRY_BUDGET", "0.1"))
+
+# хранилище FSM: memory (один процесс) | redis (общее для реплик) | sqlite (локальная замена redis)
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory").lower()
+FSM_REDIS_URL = os.getenv("FSM_REDIS_URL", "redis://redis:6379/0")
+FSM_SQLITE_PATH = os.getenv("FSM_SQLITE_PATH", "fsm.sqlite3")
+# брошенная на середине форма живёт столько секунд (0 — без срока)
+FSM_STATE_TTL_SEC = int(os.getenv("FSM_STATE_TTL_SEC", "86400"))
+
+# режим получения апдейтов: polling (по умолчанию) | webhook (встроенный aiohttp-сервер)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")          # публичный https-адрес, на который Telegram шлёт апдейты
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# сколько апдейтов обрабатывается одновременно и сколько ждать их при остановке
+BOT_HANDLER_CONCURRENCY = int(os.getenv("BOT_HANDLER_CONCURRENCY", "256"))
+BOT_DRAIN_TIMEOUT_SEC = float(os.getenv("BOT_DRAIN_TIMEOUT_SEC", "10"))
@@ -0,0 +1,130 @@
+# нагрузочный прогон обработчиков бота без сети: фейковые апдейты Telegram идут через тот же UpdateRunner,
+# что и в webhook-режиме; Bot API и backend подменены заглушками.
+#   python loadtest.py --users 2000 --concurrency 256 --backend-delay-ms 5
+#   BACKEND_URL=http://127.0.0.1:8000 python loadtest.py --real-backend   # до живого backend (benchmarks/e2e.py)
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+os.environ.setdefault("BOT_TOKEN", "123456:LOADTEST")
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage, TelegramMethod
+from aiogram.types import Chat, Message, Update
+
+import app
+from main import build_dispatcher
+from webhook import UpdateRunner
+
+# что пользователь вводит в форме «Сердце» (по HEART_FIELDS)
+HEART_ANSWERS = ["54", "м", "170", "82", "135", "85", "2", "1", "0", "0", "1"]
+
+
+# сессия Bot API без сети: sendMessage возвращает собранный на месте Message, остальное — True
+class FakeSession(BaseSession):
+    def __init__(self):
+        super().__init__()
+        self.sent = 0
+        self._ids = itertools.count(1)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: Optional[int] = None) -> Any:
+        if isinstance(method, SendMessage):
+            self.sent += 1
+            return Message(
+                message_id=next(self._ids),
+                date=datetime.now(timezone.utc),
+                chat=Chat(id=int(method.chat_id), type="private"),
+                text=method.text,
+            )
+        return True
+
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> Dict[str, Any]:
+    user = {"id": chat_id, "is_bot": False, "first_name": f"u{chat_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+async def run(users: int, concurrency: int, backend_delay_ms: float, real_backend: bool = False) -> Dict[str, Any]:
+    session = FakeSession()
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=session, default=DefaultBotProperties(parse_mode="HTML"))
+    dp = build_dispatcher()
+
+    async def fake_backend(method: str, path: str, *, json: Any = None, params: Any = None) -> Any:
+        await asyncio.sleep(backend_delay_ms / 1000.0)
+        if path.endswith("/predict"):
+            return {"analysis_type": json["analysis_type"], "risk": 0.42, "risk_category": "medium",
+                    "risk_category_ru": "умеренный", "recommendation": "Умеренный риск. Рекомендуется контроль."}
+        return []
+    if not real_backend:
+        app.backend.request = fake_backend
+
+    runner = UpdateRunner(dp, bot, concurrency, drain_timeout=30.0)
+    ids = itertools.count(1)
+    lat: List[float] = []
+
+    # апдейты одного пользователя последовательны (форма — конечный автомат), пользователи — параллельны
+    async def one_user(chat_id: int) -> None:
+        for text in ["Сердце", *HEART_ANSWERS]:
+            t = time.perf_counter()
+            task = await runner.submit(Update.model_validate(make_update(next(ids), chat_id, text), context={"bot": bot}))
+            if task is not None:
+                await task
+            lat.append(time.perf_counter() - t)
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one_user(100_000 + i) for i in range(users)))
+    wall = time.perf_counter() - t0
+    await runner.drain()
+    await dp.emit_shutdown(bot=bot, dispatcher=dp)
+
+    lat.sort()
+    pick = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000.0, 3)
+    n = len(lat)
+    return {
+        "users": users,
+        "updates": n,
+        "concurrency": concurrency,
+        "updates_per_sec": round(n / wall, 1),
+        "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99),
+        "messages_sent": session.sent,
+        **runner.stats(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--backend-delay-ms", type=float, default=5.0)
+    parser.add_argument("--real-backend", action="store_true", help="ходить в BACKEND_URL вместо заглушки")
+    args = parser.parse_args()
+    result = asyncio.run(run(args.users, args.concurrency, args.backend_delay_ms, args.real_backend))
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,18 +4,62 @@ import sys
 
 from aiogram import Dispatcher, Bot
 from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
 
-from app import log, router
+import config
+from app import backend, log, router
 from config import BOT_TOKEN, BACKEND_URL
+from storage import CompactStorage, FlushMiddleware, make_storage
 
 #  Инициализация бота
 bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode='HTML'))
-dp = Dispatcher(storage=MemoryStorage())
 
 
-async def main():
+# одна сессия к backend на процесс: открывается до первого апдейта, закрывается после последнего
+async def on_startup():
+    await backend.start()
+
+
+async def on_shutdown():
+    await backend.close()
+    log.info("backend client: %s", backend.stats())
+
+
+# диспетчер с хранилищем FSM, роутером и хуками — общий для polling, webhook и нагрузочного прогона
+def build_dispatcher() -> Dispatcher:
+    storage = make_storage(
+        config.FSM_STORAGE,
+        redis_url=config.FSM_REDIS_URL,
+        sqlite_path=config.FSM_SQLITE_PATH,
+        ttl_sec=config.FSM_STATE_TTL_SEC,
+    )
+    dp = Dispatcher(storage=storage)
+    if isinstance(storage, CompactStorage):
+        dp.update.outer_middleware(FlushMiddleware(storage))
     dp.include_routers(router)
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return dp
+
+
+async def main():
+    dp = build_dispatcher()
+
+    if config.BOT_MODE == "webhook":
+        from webhook import run_webhook
+        if not config.WEBHOOK_URL:
+            raise RuntimeError("BOT_MODE=webhook требует WEBHOOK_URL")
+        await run_webhook(
+            dp, bot,
+            url=config.WEBHOOK_URL,
+            path=config.WEBHOOK_PATH,
+            host=config.WEBHOOK_HOST,
+            port=config.WEBHOOK_PORT,
+            secret=config.WEBHOOK_SECRET,
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+            concurrency=config.BOT_HANDLER_CONCURRENCY,
+            drain_timeout=config.BOT_DRAIN_TIMEOUT_SEC,
+        )
+        return
 
     try:
         log.info("Стартуем polling… BACKEND_URL=%s | PY=%s", BACKEND_URL, sys.executable)
@@ -0,0 +1,197 @@
+import asyncio
+import json
+import sqlite3
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import TelegramObject
+
+
+# key-value бэкенд для FSM: чтение по ключу и запись пачкой за один round trip (None — удалить)
+class RedisKV:
+    def __init__(self, url: str):
+        try:
+            from redis.asyncio import Redis
+        except ImportError:
+            raise RuntimeError("FSM_STORAGE=redis требует пакет redis (pip install redis)")
+        self.redis = Redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[str]:
+        raw = await self.redis.get(key)
+        return raw.decode() if isinstance(raw, bytes) else raw
+
+    async def write(self, items: Dict[str, Optional[str]], ttl: int) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for k, v in items.items():
+                if v is None:
+                    pipe.delete(k)
+                else:
+                    pipe.set(k, v, ex=ttl or None)
+            await pipe.execute()
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+
+# локальная замена Redis (один процесс или общий файл на одной машине, тесты); sqlite3 крутится в треде
+class SQLiteKV:
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS fsm (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)")
+        self._lock = asyncio.Lock()
+
+    def _get(self, key: str) -> Optional[str]:
+        row = self.db.execute(
+            "SELECT value FROM fsm WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def _write(self, items: Dict[str, Optional[str]], ttl: int) -> None:
+        now = time.time()
+        with self.db:
+            for k, v in items.items():
+                if v is None:
+                    self.db.execute("DELETE FROM fsm WHERE key = ?", (k,))
+                else:
+                    self.db.execute(
+                        "INSERT INTO fsm (key, value, expires_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                        (k, v, now + ttl if ttl else None),
+                    )
+            # брошенные формы чистим попутно
+            self.db.execute("DELETE FROM fsm WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+
+    async def get(self, key: str) -> Optional[str]:
+        async with self._lock:
+            return await asyncio.to_thread(self._get, key)
+
+    async def write(self, items: Dict[str, Optional[str]], ttl: int) -> None:
+        async with self._lock:
+            await asyncio.to_thread(self._write, items, ttl)
+
+    async def close(self) -> None:
+        self.db.close()
+
+
+# записи, прочитанные/изменённые за время обработки одного апдейта
+class _Session:
+    def __init__(self):
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.dirty: set = set()
+        self.deferred = False
+
+
+_session: ContextVar[Optional[_Session]] = ContextVar("fsm_session", default=None)
+
+
+# состояние и данные пользователя — одна JSON-запись {"s": state, "d": data} с TTL:
+# за апдейт одно чтение (get_state в FSM-middleware, дальше из кэша апдейта)
+# и одна запись пачкой в конце (flush из middleware); пустое состояние — удаление ключа
+class CompactStorage(BaseStorage):
+    def __init__(self, kv, ttl_sec: int, prefix: str = "fsm"):
+        self.kv = kv
+        self.ttl_sec = ttl_sec
+        self.prefix = prefix
+
+    def _key(self, key: StorageKey) -> str:
+        parts = [self.prefix, str(key.bot_id), str(key.chat_id), str(key.user_id)]
+        if key.thread_id:
+            parts.append(str(key.thread_id))
+        if key.business_connection_id:
+            parts.append(key.business_connection_id)
+        if key.destiny != "default":
+            parts.append(key.destiny)
+        return ":".join(parts)
+
+    async def _load(self, key: StorageKey) -> Dict[str, Any]:
+        k = self._key(key)
+        sess = _session.get()
+        if sess is None:
+            # апдейты обрабатываются каждый в своей задаче — сессия живёт в контексте этой задачи
+            sess = _Session()
+            _session.set(sess)
+        rec = sess.records.get(k)
+        if rec is None:
+            raw = await self.kv.get(k)
+            rec = sess.records[k] = json.loads(raw) if raw else {"s": None, "d": {}}
+        return rec
+
+    async def _store(self, key: StorageKey, rec: Dict[str, Any]) -> None:
+        k = self._key(key)
+        sess = _session.get()
+        if sess is not None:
+            sess.records[k] = rec
+            if sess.deferred:
+                sess.dirty.add(k)
+                return
+        await self.kv.write({k: self._dump(rec)}, self.ttl_sec)
+
+    @staticmethod
+    def _dump(rec: Dict[str, Any]) -> Optional[str]:
+        if rec["s"] is None and not rec["d"]:
+            return None
+        return json.dumps(rec, ensure_ascii=False, separators=(",", ":"))
+
+    async def flush(self) -> None:
+        sess = _session.get()
+        if sess is None or not sess.dirty:
+            return
+        items = {k: self._dump(sess.records[k]) for k in sess.dirty}
+        sess.dirty.clear()
+        await self.kv.write(items, self.ttl_sec)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        rec = dict(await self._load(key))
+        rec["s"] = state.state if isinstance(state, State) else state
+        await self._store(key, rec)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(key))["s"]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        rec = dict(await self._load(key))
+        rec["d"] = dict(data)
+        await self._store(key, rec)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._load(key))["d"])
+
+    async def close(self) -> None:
+        await self.kv.close()
+
+
+# откладывает запись FSM до конца апдейта и сбрасывает её одной пачкой
+class FlushMiddleware(BaseMiddleware):
+    def __init__(self, storage: CompactStorage):
+        self.storage = storage
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        sess = _session.get()
+        if sess is None:
+            sess = _Session()
+            _session.set(sess)
+        sess.deferred = True
+        try:
+            return await handler(event, data)
+        finally:
+            try:
+                await self.storage.flush()
+            finally:
+                _session.set(None)
+
+
+def make_storage(kind: str, *, redis_url: str, sqlite_path: str, ttl_sec: int) -> BaseStorage:
+    if kind == "memory":
+        return MemoryStorage()
+    if kind == "redis":
+        return CompactStorage(RedisKV(redis_url), ttl_sec)
+    if kind == "sqlite":
+        return CompactStorage(SQLiteKV(sqlite_path), ttl_sec)
+    raise RuntimeError(f"неизвестный FSM_STORAGE '{kind}', ожидается memory | redis | sqlite")
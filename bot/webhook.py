@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import signal
+import time
+from typing import Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+log = logging.getLogger("bot")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+# обработка апдейтов задачами, не больше concurrency одновременно: при насыщении submit ждёт слот,
+# и HTTP-ответ Telegram задерживается — это и есть обратное давление; при остановке — дренаж
+class UpdateRunner:
+    def __init__(self, dp: Dispatcher, bot: Bot, concurrency: int, drain_timeout: float):
+        self.dp = dp
+        self.bot = bot
+        self.drain_timeout = drain_timeout
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self.accepting = True
+        self.handled = self.failed = self.rejected = 0
+
+    async def submit(self, update: Update) -> Optional[asyncio.Task]:
+        if not self.accepting:
+            self.rejected += 1
+            return None
+        await self._slots.acquire()
+        if not self.accepting:
+            self._slots.release()
+            self.rejected += 1
+            return None
+        task = asyncio.create_task(self._run(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, update: Update) -> None:
+        try:
+            await self.dp.feed_update(self.bot, update)
+            self.handled += 1
+        except Exception:
+            self.failed += 1
+            log.exception("update %s failed", update.update_id)
+        finally:
+            self._slots.release()
+
+    async def drain(self) -> None:
+        self.accepting = False
+        if not self._tasks:
+            return
+        t = time.monotonic()
+        done, pending = await asyncio.wait(set(self._tasks), timeout=self.drain_timeout)
+        if pending:
+            log.warning("drain timed out after %.1fs, cancelling %d updates", time.monotonic() - t, len(pending))
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._tasks), "handled": self.handled, "failed": self.failed, "rejected": self.rejected}
+
+
+def make_app(runner: UpdateRunner, path: str, secret: Optional[str]) -> web.Application:
+    async def handle(request: web.Request) -> web.Response:
+        if secret and request.headers.get(SECRET_HEADER) != secret:
+            return web.Response(status=401)
+        update = Update.model_validate(await request.json(), context={"bot": runner.bot})
+        if await runner.submit(update) is None:
+            # останавливаемся — Telegram повторит доставку на другую реплику/после рестарта
+            return web.Response(status=503)
+        return web.Response()
+
+    async def health(_: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", **runner.stats()})
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    app.router.add_get("/health", health)
+    return app
+
+
+# webhook вместо long polling: встроенный aiohttp-сервер, тот же диспетчер и хуки startup/shutdown
+async def run_webhook(dp: Dispatcher, bot: Bot, *, url: str, path: str, host: str, port: int,
+                      secret: Optional[str], max_connections: int, concurrency: int, drain_timeout: float) -> None:
+    runner = UpdateRunner(dp, bot, concurrency, drain_timeout)
+    app_runner = web.AppRunner(make_app(runner, path, secret))
+    await app_runner.setup()
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    try:
+        await web.TCPSite(app_runner, host, port).start()
+        await bot.set_webhook(
+            f"{url.rstrip('/')}{path}",
+            secret_token=secret,
+            max_connections=max_connections,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=False,
+        )
+        log.info("webhook: %s%s, listening on %s:%d, concurrency=%d", url, path, host, port, concurrency)
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                # Windows: остановка через KeyboardInterrupt -> отмена задачи
+                pass
+        await stop.wait()
+    finally:
+        # webhook в Telegram не снимаем: он общий для всех реплик
+        await runner.drain()
+        await app_runner.cleanup()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+        log.info("webhook stopped: %s", runner.stats())
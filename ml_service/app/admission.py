@@ -0,0 +1,184 @@
+# модуль общий для backend/app и ml_service/app: у сервисов свои образы и свой пакет app, поэтому копия.
+# Правим обе сразу — совпадение проверяет backend/tests/test_vendored.py
+from __future__ import annotations
+import asyncio
+import json
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+
+from app.metrics import REQUEST_T0
+
+# оставшийся бюджет запроса в мс; вызывающий ставит его, вызываемый считает от момента приёма
+DEADLINE_HEADER = "X-Deadline-Ms"
+_HEADER_KEY = DEADLINE_HEADER.lower().encode("latin-1")
+
+# дедлайн текущего запроса по time.monotonic(); None — без дедлайна
+DEADLINE: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+class DeadlineExceeded(Exception):
+    pass
+
+def remaining() -> Optional[float]:
+    deadline = DEADLINE.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def check_deadline() -> None:
+    deadline = DEADLINE.get()
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceeded("request deadline exceeded")
+
+# "/predict=64:256,/predict_batch=4:16" -> {"/predict": (64, 256), ...}: одновременно выполняемых : ждущих
+def parse_limits(spec: str) -> Dict[str, Tuple[int, int]]:
+    limits = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        path, _, lim = part.strip().partition("=")
+        active, _, queue = lim.partition(":")
+        limits[path] = (int(active), int(queue or 0))
+    return limits
+
+# семафор с ограниченной очередью ожидания (FIFO): освободившийся слот передаётся первому ждущему
+class Limiter:
+    def __init__(self, limit: int, queue: int):
+        self.limit = limit
+        self.queue_max = queue
+        self.active = 0
+        self._waiters: deque = deque()
+        self.admitted = self.queued = 0
+
+    async def acquire(self, timeout: float) -> bool:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.queue_max or timeout <= 0:
+            return False
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except BaseException as e:
+            if fut.done() and not fut.cancelled():
+                self.release()  # слот уже передан нам, но мы уходим — отдаём следующему
+            else:
+                try:
+                    self._waiters.remove(fut)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                return False
+            raise
+        self.admitted += 1
+        return True
+
+    def release(self) -> None:
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"limit": self.limit, "queue_max": self.queue_max, "active": self.active,
+                "waiting": len(self._waiters), "admitted": self.admitted, "queued": self.queued}
+
+# допуск запросов: лимит одновременных и очередь на каждый путь, дедлайн из X-Deadline-Ms.
+# Сверх лимита и очереди (или не дождался слота за queue_timeout) — сразу 503 с Retry-After;
+# истёкший дедлайн — 504 ещё до работы (на входе и после ожидания в очереди)
+class Admission:
+    def __init__(self, limits: Dict[str, Tuple[int, int]], queue_timeout: float, retry_after: float,
+                 default_deadline: float = 0.0, metrics=None):
+        self.limiters = {path: Limiter(a, q) for path, (a, q) in limits.items()}
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.default_deadline = default_deadline
+        self.metrics = metrics
+        self.shed: Dict[Tuple[str, str], int] = {}
+        if metrics is not None:
+            metrics.describe("shed_total", "Requests rejected by admission control by path and reason")
+            metrics.describe("admission_wait_seconds", "Time admitted requests waited for a slot by path")
+            metrics.collectors.append(self._collect)
+
+    def reject(self, path: str, reason: str) -> None:
+        self.shed[(path, reason)] = self.shed.get((path, reason), 0) + 1
+
+    def _collect(self):
+        rows = [("shed_total", "counter", {"path": p, "reason": r}, n) for (p, r), n in self.shed.items()]
+        for path, lim in self.limiters.items():
+            rows += [
+                ("admission_active", "gauge", {"path": path}, lim.active),
+                ("admission_waiting", "gauge", {"path": path}, len(lim._waiters)),
+            ]
+        return rows
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queue_timeout_sec": self.queue_timeout, "retry_after_sec": self.retry_after,
+                "paths": {p: lim.stats() for p, lim in self.limiters.items()},
+                "shed": {f"{p} {r}": n for (p, r), n in self.shed.items()}}
+
+class AdmissionMiddleware:
+    def __init__(self, app, admission: Admission):
+        self.app = app
+        self.admission = admission
+
+    async def _reply(self, send, status: int, detail: str, retry_after: Optional[float] = None) -> None:
+        headers = [(b"content-type", b"application/json")]
+        if retry_after is not None:
+            headers.append((b"retry-after", str(max(1, round(retry_after))).encode("latin-1")))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": json.dumps({"detail": detail}).encode("utf-8")})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        adm = self.admission
+        path = scope["path"]
+        now = time.monotonic()
+        deadline = None
+        for k, v in scope["headers"]:
+            if k == _HEADER_KEY:
+                try:
+                    deadline = now + float(v) / 1000.0
+                except ValueError:
+                    pass
+                break
+        if deadline is None and adm.default_deadline > 0:
+            deadline = now + adm.default_deadline
+        limiter = adm.limiters.get(path)
+        if deadline is None and limiter is None:
+            return await self.app(scope, receive, send)
+        if deadline is not None:
+            if deadline <= now:
+                adm.reject(path, "deadline")
+                return await self._reply(send, 504, "request deadline exceeded")
+            DEADLINE.set(deadline)
+        if limiter is None:
+            return await self.app(scope, receive, send)
+
+        wait = adm.queue_timeout if deadline is None else min(adm.queue_timeout, deadline - now)
+        t_wait = time.perf_counter()
+        if not await limiter.acquire(wait):
+            if deadline is not None and time.monotonic() >= deadline:
+                adm.reject(path, "deadline")
+                return await self._reply(send, 504, "request deadline exceeded")
+            adm.reject(path, "overloaded")
+            return await self._reply(send, 503, "service overloaded, retry later", adm.retry_after)
+        try:
+            # ожидание слота — своя метрика; стадии обработчика (parse_validate) считаются от допуска
+            t_admit = time.perf_counter()
+            if adm.metrics is not None:
+                adm.metrics.observe("admission_wait_seconds", t_admit - t_wait, (("path", path),))
+            if REQUEST_T0.get():
+                REQUEST_T0.set(t_admit)
+            # дождался слота, но вызывающий уже не ждёт ответа — не работаем впустую
+            if deadline is not None and time.monotonic() >= deadline:
+                adm.reject(path, "deadline")
+                return await self._reply(send, 504, "request deadline exceeded")
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
@@ -0,0 +1,147 @@
+from __future__ import annotations
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.admission import DEADLINE, DeadlineExceeded
+from app.metrics import Histogram
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+QUEUE_WAIT_MS_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100)
+
+_STOP = object()
+
+# fn(rows) -> (probs, model_name, model_version, missing) — как у Registry.predict_batch
+BatchFn = Callable[[List[Dict[str, object]]], Tuple[List[float], str, Optional[str], List[List[str]]]]
+
+# микро-батчер для одной пары (analysis, model): копит запросы window_ms или до max_batch
+class MicroBatcher:
+    def __init__(self, fn: BatchFn, window_ms: float, max_batch: int, max_queue: int, concurrency: int = 1):
+        self.fn = fn
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._q: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._last_size = 1
+        self._stopped = threading.Event()
+        self.expired = 0
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(QUEUE_WAIT_MS_BUCKETS)
+        # несколько потребителей, чтобы пакеты одной пары шли в пул воркеров параллельно
+        self._threads = [threading.Thread(target=self._loop, name="microbatch", daemon=True) for _ in range(concurrency)]
+        for t in self._threads: t.start()
+
+    # queue.Full, если очередь забита или батчер остановлен — вызывающий отвечает 503.
+    # дедлайн запроса (ContextVar) виден только здесь, в потоке обработчика, — кладём его в очередь вместе с признаками
+    def submit(self, features: Dict[str, object]) -> Future:
+        if self._stopped.is_set():
+            raise queue.Full
+        fut: Future = Future()
+        self._q.put_nowait((features, fut, time.perf_counter(), DEADLINE.get()))
+        return fut
+
+    # не блокируемся на забитой очереди: что не успели взять — с ошибкой, потом _STOP каждому потребителю
+    def stop(self) -> None:
+        self._stopped.set()
+        while True:
+            try: item = self._q.get_nowait()
+            except queue.Empty: break
+            if item is not _STOP: item[1].set_exception(RuntimeError("microbatcher stopped"))
+        for _ in self._threads:
+            try: self._q.put_nowait(_STOP)
+            except queue.Full: break
+        for t in self._threads: t.join(timeout=5)
+
+    def depth(self) -> int:
+        return self._q.qsize()
+
+    def _collect(self, first) -> Tuple[list, bool]:
+        batch, stop = [first], False
+        # сначала забираем всё, что уже лежит в очереди
+        while len(batch) < self.max_batch:
+            try: item = self._q.get_nowait()
+            except queue.Empty: break
+            if item is _STOP: return batch, True
+            batch.append(item)
+        # адаптивно: при одиночном трафике окно не ждём, чтобы не добавлять латентность
+        if len(batch) == 1 and self._last_size == 1:
+            return batch, False
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            left = deadline - time.perf_counter()
+            if left <= 0: break
+            try: item = self._q.get(timeout=left)
+            except queue.Empty: break
+            if item is _STOP:
+                stop = True; break
+            batch.append(item)
+        return batch, stop
+
+    def _loop(self) -> None:
+        while True:
+            first = self._q.get()
+            if first is _STOP: return
+            batch, stop = self._collect(first)
+            self._run(batch)
+            if stop: return
+
+    def _run(self, batch: list) -> None:
+        now = time.perf_counter()
+        for _, _, t0, _ in batch: self.queue_wait_ms.observe((now - t0) * 1000.0)
+        # просроченные в очереди модель уже не считает
+        mono = time.monotonic()
+        live = [it for it in batch if it[3] is None or it[3] > mono]
+        for _, fut, _, deadline in batch:
+            if deadline is not None and deadline <= mono:
+                fut.set_exception(DeadlineExceeded("request deadline exceeded"))
+        self.expired += len(batch) - len(live)
+        if not live:
+            return
+        self._last_size = len(live)
+        self.batch_size.observe(len(live))
+        try:
+            probs, name, version, missing = self.fn([f for f, _, _, _ in live])
+        except Exception as e:
+            for _, fut, _, _ in live: fut.set_exception(e)
+            return
+        for (_, fut, _, _), p, m in zip(live, probs, missing):
+            fut.set_result((p, name, version if not m else None, m))
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "queue_depth": self.depth(),
+            "expired": self.expired,
+            "batch_size": self.batch_size.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
+
+# батчеры создаются лениво по ключу (analysis, model)
+class Batchers:
+    def __init__(self, registry, window_ms: float, max_batch: int, max_queue: int, concurrency: int = 1):
+        self.registry = registry
+        self.window_ms, self.max_batch, self.max_queue = window_ms, max_batch, max_queue
+        self.concurrency = concurrency
+        self.items: Dict[Tuple[str, str], MicroBatcher] = {}
+        self._lock = threading.Lock()
+
+    def get(self, analysis: str, name: str) -> MicroBatcher:
+        b = self.items.get((analysis, name))
+        if b is None:
+            with self._lock:
+                b = self.items.get((analysis, name))
+                if b is None:
+                    fn = lambda rows: self.registry.predict_batch(analysis, name, rows)
+                    b = self.items[(analysis, name)] = MicroBatcher(fn, self.window_ms, self.max_batch, self.max_queue, self.concurrency)
+        return b
+
+    # словарь дополняется из потоков обработчиков — итерируем только снимок, взятый под локом
+    def snapshot(self) -> List[Tuple[str, MicroBatcher]]:
+        with self._lock:
+            return [(f"{a}/{m}", b) for (a, m), b in self.items.items()]
+
+    def stop(self) -> None:
+        for _, b in self.snapshot(): b.stop()
+
+    def stats(self) -> Dict[str, object]:
+        return {k: b.stats() for k, b in self.snapshot()}
@@ -0,0 +1,194 @@
+from __future__ import annotations
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.model_loader import FEATURES, Registry, bucket_array, missing_detail
+
+# офлайн-скоринг выгрузок: файл читается кусками, каждый кусок — одна векторизация и один вызов модели,
+# результат дописывается в выходной файл сразу; в памяти не больше (workers * 2 + 1) кусков
+
+_PARQUET = (".parquet", ".pq")
+
+_registry: Registry | None = None
+
+def _init(backend: str) -> None:
+    global _registry
+    if _registry is None:
+        _registry = Registry(backend=backend)
+
+# выполняется в процессе пула (или в текущем при --workers 0)
+def score_chunk(analysis: str, model: str, df: pd.DataFrame) -> Tuple[np.ndarray, List[List[str]], Optional[str]]:
+    probs, _, version, missing = _registry.predict_frame(analysis, model, df)
+    return probs, missing, version
+
+def read_chunks(path: Path, chunk_rows: int, columns: List[str]) -> Iterator[pd.DataFrame]:
+    if path.suffix.lower() in _PARQUET:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("для Parquet нужен pyarrow: pip install pyarrow")
+        pf = pq.ParquetFile(path)
+        cols = [c for c in columns if c in pf.schema_arrow.names]
+        for b in pf.iter_batches(batch_size=chunk_rows, columns=cols):
+            yield b.to_pandas()
+        return
+    yield from pd.read_csv(path, chunksize=chunk_rows, usecols=lambda c: c in columns)
+
+# CSV дописывается кусками, Parquet — row group на кусок
+class ChunkWriter:
+    def __init__(self, path: Path):
+        self.path = path
+        self.parquet = path.suffix.lower() in _PARQUET
+        self._f = None
+        self._pq = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            t = pa.Table.from_pandas(df, preserve_index=False)
+            if self._pq is None:
+                self._pq = pq.ParquetWriter(self.path, t.schema)
+            else:
+                # типы колонок из --keep могут «плавать» между кусками — держим схему первого
+                t = t.cast(self._pq.schema)
+            self._pq.write_table(t)
+            return
+        if self._f is None:
+            self._f = open(self.path, "w", newline="", encoding="utf-8")
+            df.to_csv(self._f, index=False)
+        else:
+            df.to_csv(self._f, index=False, header=False)
+
+    def close(self) -> None:
+        if self._pq is not None:
+            self._pq.close()
+        if self._f is not None:
+            self._f.close()
+
+def run(input: Path, output: Path, rejects: Path, analysis: str, model: Optional[str], backend: str,
+        chunk_rows: int = 100_000, workers: int = 0, keep: Optional[List[str]] = None,
+        progress_sec: float = 5.0) -> dict:
+    keep = keep or []
+    _init(backend)
+    try:
+        name = _registry.resolve(analysis, model)
+    except KeyError as e:
+        raise SystemExit(str(e))
+    # fork: модель грузится до форка, воркеры делят её страницы copy-on-write
+    _registry.items[analysis][name].get()
+    order = FEATURES[analysis]
+
+    ex: ProcessPoolExecutor | None = None
+    if workers > 0:
+        method = "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+        ex = ProcessPoolExecutor(workers, mp_context=mp.get_context(method), initializer=_init, initargs=(backend,))
+
+    writer = ChunkWriter(output)
+    stats = {"rows": 0, "scored": 0, "rejected": 0}
+    version: Optional[str] = None
+    t0 = last = time.perf_counter()
+
+    def emit(start: int, kept: Optional[pd.DataFrame], result: Tuple[np.ndarray, List[List[str]], Optional[str]]) -> None:
+        nonlocal version, last
+        probs, missing, v = result
+        version = version or v
+        ok = probs >= 0.0
+        out = pd.DataFrame({"row": np.arange(start, start + len(probs))[ok]})
+        for c in keep:
+            out[c] = kept[c].to_numpy()[ok] if kept is not None and c in kept.columns else None
+        out["risk"] = probs[ok]
+        out["risk_category"] = bucket_array(probs[ok])
+        writer.write(out)
+        for i in np.nonzero(~ok)[0]:
+            rej.writerow([start + int(i), missing_detail(missing[i])])
+        stats["rows"] += len(probs)
+        stats["scored"] += int(ok.sum())
+        stats["rejected"] += int((~ok).sum())
+        now = time.perf_counter()
+        if progress_sec > 0 and now - last >= progress_sec:
+            last = now
+            print(f"{stats['rows']} rows, {stats['rows'] / (now - t0):.0f} rows/s", file=sys.stderr)
+
+    pending: deque[Tuple[int, Optional[pd.DataFrame], Future]] = deque()
+    try:
+        with open(rejects, "w", newline="", encoding="utf-8") as rf:
+            rej = csv.writer(rf)
+            rej.writerow(["row", "reason"])
+            start = 0
+            for chunk in read_chunks(input, chunk_rows, order + keep):
+                feats = chunk[[c for c in order if c in chunk.columns]]
+                kept = chunk[[c for c in keep if c in chunk.columns]] if keep else None
+                if ex is None:
+                    emit(start, kept, score_chunk(analysis, name, feats))
+                else:
+                    pending.append((start, kept, ex.submit(score_chunk, analysis, name, feats)))
+                    # порядок строк в выходе сохраняется: ждём самый старый кусок
+                    while len(pending) > 2 * workers:
+                        s, k, f = pending.popleft()
+                        emit(s, k, f.result())
+                start += len(chunk)
+            while pending:
+                s, k, f = pending.popleft()
+                emit(s, k, f.result())
+    finally:
+        writer.close()
+        if ex is not None:
+            ex.shutdown(cancel_futures=True)
+
+    if stats["rows"] == 0:
+        # пустой вход — всё равно оставляем файл с заголовком
+        writer = ChunkWriter(output)
+        writer.write(pd.DataFrame(columns=["row", *keep, "risk", "risk_category"]))
+        writer.close()
+    elapsed = time.perf_counter() - t0
+    return {
+        **stats,
+        "analysis_type": analysis,
+        "model": name,
+        "model_version": version,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(stats["rows"] / elapsed, 1) if elapsed > 0 else None,
+        "output": str(output),
+        "rejects": str(rejects),
+    }
+
+# python -m app.bulk cohort.csv scored.csv --analysis heart --workers 4
+def main() -> None:
+    from config import settings
+    parser = argparse.ArgumentParser(description="пакетный скоринг CSV/Parquet теми же моделями, что и API")
+    parser.add_argument("input", type=Path)
+    parser.add_argument("output", type=Path, help=".csv или .parquet")
+    parser.add_argument("--analysis", required=True, choices=sorted(FEATURES))
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--backend", default=settings.MODEL_BACKEND, choices=("sklearn", "native"))
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=0, help="процессы для скоринга кусков (0 — в текущем)")
+    parser.add_argument("--keep", default="", help="колонки входа, переносимые в выход, через запятую")
+    parser.add_argument("--rejects", type=Path, default=None, help="по умолчанию <output>.rejects.csv")
+    parser.add_argument("--progress-sec", type=float, default=5.0)
+    args = parser.parse_args()
+
+    summary = run(
+        args.input, args.output,
+        args.rejects or args.output.with_name(args.output.stem + ".rejects.csv"),
+        args.analysis, args.model, args.backend,
+        chunk_rows=args.chunk_rows, workers=args.workers,
+        keep=[c.strip() for c in args.keep.split(",") if c.strip()],
+        progress_sec=args.progress_sec,
+    )
+    print(json.dumps(summary, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,54 @@
 from __future__ import annotations
+import hashlib
+import io
+import logging
+import threading
+import time
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Tuple
 import numpy as np
 import pandas as pd
 import joblib
 
-# схема признаков по типу анализов
+from app.cache import PredictionCache
+from app.metrics import Metrics
+from app.trees import TreeEnsemble, sidecar_path
+
+log = logging.getLogger("uvicorn.error")
+
+# схема признаков по типу анализов (вход API)
 FEATURES: Dict[str, List[str]] = {
     "heart": [
         "age","height","weight","ap_hi","ap_lo",
-        "cholesterol","gluc","smoke","alco","active"
+        "cholesterol","gluc","smoke","alco","active","gender"
     ],
     "diabetes": [
         "Age","Gender","BMI","Chol","TG","HDL","LDL","Cr","BUN"
     ],
 }
+# необязательные признаки: не пришёл (или null) — NaN, модель идёт по своей ветке для пропуска
+OPTIONAL: Dict[str, Tuple[str, ...]] = {"heart": ("gender",)}
+# колонки, на которых обучена модель (feature_names_in_), если они не совпадают со входом API.
+# heart.joblib обучен на cardio: возраст в днях, пол 1 — ж / 2 — м, ap_diff = ap_hi - ap_lo
+MODEL_COLUMNS: Dict[str, List[str]] = {
+    "heart": [
+        "age","gender","height","weight","ap_hi","ap_lo",
+        "cholesterol","gluc","smoke","alco","active","ap_diff"
+    ],
+}
+DAYS_PER_YEAR = 365.25
+# колонка модели из входа после правил; считается и на числах (vectorize), и на столбцах (FeatureSchema)
+DERIVED: Dict[str, Dict[str, Callable[[Dict[str, Any]], Any]]] = {
+    "heart": {
+        "age": lambda c: c["age"] * DAYS_PER_YEAR,
+        "gender": lambda c: c["gender"] + 1.0,      # вход API: 0 — ж, 1 — м (как Gender у диабета)
+        "ap_diff": lambda c: c["ap_hi"] - c["ap_lo"],
+    },
+}
+
+def model_columns(analysis: str) -> List[str]:
+    return MODEL_COLUMNS.get(analysis, FEATURES[analysis])
 # приведение к флоту
 def _coerce(x) -> float:
     if isinstance(x, bool): return 1.0 if x else 0.0
@@ -26,14 +60,18 @@ def _clamp(v: float, lo: float, hi: float) -> float:
 # подготовка признаокв
 def vectorize(analysis: str, features: Dict[str, object]) -> Tuple[pd.DataFrame, List[str]]:
     order = FEATURES[analysis]
+    cols = model_columns(analysis)
+    optional = OPTIONAL.get(analysis, ())
     missing, row = [], []
     for k in order:
+        if k in optional and features.get(k) is None:
+            row.append(np.nan); continue
         if k not in features:
             missing.append(k); row.append(np.nan); continue
         try: row.append(_coerce(features[k]))
         except: missing.append(k); row.append(np.nan)
     if missing:
-        return pd.DataFrame(columns=order), missing
+        return pd.DataFrame(columns=cols), missing
     d = dict(zip(order, row))
 
     if analysis == "heart":
@@ -45,6 +83,7 @@ def vectorize(analysis: str, features: Dict[str, object]) -> Tuple[pd.DataFrame,
         d["ap_lo"]=min(d["ap_lo"], d["ap_hi"]-1.0)
         for c in ("cholesterol","gluc"): d[c]=_clamp(round(d[c]),1,3)
         for b in ("smoke","alco","active"): d[b]=1.0 if d[b]>=0.5 else 0.0
+        if not np.isnan(d["gender"]): d["gender"]=_clamp(round(d["gender"]),0,1)
 
     elif analysis == "diabetes":
         d["Age"]=_clamp(d["Age"],1,120)
@@ -52,62 +91,531 @@ def vectorize(analysis: str, features: Dict[str, object]) -> Tuple[pd.DataFrame,
         d["BMI"]=_clamp(d["BMI"],10,80)
         # Остальные приведены к флоту без жёстких границ
 
-    X = pd.DataFrame([[d[c] for c in order]], columns=order)
+    derived = DERIVED.get(analysis, {})
+    X = pd.DataFrame([[derived[c](d) if c in derived else d[c] for c in cols]], columns=cols)
     return X, []
-# оборачивает модель в класс
-class WrappedModel:
-    def __init__(self, path: Path):
-        self.name = path.stem
-        self.path = path
-        self.model = joblib.load(path)
+
+# legacy для пачки: построчный vectorize, годные строки склеиваются в один DataFrame
+def _legacy_batch(analysis: str, rows: List[Dict[str, object]]) -> Tuple[pd.DataFrame, List[List[str]]]:
+    parts = [vectorize(analysis, r) for r in rows]
+    ok = [X for X, miss in parts if not miss]
+    X = pd.concat(ok, ignore_index=True) if ok else pd.DataFrame(columns=model_columns(analysis))
+    return X, [miss for _, miss in parts]
+
+# категория риска по вероятности — общая для API и bulk-скоринга
+RISK_EDGES = (0.33, 0.66)
+
+def bucket(p: float) -> str:
+    if p < RISK_EDGES[0]: return "low"
+    if p < RISK_EDGES[1]: return "medium"
+    return "high"
+
+def bucket_array(p: np.ndarray) -> np.ndarray:
+    return np.select([p < RISK_EDGES[0], p < RISK_EDGES[1]], ["low", "medium"], "high")
+
+def missing_detail(missing: List[str]) -> str:
+    return f"Отсутствуют признаки: {', '.join(missing)}"
+# правило для одного признака: границы, округление, бинаризация
+@dataclass(frozen=True)
+class Rule:
+    lo: float = -np.inf
+    hi: float = np.inf
+    round: bool = False
+    binary: bool = False
+
+# те же правила, что зашиты в vectorize; пары (a, b, gap) означают a <= b - gap
+RULES: Dict[str, Dict[str, Rule]] = {
+    "heart": {
+        "age": Rule(1, 120), "height": Rule(50, 250), "weight": Rule(20, 300),
+        "ap_hi": Rule(50, 250), "ap_lo": Rule(30, 200),
+        "cholesterol": Rule(1, 3, round=True), "gluc": Rule(1, 3, round=True),
+        "smoke": Rule(binary=True), "alco": Rule(binary=True), "active": Rule(binary=True),
+        "gender": Rule(0, 1, round=True),
+    },
+    "diabetes": {
+        "Age": Rule(1, 120), "Gender": Rule(binary=True), "BMI": Rule(10, 80),
+    },
+}
+PAIRS: Dict[str, List[Tuple[str, str, float]]] = {
+    "heart": [("ap_lo", "ap_hi", 1.0)],
+}
+# скомпилированная схема признаков: собирается один раз при старте Registry.
+# order — вход API (правила считаются по нему), names — колонки модели (с производными)
+class FeatureSchema:
+    dtype = np.float32
+
+    def __init__(self, analysis: str):
+        self.analysis = analysis
+        self.order = FEATURES[analysis]
+        self.names = model_columns(analysis)
+        self.optional = set(OPTIONAL.get(analysis, ()))
+        rules = [RULES.get(analysis, {}).get(k, Rule()) for k in self.order]
+        self.lo = np.array([r.lo for r in rules])
+        self.hi = np.array([r.hi for r in rules])
+        self.round_idx = np.array([j for j, r in enumerate(rules) if r.round], dtype=np.intp)
+        self.bin_idx = np.array([j for j, r in enumerate(rules) if r.binary], dtype=np.intp)
+        pos = {k: j for j, k in enumerate(self.order)}
+        self.pairs = [(pos[a], pos[b], gap) for a, b, gap in PAIRS.get(analysis, [])]
+        # колонка модели: (индекс во входе, None) или (None, формула из DERIVED)
+        derived = DERIVED.get(analysis, {})
+        self._plan = [(None, derived[c]) if c in derived else (pos[c], None) for c in self.names]
+        self._identity = self.names == self.order
+        self._local = threading.local()
+
+    # буферы на поток: обработчики /predict крутятся в тредпуле
+    def _buffers(self) -> Tuple[np.ndarray, np.ndarray]:
+        buf = getattr(self._local, "buf", None)
+        if buf is None:
+            buf = self._local.buf = (np.empty((1, len(self.order))), np.empty((1, len(self.names)), dtype=self.dtype))
+        return buf
+
+    # правила считаются во float64 (как в vectorize), min/max с питоновской семантикой для nan
+    def apply(self, X: np.ndarray) -> None:
+        for j in self.round_idx: X[:, j] = np.round(X[:, j])
+        np.copyto(X, self.lo, where=self.lo > X)
+        np.copyto(X, self.hi, where=self.hi < X)
+        if len(self.bin_idx): X[:, self.bin_idx] = X[:, self.bin_idx] >= 0.5
+        for a, b, gap in self.pairs:
+            cap = X[:, b] - gap
+            np.copyto(X[:, a], cap, where=cap < X[:, a])
+
+    # вход после правил -> колонки модели (производные считаются во float64, приводятся при записи в out)
+    def project(self, X: np.ndarray, out: np.ndarray) -> np.ndarray:
+        if self._identity:
+            out[:] = X
+            return out
+        cols = {k: X[:, j] for j, k in enumerate(self.order)}
+        for j, (src, fn) in enumerate(self._plan):
+            out[:, j] = X[:, src] if fn is None else fn(cols)
+        return out
+
+    # одна строка прямо в переиспользуемый float32-буфер, без DataFrame
+    def row(self, features: Dict[str, object]) -> Tuple[np.ndarray, List[str]]:
+        tmp, out = self._buffers()
+        missing = []
+        for j, k in enumerate(self.order):
+            x = features.get(k)
+            if x is None:
+                if k in self.optional: tmp[0, j] = np.nan
+                else: missing.append(k)
+                continue
+            try: tmp[0, j] = _coerce(x)
+            except: missing.append(k)
+        if missing:
+            return out[:0], missing
+        self.apply(tmp)
+        return self.project(tmp, out), []
+
+    # пакет: годные строки одной матрицей + пропущенные признаки по каждой строке
+    def batch(self, rows: List[Dict[str, object]]) -> Tuple[np.ndarray, List[List[str]]]:
+        X = np.empty((len(rows), len(self.order)))
+        bad = np.zeros(X.shape, dtype=bool)
+        for j, k in enumerate(self.order):
+            values = [r.get(k) for r in rows]
+            X[:, j], bad[:, j] = _coerce_col(values)
+            if k in self.optional:
+                bad[:, j] &= np.fromiter((v is not None for v in values), dtype=bool, count=len(values))
+        return self._finish(X, bad)
+
+    # чанк DataFrame (bulk-скоринг): NaN и отсутствующая колонка — пропуск, как отсутствующий ключ в API
+    def frame(self, df: pd.DataFrame) -> Tuple[np.ndarray, List[List[str]]]:
+        X = np.empty((len(df), len(self.order)))
+        bad = np.zeros(X.shape, dtype=bool)
+        for j, k in enumerate(self.order):
+            if k not in df.columns:
+                X[:, j] = np.nan
+                bad[:, j] = k not in self.optional
+                continue
+            s = df[k]
+            if s.dtype.kind in "biuf":
+                X[:, j] = s.to_numpy(np.float64, na_value=np.nan)
+                bad[:, j] = s.isna().to_numpy()
+            else:
+                X[:, j], bad[:, j] = _coerce_col(s.astype(object).where(s.notna(), None).tolist())
+            if k in self.optional:
+                bad[:, j] &= s.notna().to_numpy()
+        return self._finish(X, bad)
+
+    def _finish(self, X: np.ndarray, bad: np.ndarray) -> Tuple[np.ndarray, List[List[str]]]:
+        missing: List[List[str]] = [[] for _ in range(len(X))]
+        for i, j in zip(*np.nonzero(bad)):
+            missing[i].append(self.order[j])
+        X = X[~bad.any(axis=1)]
+        self.apply(X)
+        return self.project(X, np.empty((len(X), len(self.names)), dtype=self.dtype)), missing
+# столбец к флоту: быстрый путь через numpy, иначе поштучно через _coerce
+def _coerce_col(values: List[object]) -> Tuple[np.ndarray, np.ndarray]:
+    bad = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+    if not bad.any():
+        try:
+            col = np.asarray(values, dtype=np.float64)
+            if col.ndim == 1: return col, bad
+        except (TypeError, ValueError):
+            pass
+    col = np.full(len(values), np.nan)
+    for i, x in enumerate(values):
+        if bad[i]: continue
+        try: col[i] = _coerce(x)
+        except: bad[i] = True
+    return col, bad
+# версия модели — хэш содержимого файла
+def _content_version(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+# загруженная модель: то, что держим в памяти и выгружаем при простое
+class LoadedModel:
+    def __init__(self, path: Path, backend: str = "sklearn"):
+        self.path, self.backend = path, backend
+        self.native: TreeEnsemble | None = None
+        self.booster, self.iteration_range, self.columns = None, (0, 0), []
         self.pos_idx = 1
+        # native: деревья из heart.trees.npz, ни joblib, ни xgboost не импортируются.
+        # joblib только хэшируется: деревья, выгруженные из другой его версии, не обслуживаем
+        if backend == "native" and sidecar_path(path).exists():
+            data = sidecar_path(path).read_bytes()
+            self.version = _content_version(data)
+            self.model = None
+            self.native = TreeEnsemble.load(io.BytesIO(data))
+            source = _content_version(path.read_bytes())
+            if self.native.source != source:
+                raise RuntimeError(
+                    f"{sidecar_path(path).name} is stale: exported from {path.name} version {self.native.source}, "
+                    f"file on disk is {source}; re-export with python -m app.trees {path}")
+            return
+        data = path.read_bytes()
+        self.version = _content_version(data)
+        self.model = joblib.load(io.BytesIO(data))
         if hasattr(self.model, "classes_"):
             arr = np.asarray(self.model.classes_)
             where = np.where(arr == 1)[0]
             self.pos_idx = int(where[0]) if len(where) else len(arr) - 1
+        # xgboost: кормим бустер напрямую, минуя sklearn-обёртку
+        if hasattr(self.model, "get_booster"):
+            self.booster = self.model.get_booster()
+            try: self.iteration_range = (0, int(self.model.best_iteration) + 1)
+            except AttributeError: pass
+            if backend == "native":
+                self.native = TreeEnsemble.from_booster(self.booster, self.iteration_range)
+        # sklearn-модели, обученные на DataFrame, ждут имена колонок
+        self.columns = [] if self.booster is not None else list(getattr(self.model, "feature_names_in_", []))
+
+    # колонки модели против схемы (model_columns): расхождение — ошибка при загрузке, а не на каждом запросе
+    def check_columns(self, expected: List[str]) -> None:
+        if self.native is not None:
+            names, n = self.native.feature_names, self.native.n_features or None
+        else:
+            names = list(getattr(self.model, "feature_names_in_", []))
+            n = getattr(self.model, "n_features_in_", None)
+        if (names and names != expected) or (n is not None and n != len(expected)):
+            raise RuntimeError(f"{self.path.name} expects {n} features {names or ''}, "
+                               f"schema gives {len(expected)}: {expected}")
+
+    def proba_pos(self, X: pd.DataFrame | np.ndarray) -> float:
+        return float(self.proba_pos_batch(X)[0])
 
-    def proba_pos(self, X: pd.DataFrame) -> float:
+    def proba_pos_batch(self, X: pd.DataFrame | np.ndarray) -> np.ndarray:
+        if self.native is not None:
+            p = self.native.predict(X.to_numpy(np.float32) if isinstance(X, pd.DataFrame) else X)
+            return np.clip(p if self.pos_idx == 1 else 1.0 - p, 0.0, 1.0)
+        if self.booster is not None and isinstance(X, np.ndarray):
+            p = np.asarray(self.booster.inplace_predict(X, iteration_range=self.iteration_range))
+            p = p[:, self.pos_idx] if p.ndim == 2 else (p if self.pos_idx == 1 else 1.0 - p)
+            return np.clip(p.astype(np.float64), 0.0, 1.0)
+        if self.columns and isinstance(X, np.ndarray):
+            X = pd.DataFrame(X, columns=self.columns)
         if hasattr(self.model, "predict_proba"):
-            p = float(self.model.predict_proba(X)[0][self.pos_idx])
+            p = np.asarray(self.model.predict_proba(X))[:, self.pos_idx]
         else:
-            p = float(self.model.predict(X)[0])
-        return float(min(max(p, 0.0), 1.0))
+            p = np.asarray(self.model.predict(X), dtype=np.float64).ravel()
+        return np.clip(p.astype(np.float64), 0.0, 1.0)
+
+# ленивая ручка на файл модели: при сканировании только метаданные, загрузка при первом predict
+class WrappedModel:
+    def __init__(self, path: Path, backend: str = "sklearn", on_load: Callable[["WrappedModel"], None] | None = None,
+                 columns: List[str] | None = None):
+        self.name = path.stem
+        self.path = path
+        self.backend = backend
+        # колонки, которые подаёт схема анализа; None — не сверяем
+        self.columns = columns
+        # native: и .trees.npz, и joblib — замена любого из них должна дойти до перезагрузки
+        srcs = [path]
+        if backend == "native" and sidecar_path(path).exists():
+            srcs.insert(0, sidecar_path(path))
+        stats = [p.stat() for p in srcs]
+        self.size = stats[0].st_size
+        self.fingerprint = tuple((str(p), st.st_mtime_ns, st.st_size) for p, st in zip(srcs, stats))
+        self.last_used = 0.0
+        self._on_load = on_load
+        self._loaded: LoadedModel | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded is not None
+
+    # загрузка под локом модели; вызывающий держит ссылку, так что выгрузка посреди predict безопасна
+    def get(self) -> LoadedModel:
+        self.last_used = time.monotonic()
+        m = self._loaded
+        if m is not None:
+            return m
+        with self._lock:
+            m = self._loaded
+            if m is None:
+                m = LoadedModel(self.path, self.backend)
+                if self.columns is not None:
+                    m.check_columns(self.columns)
+                self._loaded = m
+                fresh = True
+            else:
+                fresh = False
+        if fresh and self._on_load is not None:
+            self._on_load(self)
+        return m
+
+    def evict(self) -> bool:
+        with self._lock:
+            was, self._loaded = self._loaded is not None, None
+        return was
+
+    @property
+    def version(self) -> str:
+        return self.get().version
+
+    def proba_pos(self, X: pd.DataFrame | np.ndarray) -> float:
+        return self.get().proba_pos(X)
+
+    def proba_pos_batch(self, X: pd.DataFrame | np.ndarray) -> np.ndarray:
+        return self.get().proba_pos_batch(X)
+
+    def info(self) -> Dict[str, object]:
+        m = self._loaded
+        return {"loaded": m is not None, "version": m.version if m is not None else None, "size_bytes": self.size}
 
 class Registry:
 
-    def __init__(self):
-        base = Path(__file__).resolve().parents[1] / "model"
-        self.items: Dict[str, Dict[str, WrappedModel]] = {"heart": {}, "diabetes": {}}
+    def __init__(self, legacy: bool = False, backend: str = "sklearn", cache_size: int = 0, cache_ttl: float = 300.0,
+                 idle_evict_sec: float = 0.0, memory_budget_bytes: int = 0, metrics: Metrics | None = None):
+        # legacy: старый путь vectorize -> DataFrame, оставлен для A/B сравнения
+        self.legacy = legacy
+        self.backend = backend
+        self.cache = PredictionCache(cache_size, cache_ttl)
+        # выгрузка: по простою и по бюджету памяти (оценка — размер файла); 0 — без ограничений
+        self.idle_evict_sec = idle_evict_sec
+        self.memory_budget_bytes = memory_budget_bytes
+        self.evictions = 0
+        self._stop = threading.Event()
+        self._janitor: threading.Thread | None = None
+        self._watcher: threading.Thread | None = None
+        self._reload_lock = threading.Lock()
+        self.reloads = 0
+        # пул процессов инференса (app.workers.WorkerPool), если включён
+        self.pool = None
+        # тайминги стадий vectorize/infer (app.metrics.Metrics); None — не меряем (bulk, бенчмарки)
+        self.metrics = metrics
+        self.schemas: Dict[str, FeatureSchema] = {a: FeatureSchema(a) for a in FEATURES}
+        self.base = Path(__file__).resolve().parents[1] / "model"
+        # карта моделей целиком подменяется при перезагрузке; запросы работают со снимком
+        self.items: Dict[str, Dict[str, WrappedModel]] = {
+            a: {p.stem: WrappedModel(p, backend, self._on_load, model_columns(a)) for p in paths}
+            for a, paths in self._scan().items()
+        }
 
+    def _scan(self) -> Dict[str, List[Path]]:
+        found: Dict[str, List[Path]] = {}
         for analysis in FEATURES.keys():
-            folder = base / analysis
+            folder = self.base / analysis
+            found[analysis] = []
             if folder.exists():
                 for pattern in ("*.pkl","*.joblib"):
-                    for p in sorted(folder.glob(pattern)):
-                        self.items[analysis][p.stem] = WrappedModel(p)
+                    found[analysis].extend(sorted(folder.glob(pattern)))
+        return found
 
-        self.defaults: Dict[str, str] = {}
-        for analysis in FEATURES.keys():
-            names = list(self.items[analysis].keys())
-            self.defaults[analysis] = names[0] if names else ""
+    # пересканировать папки: новые/изменённые файлы грузятся здесь (в фоне), затем атомарная подмена карты
+    def reload(self) -> Dict[str, List[str]]:
+        with self._reload_lock:
+            old = self.items
+            new: Dict[str, Dict[str, WrappedModel]] = {}
+            diff: Dict[str, List[str]] = {"added": [], "changed": [], "removed": [], "failed": []}
+            for analysis, paths in self._scan().items():
+                new[analysis] = {}
+                for p in paths:
+                    cur = old.get(analysis, {}).get(p.stem)
+                    try:
+                        h = WrappedModel(p, self.backend, self._on_load, model_columns(analysis))
+                    except FileNotFoundError:
+                        continue
+                    if cur is not None and cur.path == h.path and cur.fingerprint == h.fingerprint:
+                        new[analysis][p.stem] = cur
+                        continue
+                    # прогреваем, если старая версия была в памяти, чтобы трафик не платил за загрузку
+                    if cur is not None and cur.loaded:
+                        try:
+                            h.get()
+                        except Exception as e:
+                            log.error("model reload failed for %s: %s", p, e)
+                            diff["failed"].append(f"{analysis}/{p.stem}")
+                            if cur is not None: new[analysis][p.stem] = cur
+                            continue
+                    new[analysis][p.stem] = h
+                    diff["changed" if cur is not None else "added"].append(f"{analysis}/{p.stem}")
+                for name in old.get(analysis, {}):
+                    if name not in new[analysis]:
+                        diff["removed"].append(f"{analysis}/{name}")
+            self.items = new
+            for key in diff["changed"] + diff["removed"]:
+                analysis, name = key.split("/", 1)
+                self.cache.invalidate(analysis, name)
+            if any(diff[k] for k in ("added", "changed", "removed")):
+                self.reloads += 1
+                log.info("models reloaded: %s", diff)
+            return diff
+
+    # опрос папок с моделями (polling)
+    def start_watcher(self, interval: float) -> None:
+        if interval <= 0 or self._watcher is not None:
+            return
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.reload()
+                except Exception as e:
+                    log.error("model watcher error: %s", e)
+        self._watcher = threading.Thread(target=loop, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def handles(self) -> List[WrappedModel]:
+        return [m for v in self.items.values() for m in v.values()]
+
+    # после загрузки: вытесняем давно не использованные модели, пока не влезем в бюджет
+    def _on_load(self, fresh: WrappedModel) -> None:
+        if self.memory_budget_bytes <= 0:
+            return
+        loaded = sorted((m for m in self.handles() if m.loaded and m is not fresh), key=lambda m: m.last_used)
+        total = fresh.size + sum(m.size for m in loaded)
+        for m in loaded:
+            if total <= self.memory_budget_bytes: break
+            if m.evict():
+                self.evictions += 1
+                total -= m.size
+
+    def evict_idle(self) -> int:
+        if self.idle_evict_sec <= 0:
+            return 0
+        border = time.monotonic() - self.idle_evict_sec
+        n = sum(1 for m in self.handles() if m.loaded and m.last_used < border and m.evict())
+        self.evictions += n
+        return n
+
+    def start_janitor(self, interval: float = 10.0) -> None:
+        if self.idle_evict_sec <= 0 or self._janitor is not None:
+            return
+        def loop():
+            while not self._stop.wait(interval):
+                self.evict_idle()
+        self._janitor = threading.Thread(target=loop, name="model-janitor", daemon=True)
+        self._janitor.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    # для /health: ничего не загружает
+    def status(self) -> Dict[str, Dict[str, Dict[str, object]]]:
+        return {a: {n: m.info() for n, m in v.items()} for a, v in self.items.items()}
 
     def available(self) -> Dict[str, List[str]]:
         return {k: list(v.keys()) for k,v in self.items.items()}
 
     def default_for(self, analysis: str) -> str:
-        return self.defaults.get(analysis, "")
+        return next(iter(self.items.get(analysis, {})), "")
 
-    def predict(self, analysis: str, model_name: str | None, features: Dict[str, object]) -> Tuple[float, str, List[str]]:
+    # имя и ручка модели из одного снимка карты — подмена посреди запроса ему не мешает
+    def _handle(self, analysis: str, model_name: str | None) -> Tuple[str, WrappedModel]:
+        items = self.items
         if analysis not in FEATURES:
             raise KeyError(f"unknown analysis_type '{analysis}'")
-        if not self.items.get(analysis):
+        if not items.get(analysis):
             raise KeyError(f"no models for analysis_type '{analysis}'")
-        name = model_name or self.default_for(analysis)
-        if name not in self.items[analysis]:
+        name = model_name or next(iter(items[analysis]))
+        if name not in items[analysis]:
             raise KeyError(f"unknown model '{name}' for analysis_type '{analysis}'")
+        return name, items[analysis][name]
 
-        X, missing = vectorize(analysis, features)
+    def resolve(self, analysis: str, model_name: str | None) -> str:
+        return self._handle(analysis, model_name)[0]
+
+    def predict(self, analysis: str, model_name: str | None, features: Dict[str, object]) -> Tuple[float, str, str | None, List[str]]:
+        name, h = self._handle(analysis, model_name)
+
+        t = time.perf_counter()
+        if self.legacy:
+            X, missing = vectorize(analysis, features)
+        else:
+            X, missing = self.schemas[analysis].row(features)
+        self._stage("vectorize", analysis, name, time.perf_counter() - t)
         if missing:
-            return -1.0, name, missing
-        prob = self.items[analysis][name].proba_pos(X)
-        return prob, name, []
+            return -1.0, name, None, missing
+        m = h.get()
+        if not self.cache.enabled:
+            return float(self._infer(m, X)[0]), name, m.version, []
+        # после vectorize вход уже канонический (округлён, обрезан) — по нему и ключ
+        key = (analysis, name, m.version, np.asarray(X, dtype=np.float32).tobytes())
+        prob = self.cache.get(key)
+        if prob is None:
+            prob = float(self._infer(m, X)[0])
+            self.cache.put(key, prob)
+        return prob, name, m.version, []
+
+    # пакетный скоринг: строки с пропусками получают -1.0 и свой список missing, остальные один predict_proba
+    def predict_batch(self, analysis: str, model_name: str | None, rows: List[Dict[str, object]]) -> Tuple[List[float], str, str | None, List[List[str]]]:
+        name, h = self._handle(analysis, model_name)
+
+        t = time.perf_counter()
+        X, missing = _legacy_batch(analysis, rows) if self.legacy else self.schemas[analysis].batch(rows)
+        self._stage("vectorize", analysis, name, time.perf_counter() - t)
+        probs = np.full(len(rows), -1.0)
+        version = None
+        if len(X):
+            m = h.get()
+            version = m.version
+            ok = np.fromiter((not x for x in missing), dtype=bool, count=len(rows))
+            probs[ok] = self._proba_cached(analysis, name, m, X)
+        return probs.tolist(), name, version, missing
+
+    # то же для чанка DataFrame (app.bulk): вероятности массивом, без кэша — строки файла не повторяются
+    def predict_frame(self, analysis: str, model_name: str | None, df: pd.DataFrame) -> Tuple[np.ndarray, str, str | None, List[List[str]]]:
+        name, h = self._handle(analysis, model_name)
+
+        X, missing = self.schemas[analysis].frame(df)
+        probs = np.full(len(df), -1.0)
+        version = None
+        if len(X):
+            m = h.get()
+            version = m.version
+            ok = np.fromiter((not x for x in missing), dtype=bool, count=len(df))
+            probs[ok] = self._infer(m, X)
+        return probs, name, version, missing
+
+    # кэш по строкам: модель вызывается только для промахов
+    def _proba_cached(self, analysis: str, name: str, m: LoadedModel, X: np.ndarray) -> np.ndarray:
+        if not self.cache.enabled:
+            return self._infer(m, X)
+        keys = [(analysis, name, m.version, row.tobytes()) for row in np.asarray(X, dtype=np.float32)]
+        out = np.array([self.cache.get(k) for k in keys], dtype=np.float64)
+        miss = np.isnan(out)
+        if miss.any():
+            out[miss] = self._infer(m, X[miss])
+            for k, p in zip((k for k, f in zip(keys, miss) if f), out[miss]):
+                self.cache.put(k, float(p))
+        return out
+
+    # в процессе или в пуле воркеров
+    def _infer(self, m: LoadedModel, X: pd.DataFrame | np.ndarray) -> np.ndarray:
+        t = time.perf_counter()
+        p = m.proba_pos_batch(X) if self.pool is None else self.pool.infer(m, X)
+        self._stage("infer", m.path.parent.name, m.path.stem, time.perf_counter() - t)
+        return p
+
+    def _stage(self, stage: str, analysis: str, name: str, sec: float) -> None:
+        if self.metrics is not None:
+            self.metrics.stage(stage, analysis, name, sec)
@@ -0,0 +1,183 @@
+from __future__ import annotations
+import argparse
+import io
+import json
+from pathlib import Path
+from typing import List, Optional, Tuple
+import numpy as np
+
+# целевые функции, которые умеем считать без xgboost
+_LOGISTIC = ("binary:logistic", "reg:logistic")
+_RAW = ("binary:logitraw", "reg:squarederror")
+_ROW_CHUNK = 4096
+
+# файл с деревьями рядом с моделью: heart.joblib -> heart.trees.npz
+def sidecar_path(path: Path) -> Path:
+    return path.with_name(f"{path.stem}.trees.npz")
+
+# ансамбль деревьев, развёрнутый в плоские массивы; листья ссылаются сами на себя
+class TreeEnsemble:
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray, right: np.ndarray,
+                 default_left: np.ndarray, value: np.ndarray, roots: np.ndarray, depth: int,
+                 base_margin: float, logistic: bool, feature_names: List[str], source: Optional[str] = None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.base_margin = base_margin
+        self.logistic = logistic
+        self.feature_names = feature_names
+        # версия (хэш содержимого) joblib, из которого выгружены деревья: по нему ловим устаревший .trees.npz
+        self.source = source
+        # дети парами [left, right] — переход одним take по 2 * idx + go_right
+        self._children = np.stack([left, right], axis=1).ravel().astype(np.intp)
+        self._roots = roots.astype(np.intp)
+
+    @property
+    def n_features(self) -> int:
+        return len(self.feature_names)
+
+    # экспорт из xgboost.Booster через его JSON-дамп (точные float32-пороги)
+    @classmethod
+    def from_booster(cls, booster, iteration_range: Tuple[int, int] = (0, 0)) -> "TreeEnsemble":
+        learner = json.loads(booster.save_raw("json"))["learner"]
+        objective = learner["objective"]["name"]
+        if objective not in _LOGISTIC + _RAW:
+            raise ValueError(f"unsupported objective '{objective}'")
+        gb = learner["gradient_booster"]
+        if gb["name"] != "gbtree":
+            raise ValueError(f"unsupported booster '{gb['name']}'")
+        trees = gb["model"]["trees"]
+        per_round = int(gb["model"]["gbtree_model_param"].get("num_parallel_tree", 1))
+        if iteration_range[1] > 0:
+            trees = trees[iteration_range[0] * per_round: iteration_range[1] * per_round]
+
+        feature, threshold, left, right, dleft, value, roots = [], [], [], [], [], [], []
+        depth, offset = 0, 0
+        for t in trees:
+            if any(t.get("split_type", [])):
+                raise ValueError("categorical splits are not supported")
+            lc = np.asarray(t["left_children"], dtype=np.int32)
+            rc = np.asarray(t["right_children"], dtype=np.int32)
+            cond = np.asarray(t["split_conditions"], dtype=np.float32)
+            leaf = lc == -1
+            own = np.arange(len(lc), dtype=np.int32)
+            feature.append(np.where(leaf, 0, t["split_indices"]).astype(np.int32))
+            threshold.append(np.where(leaf, 0, cond).astype(np.float32))
+            value.append(np.where(leaf, cond, 0).astype(np.float32))
+            left.append(np.where(leaf, own, lc) + offset)
+            right.append(np.where(leaf, own, rc) + offset)
+            dleft.append(np.asarray(t["default_left"], dtype=bool))
+            roots.append(offset)
+            depth = max(depth, _tree_depth(lc, rc))
+            offset += len(lc)
+
+        base = float(str(learner["learner_model_param"]["base_score"]).strip("[]"))
+        logistic = objective in _LOGISTIC
+        base_margin = float(np.log(base / (1.0 - base))) if logistic else base
+        return cls(
+            np.concatenate(feature), np.concatenate(threshold),
+            np.concatenate(left).astype(np.int32), np.concatenate(right).astype(np.int32),
+            np.concatenate(dleft), np.concatenate(value), np.asarray(roots, dtype=np.int32),
+            depth, base_margin, logistic, list(learner.get("feature_names") or []),
+        )
+
+    def save(self, path: Path) -> None:
+        np.savez_compressed(
+            path, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+            default_left=self.default_left, value=self.value, roots=self.roots,
+            meta=np.array(json.dumps({"depth": self.depth, "base_margin": self.base_margin,
+                                      "logistic": self.logistic, "feature_names": self.feature_names,
+                                      "source": self.source})),
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "TreeEnsemble":
+        with np.load(path) as z:
+            meta = json.loads(str(z["meta"]))
+            return cls(z["feature"], z["threshold"], z["left"], z["right"], z["default_left"],
+                       z["value"], z["roots"], meta["depth"], meta["base_margin"], meta["logistic"],
+                       meta["feature_names"], meta.get("source"))
+
+    # все деревья за раз: depth шагов по матрице индексов (строки x деревья)
+    def margin(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or (self.n_features and X.shape[1] != self.n_features):
+            raise ValueError(f"expected {self.n_features} features, got shape {X.shape}")
+        out = np.empty(len(X))
+        for s in range(0, len(X), _ROW_CHUNK):
+            xb = np.ascontiguousarray(X[s:s + _ROW_CHUNK])
+            flat = xb.ravel()
+            base = (np.arange(len(xb), dtype=np.intp) * xb.shape[1])[:, None]
+            has_nan = bool(np.isnan(flat).any())
+            idx = np.broadcast_to(self._roots, (len(xb), len(self._roots))).copy()
+            for _ in range(self.depth):
+                x = flat.take(base + self.feature.take(idx))
+                # x < thr -> left (как в xgboost), nan -> по default_left
+                go_right = ~(x < self.threshold.take(idx))
+                if has_nan:
+                    nan = np.isnan(x)
+                    go_right[nan] = ~self.default_left.take(idx[nan])
+                idx = self._children.take(2 * idx + go_right)
+            out[s:s + _ROW_CHUNK] = self.value.take(idx).sum(axis=1, dtype=np.float64)
+        return out + self.base_margin
+
+    # вероятность положительного класса
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        m = self.margin(X)
+        return 1.0 / (1.0 + np.exp(-m)) if self.logistic else m
+
+def _tree_depth(lc: np.ndarray, rc: np.ndarray) -> int:
+    depth, level = 0, [0]
+    while True:
+        level = [c for n in level for c in (lc[n], rc[n]) if c != -1]
+        if not level: return depth
+        depth += 1
+
+# сверка с predict_proba на случайных векторах в диапазоне порогов (с пропусками)
+def check(model, ens: TreeEnsemble, n: int, seed: int = 0) -> float:
+    rng = np.random.default_rng(seed)
+    nf = ens.n_features or int(model.n_features_in_)
+    X = np.empty((n, nf), dtype=np.float32)
+    for j in range(nf):
+        thr = ens.threshold[(ens.feature == j) & (ens.left != np.arange(len(ens.left)))]
+        lo, hi = (thr.min(), thr.max()) if len(thr) else (0.0, 1.0)
+        span = max(hi - lo, 1.0)
+        X[:, j] = rng.uniform(lo - 0.1 * span, hi + 0.1 * span, size=n)
+        # часть значений ровно на порогах, часть — пропуски
+        if len(thr):
+            on = rng.random(n) < 0.2
+            X[on, j] = rng.choice(thr, size=int(on.sum()))
+        X[rng.random(n) < 0.02, j] = np.nan
+    ref = np.asarray(model.predict_proba(X))[:, 1]
+    return float(np.max(np.abs(ref - ens.predict(X))))
+
+# python -m app.trees model/heart/heart.joblib --check 10000
+def main() -> None:
+    import joblib
+    from app.model_loader import _content_version
+    parser = argparse.ArgumentParser(description="экспорт деревьев XGBClassifier в .trees.npz")
+    parser.add_argument("model", type=Path)
+    parser.add_argument("--check", type=int, default=10000, help="число тестовых векторов (0 — без сверки)")
+    parser.add_argument("--tol", type=float, default=1e-6)
+    args = parser.parse_args()
+
+    data = args.model.read_bytes()
+    model = joblib.load(io.BytesIO(data))
+    ens = TreeEnsemble.from_booster(model.get_booster())
+    ens.source = _content_version(data)
+    out = sidecar_path(args.model)
+    ens.save(out)
+    print(f"{out}: {len(ens.roots)} trees, {len(ens.feature)} nodes, depth {ens.depth}")
+    if args.check:
+        diff = check(model, ens, args.check)
+        print(f"max |predict_proba - native| = {diff:.3g} on {args.check} vectors")
+        if diff > args.tol:
+            raise SystemExit(f"mismatch above tolerance {args.tol}")
+
+if __name__ == "__main__":
+    main()
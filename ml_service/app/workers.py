@@ -0,0 +1,166 @@
+from __future__ import annotations
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+log = logging.getLogger("uvicorn.error")
+
+# процесс инференса: получает готовую матрицу, модель берёт из унаследованной памяти или грузит сам
+def _worker_main(inq, outq, preloaded: Dict[Tuple[str, str], object]) -> None:
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    from app.model_loader import LoadedModel
+    models = dict(preloaded)
+    while True:
+        job = inq.get()
+        if job is None:
+            return
+        jid, path, backend, version, X = job
+        try:
+            m = models.get((path, version))
+            if m is None:
+                m = LoadedModel(Path(path), backend)
+                # файл успели подменить — отдаём ошибку, чтобы не посчитать чужой версией
+                if m.version != version:
+                    raise RuntimeError(f"model {path} changed on disk: {m.version} != {version}")
+                models[(path, version)] = m
+            outq.put((jid, m.proba_pos_batch(X), None))
+        except Exception as e:
+            outq.put((jid, None, f"{type(e).__name__}: {e}"))
+
+class _Worker:
+    def __init__(self, ctx, idx: int, outq, preloaded):
+        self.idx = idx
+        self.inq = ctx.Queue()
+        self.proc = ctx.Process(target=_worker_main, args=(self.inq, outq, preloaded), name=f"ml-worker-{idx}", daemon=True)
+        self.proc.start()
+        self.outstanding = 0
+        self.done = 0
+
+# пул пред-форкнутых процессов: API-процесс векторизует, воркеры считают модель
+class WorkerPool:
+    def __init__(self, registry, size: int, queue_depth: int, start_method: str = "fork", timeout: float = 10.0):
+        self.registry = registry
+        self.timeout = timeout
+        self.queue_depth = queue_depth
+        self.rejected = self.timed_out = self.respawned = 0
+        self._ctx = mp.get_context(start_method)
+        # fork: грузим всё до форка, страницы моделей делятся copy-on-write
+        self._preloaded: Dict[Tuple[str, str], object] = {}
+        if start_method == "fork":
+            for h in registry.handles():
+                m = h.get()
+                self._preloaded[(str(h.path), m.version)] = m
+        # замену упавшему воркеру запускает поток-сборщик при живых тредах — fork унёс бы их локи, поэтому spawn;
+        # очередь ответов из spawn-контекста годится и fork-, и spawn-воркерам
+        self._respawn_ctx = mp.get_context("spawn")
+        self._outq = self._respawn_ctx.Queue()
+        self.workers: List[_Worker] = [_Worker(self._ctx, i, self._outq, self._preloaded) for i in range(size)]
+        self._slots = threading.BoundedSemaphore(size * queue_depth)
+        self._pending: Dict[int, Tuple[_Worker, Future]] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._stop = threading.Event()
+        self._collector = threading.Thread(target=self._collect, name="ml-worker-results", daemon=True)
+        self._collector.start()
+
+    # ограниченный диспетчер: нет свободного слота за timeout — queue.Full (в API это 503)
+    def submit(self, m, X: np.ndarray) -> Future:
+        return self._submit(m, X)[1]
+
+    def _submit(self, m, X: np.ndarray) -> Tuple[int, Future]:
+        if not self._slots.acquire(timeout=self.timeout):
+            self.rejected += 1
+            raise queue.Full("worker pool is saturated")
+        fut: Future = Future()
+        with self._lock:
+            w = min(self.workers, key=lambda w: w.outstanding)
+            jid = next(self._ids)
+            w.outstanding += 1
+            self._pending[jid] = (w, fut)
+        w.inq.put((jid, str(m.path), m.backend, m.version, X))
+        return jid, fut
+
+    # воркер не ответил за timeout — задачу забываем (слот освобождается, поздний ответ отбросит _collect),
+    # наружу TimeoutError (в API это 504)
+    def infer(self, m, X: np.ndarray) -> np.ndarray:
+        jid, fut = self._submit(m, X)
+        try:
+            return fut.result(timeout=self.timeout)
+        except FutureTimeout:
+            if self._finish(jid) is not None:
+                self.timed_out += 1
+            raise TimeoutError(f"ml worker did not answer in {self.timeout:g}s")
+
+    def _finish(self, jid: int) -> Optional[Future]:
+        with self._lock:
+            item = self._pending.pop(jid, None)
+            if item is None:
+                return None
+            w, fut = item
+            w.outstanding -= 1
+            w.done += 1
+        self._slots.release()
+        return fut
+
+    # живость воркеров проверяется по таймеру, а не только в тишине: под постоянным потоком ответов
+    # очередь не пустеет, и задачи упавшего воркера иначе висели бы до своего timeout
+    def _collect(self) -> None:
+        next_reap = time.monotonic() + 1.0
+        while not self._stop.is_set():
+            try:
+                jid, p, err = self._outq.get(timeout=1.0)
+            except queue.Empty:
+                jid = None
+            except (EOFError, OSError):
+                return
+            if time.monotonic() >= next_reap:
+                self._reap()
+                next_reap = time.monotonic() + 1.0
+            if jid is None: continue
+            fut = self._finish(jid)
+            if fut is None: continue
+            if err is None: fut.set_result(p)
+            else: fut.set_exception(RuntimeError(err))
+
+    # упавший воркер: его задачи — с ошибкой, процесс — заново через spawn
+    def _reap(self) -> None:
+        for i, w in enumerate(self.workers):
+            if self._stop.is_set() or w.proc.is_alive():
+                continue
+            log.error("ml worker %s died (exit %s), restarting", w.idx, w.proc.exitcode)
+            with self._lock:
+                lost = [jid for jid, (ww, _) in self._pending.items() if ww is w]
+            for jid in lost:
+                fut = self._finish(jid)
+                if fut is not None: fut.set_exception(RuntimeError(f"ml worker {w.idx} died"))
+            self.workers[i] = _Worker(self._respawn_ctx, w.idx, self._outq, {})
+            self.respawned += 1
+
+    def stop(self) -> None:
+        self._stop.set()
+        for w in self.workers: w.inq.put(None)
+        for w in self.workers: w.proc.join(timeout=5)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "size": len(self.workers),
+                "queue_depth_limit": self.queue_depth,
+                "in_flight": len(self._pending),
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "respawned": self.respawned,
+                "workers": [
+                    {"pid": w.proc.pid, "alive": w.proc.is_alive(), "queue_depth": w.outstanding, "done": w.done}
+                    for w in self.workers
+                ],
+            }
@@ -0,0 +1,49 @@
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+class Settings(BaseSettings):
+    APP_NAME: str = "health-risk-ml"
+
+    # пакетный скоринг: максимум строк в одном запросе /predict_batch
+    PREDICT_BATCH_MAX: int = 50_000
+    # старый путь vectorize -> pandas.DataFrame вместо скомпилированной схемы (A/B)
+    VECTORIZE_LEGACY: bool = False
+    # sklearn — predict_proba/xgboost; native — свой обход деревьев из <model>.trees.npz (python -m app.trees)
+    MODEL_BACKEND: str = "sklearn"
+
+    # ленивые модели: выгрузка после простоя и по бюджету памяти (0 — без ограничений)
+    MODEL_IDLE_EVICT_SEC: float = 0.0
+    MODEL_MEMORY_BUDGET_MB: int = 0
+    # опрос model/<analysis>/ на новые и изменённые файлы (0 — только POST /admin/reload)
+    MODEL_WATCH_INTERVAL_SEC: float = 5.0
+
+    # пул процессов инференса (0 — считать в API-процессе); fork делит память моделей copy-on-write
+    WORKER_POOL_SIZE: int = 0
+    WORKER_QUEUE_DEPTH: int = 4
+    WORKER_START_METHOD: str = "fork"
+    WORKER_TIMEOUT_SEC: float = 10.0
+
+    # кэш предсказаний (LRU + TTL); 0 — выключен
+    PREDICT_CACHE_SIZE: int = 100_000
+    PREDICT_CACHE_TTL_SEC: float = 600.0
+
+    # микро-батчинг /predict (опционально): окно, размер пакета, глубина очереди на пару analysis/model
+    MICROBATCH_ENABLED: bool = False
+    MICROBATCH_WINDOW_MS: float = 2.0
+    MICROBATCH_MAX_BATCH: int = 64
+    MICROBATCH_MAX_QUEUE: int = 2048
+
+    # допуск запросов: «путь=одновременно:ждущих» через запятую (пусто — без лимитов), ожидание слота,
+    # Retry-After в ответе 503; дедлайн вызывающего приходит в X-Deadline-Ms
+    ADMISSION_LIMITS: str = "/predict=64:256,/predict_batch=4:8"
+    ADMISSION_QUEUE_TIMEOUT_MS: float = 500.0
+    ADMISSION_RETRY_AFTER_SEC: float = 1.0
+
+    # журнал медленных запросов: порог в мс (0 — выключен, без накладных расходов) и размер кольцевого буфера
+    SLOW_REQUEST_MS: float = 0.0
+    SLOW_REQUEST_BUFFER: int = 200
+    # POST /admin/profile: потолок длительности сэмплирования
+    PROFILE_MAX_SEC: float = 60.0
+
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
+
+settings = Settings()
@@ -1,13 +1,78 @@
 from __future__ import annotations
+import argparse
+import asyncio
+import os
+import queue
+import time
 from contextlib import asynccontextmanager
 import uvicorn
 
-from typing import Any, Dict, Optional
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from app.model_loader import Registry
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from app.admission import Admission, AdmissionMiddleware, DeadlineExceeded, check_deadline, parse_limits
+from app.batching import Batchers
+from app.metrics import REQUEST_T0, Metrics, MetricsMiddleware
+from app.model_loader import Registry, bucket, missing_detail
+from app.profiling import ProfilerBusy, SlowLog, SlowRequestMiddleware, sample
+from app.workers import WorkerPool
+from config import settings
 
 registry: Registry | None = None
+batchers: Batchers | None = None
+pool: WorkerPool | None = None
+
+metrics = Metrics("ml_")
+metrics.describe("stage_seconds", "Stage latency: parse_validate, vectorize, infer")
+metrics.describe("request_seconds", "HTTP request latency by path")
+metrics.describe("requests_total", "HTTP requests by path and status")
+metrics.describe("errors_total", "Rejected predictions by type")
+metrics.describe("in_flight", "Requests in progress by path")
+
+def _collect():
+    if registry is None:
+        return []
+    c = registry.cache.stats()
+    rows = [
+        ("cache_hits_total", "counter", {}, c["hits"]),
+        ("cache_misses_total", "counter", {}, c["misses"]),
+        ("cache_size", "gauge", {}, c["size"]),
+        ("model_reloads_total", "counter", {}, registry.reloads),
+        ("model_evictions_total", "counter", {}, registry.evictions),
+    ]
+    if batchers is not None:
+        rows += [("microbatch_queue_depth", "gauge", {"key": k}, b.depth()) for k, b in batchers.snapshot()]
+    if pool is not None:
+        rows.append(("worker_pool_in_flight", "gauge", {}, pool.stats()["in_flight"]))
+    return rows
+
+metrics.collectors.append(_collect)
+
+admission = Admission(
+    parse_limits(settings.ADMISSION_LIMITS),
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_MS / 1000.0,
+    retry_after=settings.ADMISSION_RETRY_AFTER_SEC,
+    metrics=metrics,
+)
+RETRY_AFTER = {"Retry-After": str(max(1, round(settings.ADMISSION_RETRY_AFTER_SEC)))}
+
+slowlog = SlowLog(settings.SLOW_REQUEST_MS, settings.SLOW_REQUEST_BUFFER, metrics)
+
+# стадия «разбор тела + pydantic-валидация»: от входа в ASGI (или допуска admission) до входа в обработчик
+def _parse_validate(analysis: str, model: str, t_handler: float) -> None:
+    t0 = REQUEST_T0.get()
+    if t0:
+        metrics.stage("parse_validate", analysis, model, t_handler - t0)
+
+def _error(kind: str) -> None:
+    metrics.inc("errors_total", (("type", kind),))
+
+# в пуле потоков запрос мог простоять в очереди: если вызывающий уже не ждёт ответа — не считаем
+def _guarded(fn, *args):
+    check_deadline()
+    return fn(*args)
 
 class PredictIn(BaseModel):
     analysis_type: str                 # heart или diabetes
@@ -17,24 +82,70 @@ class PredictIn(BaseModel):
 class PredictOut(BaseModel):
     analysis_type: str
     model: str
+    model_version: Optional[str] = None  # хэш содержимого файла модели
     risk: float
     risk_category: str
     recommendation: Optional[str] = None
 
-def bucket(p: float) -> str:
-    if p < 0.33: return "low"
-    if p < 0.66: return "medium"
-    return "high"
+class PredictBatchIn(BaseModel):
+    analysis_type: str
+    items: List[Dict[str, Any]] = Field(max_length=settings.PREDICT_BATCH_MAX)
+    model: Optional[str] = None
+
+class PredictBatchItem(BaseModel):
+    risk: Optional[float] = None
+    risk_category: Optional[str] = None
+    recommendation: Optional[str] = None
+    error: Optional[str] = None         # ошибка конкретной строки, остальные считаются
+
+class PredictBatchOut(BaseModel):
+    analysis_type: str
+    model: str
+    model_version: Optional[str] = None
+    results: List[PredictBatchItem]
+
+RECOMMENDATIONS = {
+    "low": "Низкий риск. Поддерживайте ЗОЖ.",
+    "medium": "Умеренный риск. Рекомендуется контроль.",
+    "high": "Высокий риск! Желательна очная консультация.",
+}
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global registry
-    registry = Registry()
+    global registry, batchers, pool
+    registry = Registry(
+        legacy=settings.VECTORIZE_LEGACY, backend=settings.MODEL_BACKEND,
+        cache_size=settings.PREDICT_CACHE_SIZE, cache_ttl=settings.PREDICT_CACHE_TTL_SEC,
+        idle_evict_sec=settings.MODEL_IDLE_EVICT_SEC, memory_budget_bytes=settings.MODEL_MEMORY_BUDGET_MB * 1024 * 1024,
+        metrics=metrics,
+    )
+    # воркеры форкаются до запуска фоновых потоков
+    if settings.WORKER_POOL_SIZE > 0:
+        pool = registry.pool = WorkerPool(
+            registry, settings.WORKER_POOL_SIZE, settings.WORKER_QUEUE_DEPTH,
+            settings.WORKER_START_METHOD, settings.WORKER_TIMEOUT_SEC,
+        )
+    registry.start_janitor()
+    registry.start_watcher(settings.MODEL_WATCH_INTERVAL_SEC)
+    if settings.MICROBATCH_ENABLED:
+        batchers = Batchers(
+            registry, settings.MICROBATCH_WINDOW_MS, settings.MICROBATCH_MAX_BATCH, settings.MICROBATCH_MAX_QUEUE,
+            concurrency=max(1, settings.WORKER_POOL_SIZE),
+        )
     print("Приложение запускается...")
     yield
+    if batchers is not None:
+        batchers.stop()
+    if pool is not None:
+        pool.stop()
+    registry.stop()
     print("Приложение останавливается...")
 
 app = FastAPI(title="Unified ML (heart + diabetes)", lifespan=lifespan)
+app.add_middleware(AdmissionMiddleware, admission=admission)
+app.add_middleware(MetricsMiddleware, metrics=metrics,
+                   paths=("/predict", "/predict_batch", "/health", "/metrics", "/admin/reload"))
+app.add_middleware(SlowRequestMiddleware, slowlog=slowlog)
 
 
 @app.get("/health")
@@ -42,26 +153,117 @@ def health():
     return {
         "status":"ok",
         "models": registry.available(),
-        "defaults": {k: registry.default_for(k) for k in ("heart","diabetes")}
+        "models_state": registry.status(),
+        "model_evictions": registry.evictions,
+        "model_reloads": registry.reloads,
+        "defaults": {k: registry.default_for(k) for k in ("heart","diabetes")},
+        "cache": registry.cache.stats(),
+        "microbatch": batchers.stats() if batchers is not None else None,
+        "worker_pool": pool.stats() if pool is not None else None,
+        "admission": admission.stats(),
+        "slow_requests": slowlog.stats(),
     }
 
 @app.post("/predict", response_model=PredictOut)
-def predict(body: PredictIn):
+async def predict(body: PredictIn):
+    t_handler = time.perf_counter()
     analysis = body.analysis_type.lower().strip()
     try:
-        prob, used, missing = registry.predict(analysis, body.model, body.features)
+        if batchers is not None:
+            fut = batchers.get(analysis, registry.resolve(analysis, body.model)).submit(body.features)
+            prob, used, version, missing = await asyncio.wrap_future(fut)
+        else:
+            prob, used, version, missing = await run_in_threadpool(
+                _guarded, registry.predict, analysis, body.model, body.features)
     except KeyError as e:
+        _error("unknown_model")
         raise HTTPException(400, str(e))
+    except queue.Full:
+        _error("overloaded")
+        raise HTTPException(503, "сервис перегружен, повторите позже", headers=RETRY_AFTER)
+    except DeadlineExceeded as e:
+        _error("deadline")
+        raise HTTPException(504, str(e))
+    except TimeoutError as e:
+        _error("worker_timeout")
+        raise HTTPException(504, str(e))
+    _parse_validate(analysis, used, t_handler)
     if missing:
-        raise HTTPException(400, f"Отсутствуют признаки: {', '.join(missing)}")
+        _error("missing_features")
+        raise HTTPException(400, missing_detail(missing))
 
     cat = bucket(prob)
-    rec = ("Низкий риск. Поддерживайте ЗОЖ."
-           if cat=="low" else
-           "Умеренный риск. Рекомендуется контроль."
-           if cat=="medium" else
-           "Высокий риск! Желательна очная консультация.")
-    return PredictOut(analysis_type=analysis, model=used, risk=prob, risk_category=cat, recommendation=rec)
+    return PredictOut(analysis_type=analysis, model=used, model_version=version, risk=prob, risk_category=cat,
+                      recommendation=RECOMMENDATIONS[cat])
+
+# пакетное предсказание: один вызов модели на весь пакет, плохие строки не валят остальные
+@app.post("/predict_batch", response_model=PredictBatchOut)
+def predict_batch(body: PredictBatchIn):
+    t_handler = time.perf_counter()
+    analysis = body.analysis_type.lower().strip()
+    try:
+        check_deadline()
+        probs, used, version, missing = registry.predict_batch(analysis, body.model, body.items)
+    except KeyError as e:
+        _error("unknown_model")
+        raise HTTPException(400, str(e))
+    except queue.Full:
+        _error("overloaded")
+        raise HTTPException(503, "сервис перегружен, повторите позже", headers=RETRY_AFTER)
+    except DeadlineExceeded as e:
+        _error("deadline")
+        raise HTTPException(504, str(e))
+    except TimeoutError as e:
+        _error("worker_timeout")
+        raise HTTPException(504, str(e))
+    _parse_validate(analysis, used, t_handler)
+
+    results: List[PredictBatchItem] = []
+    for prob, miss in zip(probs, missing):
+        if miss:
+            _error("missing_features")
+            results.append(PredictBatchItem(error=missing_detail(miss)))
+            continue
+        cat = bucket(prob)
+        results.append(PredictBatchItem(risk=prob, risk_category=cat, recommendation=RECOMMENDATIONS[cat]))
+    return PredictBatchOut(analysis_type=analysis, model=used, model_version=version, results=results)
+
+# Prometheus: стадии по analysis_type/model, запросы, ошибки по типам, in-flight
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# ручная перезагрузка моделей из папки model/ без рестарта
+@app.post("/admin/reload")
+def admin_reload():
+    return {"status": "ok", **registry.reload(), "models": registry.status()}
+
+# сэмплирующий профайлер на seconds секунд: collapsed stacks всех потоков API-процесса
+# (воркеры пула не видны) — на вход flamegraph.pl или speedscope
+@app.post("/admin/profile", response_class=PlainTextResponse)
+async def admin_profile(seconds: float = Query(10.0, gt=0), interval_ms: float = Query(5.0, ge=1.0)):
+    try:
+        text = await run_in_threadpool(sample, min(seconds, settings.PROFILE_MAX_SEC), interval_ms / 1000.0)
+    except ProfilerBusy as e:
+        raise HTTPException(409, str(e))
+    return PlainTextResponse(text)
+
+# медленные запросы: стадии и очищенная копия тела (без user_id и значений признаков), новые первыми
+@app.get("/admin/slow")
+def admin_slow(limit: int = Query(50, ge=1, le=1000), path: Optional[str] = None):
+    return {**slowlog.stats(), "entries": slowlog.query(limit, path)}
+
+# порог журнала на лету; 0 — выключить
+@app.post("/admin/slow")
+def admin_slow_threshold(threshold_ms: float = Query(..., ge=0)):
+    slowlog.set_threshold(threshold_ms)
+    return slowlog.stats()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--legacy", action="store_true", help="старый путь vectorize через DataFrame")
+    args = parser.parse_args()
+    if args.legacy:
+        # через окружение, чтобы флаг дожил до процесса, который поднимает reload
+        os.environ["VECTORIZE_LEGACY"] = "1"
     uvicorn.run("main:app", host="127.0.0.1", port=8001, reload=True)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# тесты запускаются как сервис: из каталога ml_service (import app...)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,131 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from app.model_loader import FEATURES, RULES, FeatureSchema, Registry, vectorize
+
+N = 2000
+
+SAMPLES = {
+    "heart": {"age": 54, "height": 170, "weight": 82, "ap_hi": 135, "ap_lo": 85,
+              "cholesterol": 2, "gluc": 1, "smoke": 0, "alco": 0, "active": 1, "gender": 1},
+    "diabetes": {"Age": 50, "Gender": 1, "BMI": 27.5, "Chol": 5.2, "TG": 1.8,
+                 "HDL": 1.1, "LDL": 3.2, "Cr": 80, "BUN": 5.0},
+}
+
+# одно значение признака во всех видах, что приходят в API: числа за границами, «ничьи» округления,
+# запятая вместо точки, bool, строки, None/NaN, мусор и отсутствующий ключ (None в ответе — ключа нет)
+def _value(rng: random.Random, rule):
+    lo = rule.lo if math.isfinite(rule.lo) else -50.0
+    hi = rule.hi if math.isfinite(rule.hi) else 300.0
+    x = rng.uniform(lo - 0.3 * (hi - lo + 1), hi + 0.3 * (hi - lo + 1))
+    kind = rng.random()
+    if kind < 0.35: return x
+    if kind < 0.45: return int(x)
+    if kind < 0.55: return rng.choice([0.5, 1.5, 2.5, 3.5, -0.5])   # ничьи округления и порог бинаризации
+    if kind < 0.62: return f"{x:.3f}".replace(".", ",")
+    if kind < 0.67: return f" {x:.2f} "
+    if kind < 0.72: return rng.choice([True, False])
+    if kind < 0.76: return str(int(x))
+    if kind < 0.80: return float("nan")
+    if kind < 0.84: return None
+    if kind < 0.87: return rng.choice(["abc", "", "1,2,3"])
+    if kind < 0.90: return ...
+    return x
+
+def _rows(analysis: str, seed: int):
+    rng = random.Random(seed)
+    rules = RULES.get(analysis, {})
+    rows = []
+    for _ in range(N):
+        row = {}
+        for k in FEATURES[analysis]:
+            v = _value(rng, rules.get(k) or RULES["heart"]["age"])
+            if v is not ...:
+                row[k] = v
+        # пара ap_lo / ap_hi: часть строк с ap_lo выше ap_hi и на границе ap_hi - 1
+        if analysis == "heart" and rng.random() < 0.3 and isinstance(row.get("ap_hi"), float):
+            row["ap_lo"] = row["ap_hi"] - rng.choice([0.0, 0.5, 1.0, -10.0])
+        rows.append(row)
+    return rows
+
+def _legacy(analysis: str, features):
+    try:
+        X, missing = vectorize(analysis, features)
+    except ValueError:
+        # round(nan) в старом пути падает — сравнивать не с чем
+        return None, None
+    return (X.to_numpy(np.float32) if not missing else None), missing
+
+@pytest.mark.parametrize("analysis", sorted(FEATURES))
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_row_matches_vectorize(analysis, seed):
+    schema = FeatureSchema(analysis)
+    compared = 0
+    for features in _rows(analysis, seed):
+        got, missing = schema.row(features)
+        want, want_missing = _legacy(analysis, features)
+        if want_missing is None:
+            continue
+        assert missing == want_missing, features
+        if not missing:
+            np.testing.assert_array_equal(got, want, err_msg=repr(features))
+            compared += 1
+    assert compared > N // 20
+
+@pytest.mark.parametrize("analysis", sorted(FEATURES))
+def test_batch_matches_row(analysis):
+    schema = FeatureSchema(analysis)
+    rows = _rows(analysis, 7)
+    X, missing = schema.batch(rows)
+    want = []
+    for features, miss in zip(rows, missing):
+        got, want_missing = schema.row(features)
+        assert miss == want_missing, features
+        if not miss:
+            want.append(got[0].copy())
+    assert X.dtype == np.float32
+    np.testing.assert_array_equal(X, np.array(want, dtype=np.float32).reshape(len(want), len(schema.names)))
+
+def test_nan_in_rounded_feature_passes_through():
+    features = {k: 1.0 for k in FEATURES["heart"]}
+    features.update(ap_hi=120, ap_lo=80, cholesterol=float("nan"))
+    got, missing = FeatureSchema("heart").row(features)
+    assert missing == []
+    assert np.isnan(got[0, FeatureSchema("heart").names.index("cholesterol")])
+
+# колонки схемы — ровно те, на которых обучена каждая поставляемая модель
+@pytest.mark.parametrize("analysis", sorted(FEATURES))
+def test_schema_matches_shipped_models(analysis):
+    reg = Registry()
+    schema = reg.schemas[analysis]
+    assert reg.available()[analysis]
+    for name in reg.available()[analysis]:
+        model = reg.items[analysis][name].get().model
+        names = getattr(model, "feature_names_in_", None)
+        if names is not None:
+            assert schema.names == list(names), name
+        assert len(schema.names) == model.n_features_in_, name
+
+# реальный запрос через Registry: от словаря признаков до вероятности
+@pytest.mark.parametrize("legacy", [False, True])
+@pytest.mark.parametrize("analysis", sorted(FEATURES))
+def test_registry_predict_smoke(analysis, legacy):
+    reg = Registry(legacy=legacy)
+    features = SAMPLES[analysis]
+    prob, name, version, missing = reg.predict(analysis, None, features)
+    assert missing == [] and version
+    assert 0.0 <= prob <= 1.0
+    probs, _, _, batch_missing = reg.predict_batch(analysis, name, [features, {}])
+    assert probs[0] == pytest.approx(prob, abs=1e-6) and probs[1] == -1.0 and batch_missing[1]
+
+def test_heart_gender_is_optional():
+    reg = Registry()
+    without = {k: v for k, v in SAMPLES["heart"].items() if k != "gender"}
+    p_none, _, _, missing = reg.predict("heart", None, without)
+    assert missing == [] and 0.0 <= p_none <= 1.0
+    p_f = reg.predict("heart", None, {**without, "gender": 0})[0]
+    p_m = reg.predict("heart", None, {**without, "gender": 1})[0]
+    assert p_f != p_m
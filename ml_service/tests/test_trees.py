@@ -0,0 +1,66 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from app.model_loader import LoadedModel, WrappedModel
+from app.trees import TreeEnsemble, check, sidecar_path
+
+HEART = Path(__file__).resolve().parents[1] / "model" / "heart" / "heart.joblib"
+TOL = 1e-6
+
+@pytest.fixture(scope="module")
+def xgb_model():
+    pytest.importorskip("xgboost")
+    import joblib
+    return joblib.load(HEART)
+
+# та же сверка, что при экспорте (python -m app.trees --check): пороги, значения ровно на порогах, NaN
+def test_exported_trees_match_predict_proba(xgb_model):
+    ens = TreeEnsemble.from_booster(xgb_model.get_booster())
+    assert check(xgb_model, ens, 20000, seed=1) <= TOL
+
+def test_shipped_sidecar_matches_predict_proba(xgb_model):
+    ens = TreeEnsemble.load(sidecar_path(HEART))
+    assert check(xgb_model, ens, 20000, seed=2) <= TOL
+
+@pytest.fixture
+def model_dir(tmp_path):
+    path = tmp_path / HEART.name
+    shutil.copy(HEART, path)
+    shutil.copy(sidecar_path(HEART), sidecar_path(path))
+    return path
+
+def test_sidecar_records_its_source(model_dir):
+    m = LoadedModel(model_dir, "native")
+    assert m.native is not None and m.model is None
+
+def test_stale_sidecar_fails_loudly(model_dir):
+    with model_dir.open("ab") as f:
+        f.write(b"\0")
+    with pytest.raises(RuntimeError, match="stale"):
+        LoadedModel(model_dir, "native")
+
+# watcher сравнивает fingerprint: замена одного joblib (без нового .trees.npz) тоже должна его сменить
+def test_fingerprint_covers_joblib_and_sidecar(model_dir):
+    before = WrappedModel(model_dir, "native").fingerprint
+    with model_dir.open("ab") as f:
+        f.write(b"\0")
+    assert WrappedModel(model_dir, "native").fingerprint != before
+
+# реальный запрос через native: схема подаёт ровно те колонки, что ждут деревья, и ответ совпадает со sklearn
+def test_registry_predict_native_matches_sklearn():
+    from app.model_loader import Registry
+    features = {"age": 61, "height": 165, "weight": 90, "ap_hi": 150, "ap_lo": 95, "cholesterol": 3,
+                "gluc": 1, "smoke": 0, "alco": 0, "active": 0, "gender": 0}
+    native = Registry(backend="native")
+    prob, name, version, missing = native.predict("heart", None, features)
+    assert missing == [] and 0.0 <= prob <= 1.0
+    assert native.items["heart"][name].get().native is not None
+    assert prob == pytest.approx(Registry().predict("heart", None, features)[0], abs=TOL)
+
+def test_column_mismatch_fails_at_load():
+    h = WrappedModel(HEART, "native", columns=["age", "height"])
+    with pytest.raises(RuntimeError, match="expects 12 features"):
+        h.get()
+    assert not h.loaded